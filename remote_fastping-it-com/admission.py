@@ -0,0 +1,211 @@
+"""
+Adaptive Admission Control
+==========================
+
+Per-worker load shedding for the request gates
+- Tracks in-flight requests and an EWMA of admitted-request latency
+- Concurrency limit adapts AIMD-style: shrinks multiplicatively while latency is
+  over target, grows additively while it's under and the limit is actually in use
+- acquire() runs before any Redis / SQLite work; over the limit the request gets a
+  cheap 503 with Retry-After
+- Time spent queued ahead of the app (X-Request-Start, from the front proxy or the
+  gthread stamp below) counts as load: waits over the target back the limit off, and
+  a request that waited past max_queue_wait is shed outright. Clients can send the
+  header too, so the front proxy must overwrite it (nginx: X-Request-Start "t=${msec}")
+- size_for(threads) fits the limits to the worker's real concurrency; under gthread
+  at most `threads` requests are ever in flight, so a larger limit could never shed
+- Once the plan is known, allows(plan) sheds lower tiers first: each plan may only
+  use its share of the limit
+- Shed counts and the current limit in stats() and Prometheus
+"""
+
+import math
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from flask import Response
+
+from metrics import ADMISSION_LIMIT, LOAD_SHED
+
+# Fraction of the concurrency limit each plan may fill; basic sheds first
+PLAN_SHARES = {'basic': 0.7, 'premium': 0.85, 'enterprise': 1.0}
+EWMA_SMOOTHING = 0.2  # Weight of each new latency sample
+BACKOFF_FACTOR = 0.9  # Limit multiplier per decrease
+RETRY_AFTER_SECONDS = 1
+# Requests shed before their plan is known
+UNIDENTIFIED = 'unidentified'
+
+OVERLOADED_BODY = b'{"error":"Service overloaded","message":"Too many requests in flight, retry shortly"}'
+
+def overloaded_response(retry_after: int = RETRY_AFTER_SECONDS) -> Response:
+    return Response(OVERLOADED_BODY, status=503, content_type='application/json',
+                    headers={'Retry-After': str(retry_after)})
+
+def queue_wait_seconds(request_start: Optional[str], now: Optional[float] = None) -> float:
+    """Seconds since an X-Request-Start stamp: nginx's "t=<epoch seconds>", or bare epoch
+    seconds, milliseconds or microseconds. Missing, malformed or future stamps count as 0."""
+    if not request_start:
+        return 0.0
+    value = request_start.strip()
+    if value.startswith('t='):
+        value = value[2:]
+    try:
+        stamp = float(value)
+    except ValueError:
+        return 0.0
+    if not math.isfinite(stamp) or stamp <= 0:
+        return 0.0
+    # Millisecond and microsecond epochs are three and six digits longer
+    while stamp > 1e11:
+        stamp /= 1000.0
+    if now is None:
+        now = time.time()
+    return max(0.0, now - stamp)
+
+def stamp_gthread_queue(worker):
+    """Have a gunicorn gthread worker stamp X-Request-Start as a request joins its thread pool
+
+    Requests beyond the thread count wait in that queue without being in flight, so
+    without the stamp admission control never sees them. A proxy's stamp is kept.
+    """
+    enqueue_req, handle_request = worker.enqueue_req, worker.handle_request
+
+    def stamped_enqueue(conn):
+        conn.enqueued_at = time.time()
+        enqueue_req(conn)
+
+    def stamped_handle(req, conn):
+        enqueued_at = getattr(conn, 'enqueued_at', None)
+        # gunicorn keeps header names upper-cased
+        if enqueued_at is not None and all(name != 'X-REQUEST-START' for name, _ in req.headers):
+            req.headers.append(('X-REQUEST-START', f't={enqueued_at:.6f}'))
+        return handle_request(req, conn)
+
+    worker.enqueue_req = stamped_enqueue
+    worker.handle_request = stamped_handle
+
+class AdmissionController:
+    def __init__(self, name: str, initial_limit: int = 64, min_limit: int = 8,
+                 max_limit: int = 1024, target_latency_ms: float = 50.0,
+                 max_queue_wait_ms: float = 1000.0,
+                 plan_shares: Optional[Dict[str, float]] = None):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency_ms / 1000.0
+        self.max_queue_wait = max_queue_wait_ms / 1000.0
+        self.plan_shares = dict(plan_shares or PLAN_SHARES)
+        self._default_share = min(self.plan_shares.values())
+
+        self._lock = threading.Lock()
+        self.limit = float(initial_limit)
+        self.in_flight = 0
+        self.latency_ewma = 0.0
+        self.queue_wait_ewma = 0.0
+        self._last_decrease = 0.0
+        self.admitted = 0
+        self.queue_timeouts = 0
+        self.shed = {plan: 0 for plan in [UNIDENTIFIED] + list(self.plan_shares)}
+
+        self._shed_counters = {plan: LOAD_SHED.labels(name, plan) for plan in self.shed}
+        self._limit_gauge = ADMISSION_LIMIT.labels(name)
+        self._limit_gauge.set(self.limit)
+
+    def _count_shed(self, plan: str):
+        if plan not in self.shed:
+            self.shed[plan] = 0
+            self._shed_counters[plan] = LOAD_SHED.labels(self.name, plan)
+        self.shed[plan] += 1
+        self._shed_counters[plan].inc()
+
+    def size_for(self, concurrency: int):
+        """Fit the limits to a worker that runs at most `concurrency` requests at once"""
+        with self._lock:
+            self.max_limit = max(1, concurrency)
+            # Starts out shedding nothing; queueing backs it off as far as a quarter of the threads
+            self.min_limit = max(1, concurrency // 4)
+            self.limit = float(self.max_limit)
+            self._limit_gauge.set(self.limit)
+
+    def _back_off(self, interval: float):
+        # Under self._lock. At most one decrease per `interval` (an observed round
+        # trip), so one burst of slow samples doesn't collapse the limit
+        now = time.monotonic()
+        if now - self._last_decrease >= interval:
+            self.limit = max(self.min_limit, self.limit * BACKOFF_FACTOR)
+            self._last_decrease = now
+            self._limit_gauge.set(self.limit)
+
+    def acquire(self, queue_wait: float = 0.0) -> bool:
+        """Take an in-flight slot, or refuse if the worker is at its limit or the
+        request already waited `queue_wait` seconds past max_queue_wait"""
+        with self._lock:
+            if queue_wait:
+                if self.queue_wait_ewma:
+                    self.queue_wait_ewma += EWMA_SMOOTHING * (queue_wait - self.queue_wait_ewma)
+                else:
+                    self.queue_wait_ewma = queue_wait
+                if queue_wait > self.target_latency:
+                    self._back_off(queue_wait)
+                if queue_wait > self.max_queue_wait:
+                    self.queue_timeouts += 1
+                    self._count_shed(UNIDENTIFIED)
+                    return False
+            if self.in_flight >= self.limit:
+                self._count_shed(UNIDENTIFIED)
+                return False
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+
+    def allows(self, plan: str) -> bool:
+        """Whether an admitted request of this plan fits its plan's share of the limit"""
+        share = self.plan_shares.get(plan, self._default_share)
+        if self.in_flight <= self.limit * share:
+            return True
+        with self._lock:
+            self._count_shed(plan)
+        return False
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def observe(self, latency_seconds: float):
+        """Feed the latency of a served request and adapt the limit"""
+        with self._lock:
+            if self.latency_ewma:
+                self.latency_ewma += EWMA_SMOOTHING * (latency_seconds - self.latency_ewma)
+            else:
+                self.latency_ewma = latency_seconds
+
+            if self.latency_ewma > self.target_latency:
+                self._back_off(self.latency_ewma)
+            elif self.in_flight * 2 >= self.limit and self.limit < self.max_limit:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+                self._limit_gauge.set(self.limit)
+
+    def after_fork(self, concurrency: Optional[int] = None):
+        """Fresh lock and counters in a forked worker; limits are per process, sized
+        for `concurrency` (the worker's thread count) when given"""
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        if concurrency is not None:
+            self.size_for(concurrency)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'limit': round(self.limit, 1),
+            'in_flight': self.in_flight,
+            'latency_ewma_ms': round(self.latency_ewma * 1000, 3),
+            'target_latency_ms': self.target_latency * 1000,
+            'queue_wait_ewma_ms': round(self.queue_wait_ewma * 1000, 3),
+            'max_queue_wait_ms': self.max_queue_wait * 1000,
+            'queue_timeouts': self.queue_timeouts,
+            'min_limit': self.min_limit,
+            'max_limit': self.max_limit,
+            'admitted': self.admitted,
+            'shed': dict(self.shed),
+            'plan_shares': self.plan_shares
+        }
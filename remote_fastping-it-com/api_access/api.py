@@ -10,28 +10,107 @@ Provides programmatic access to your proxy service with:
 - Real-time monitoring
 """
 
-from flask import Flask, request, jsonify, g
+from flask import Flask, request, jsonify, g, Response
 from functools import wraps
 import time
 import hashlib
 import hmac
+import ipaddress
 import json
+import math
 import sqlite3
 import uuid
 from datetime import datetime, timedelta
-import requests
+import redis
+import threading
 from typing import Dict, Optional, Tuple
 import logging
 
+from admission import AdmissionController, overloaded_response, queue_wait_seconds
+from api_key_cache import APIKeyCache, MISS, key_digest
+from compression import choose_encoding, install_compression, stream_compressed
+from endpoint_policy import PolicyTable, plan_level
+from upstream_client import UpstreamClient
+from rate_limiter import DAY, LocalDualWindowLimiter, RedisDualWindowLimiter
+from usage_counters import WriteBehindCounters
+from metrics import REQUEST_LATENCY, RATE_LIMIT_REJECTIONS, AUTH_REJECTIONS, install_metrics_endpoint
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+REDIS_HOST = 'localhost'
+REDIS_PORT = 6379
+REDIS_DB = 0
+PROXY_STREAM_CHUNK_BYTES = 64 * 1024  # Upstream read size in raw/stream proxy mode
+API_KEY_CACHE_TTL_SECONDS = 30  # Longest a revoked key can keep working if a notification is lost
+API_KEY_CACHE_MAX_ENTRIES = 50000
+API_KEY_CHANNEL = 'api_keys:invalidate'  # Redis pub/sub channel for key/customer/policy changes
+POLICY_REFRESH_SECONDS = 60  # Safety-net reload of the endpoint policy table
+# Proxied calls wait on upstream hosts, so the latency target is far looser than the ping app's
+API_ADMISSION_TARGET_LATENCY_MS = 1000
+API_ADMISSION_MAX_QUEUE_WAIT_MS = 2000  # Requests queued longer than this are shed on arrival
+KEY_USAGE_FLUSH_INTERVAL_MS = 2000  # api_keys.total_requests / last_used_at lag by at most this much
+UPSTREAM_POOL_MAXSIZE = 20  # Keep-alive connections per upstream origin
+UPSTREAM_CONNECT_TIMEOUT_SECONDS = 5
+UPSTREAM_READ_TIMEOUT_SECONDS = 30
+BATCH_READ_TIMEOUT_SECONDS = 10
+UPSTREAM_IDLE_SECONDS = 60  # Pools unused this long are closed
+UPSTREAM_MAX_HOSTS = 256
+
+# Additive, so every worker's deltas land; last_used_at only moves forward
+KEY_USAGE_UPDATE_SQL = '''
+    UPDATE api_keys SET total_requests = total_requests + ?,
+    last_used_at = MAX(COALESCE(last_used_at, ''), ?)
+    WHERE api_key = ?
+'''
+
+# Shared Redis for cross-worker cache invalidation; optional
+try:
+    redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=True)
+    redis_client.ping()
+    REDIS_AVAILABLE = True
+except Exception:
+    REDIS_AVAILABLE = False
+    logger.warning("Redis not available - API key cache invalidation stays local to this worker")
+
+# Per-worker load shedding for API-key endpoints
+api_admission = AdmissionController('api', target_latency_ms=API_ADMISSION_TARGET_LATENCY_MS,
+                                    max_queue_wait_ms=API_ADMISSION_MAX_QUEUE_WAIT_MS)
+
+# Keep-alive pools for /api/v1/proxy and /api/v1/batch upstream calls
+upstream_client = UpstreamClient(pool_maxsize=UPSTREAM_POOL_MAXSIZE,
+                                 connect_timeout=UPSTREAM_CONNECT_TIMEOUT_SECONDS,
+                                 read_timeout=UPSTREAM_READ_TIMEOUT_SECONDS,
+                                 idle_seconds=UPSTREAM_IDLE_SECONDS,
+                                 max_hosts=UPSTREAM_MAX_HOSTS, name='api-upstream')
+
+def upstream_request(method: str, url: str, **kwargs):
+    """upstream_client.request, with the wait added to g.upstream_seconds
+    
+    Admission control adapts on local handler time only; a slow upstream host
+    says nothing about how loaded this worker is.
+    """
+    started = time.time()
+    try:
+        return upstream_client.request(method, url, **kwargs)
+    finally:
+        g.upstream_seconds = g.get('upstream_seconds', 0.0) + time.time() - started
+
 class APIManager:
     def __init__(self, whitelist_manager, customer_manager):
         self.whitelist_manager = whitelist_manager
         self.customer_manager = customer_manager
         self.init_api_database()
+        self.policies = PolicyTable()
+        self.reload_policies(broadcast=False)
+        self.key_cache = APIKeyCache(API_KEY_CACHE_TTL_SECONDS, API_KEY_CACHE_MAX_ENTRIES)
+        self.rate_limiter = RedisDualWindowLimiter(redis_client, 'rl:api') if REDIS_AVAILABLE else None
+        self.local_rate_limiter = LocalDualWindowLimiter()
+        self.key_usage = WriteBehindCounters('customer_resources.db', KEY_USAGE_UPDATE_SQL,
+                                             KEY_USAGE_FLUSH_INTERVAL_MS, name='api-key-usage')
+        self._instance_id = uuid.uuid4().hex
+        self.start_invalidation_listener()
         
     def init_api_database(self):
         """Initialize API-specific database tables"""
@@ -149,10 +228,11 @@ class APIManager:
         conn = sqlite3.connect('customer_resources.db')
         cursor = conn.cursor()
         
+        # Existing rows are left alone, so edited policies survive a restart
         for endpoint in endpoints:
             endpoint_id = str(uuid.uuid4())
             cursor.execute('''
-                INSERT OR REPLACE INTO api_endpoints 
+                INSERT OR IGNORE INTO api_endpoints 
                 (endpoint_id, path, method, description, required_plan, rate_limit_override)
                 VALUES (?, ?, ?, ?, ?, ?)
             ''', (endpoint_id, endpoint['path'], endpoint['method'], 
@@ -162,6 +242,21 @@ class APIManager:
         conn.commit()
         conn.close()
     
+    def reload_policies(self, broadcast: bool = True) -> bool:
+        """Recompile the endpoint policy table from api_endpoints and swap it in"""
+        try:
+            conn = sqlite3.connect('customer_resources.db')
+            policies = PolicyTable.from_connection(conn)
+            conn.close()
+        except Exception as e:
+            logger.error(f"Error loading endpoint policies: {e}")
+            return False
+        
+        self.policies = policies
+        if broadcast:
+            self._publish_invalidation('policies:')
+        return True
+    
     def generate_api_key(self, customer_id: str, key_name: str = None) -> str:
         """Generate new API key for customer"""
         try:
@@ -192,14 +287,131 @@ class APIManager:
             conn.commit()
             conn.close()
             
+            # Drop any cached "invalid" verdict for this key
+            self.invalidate_api_key(api_key)
+            
             return api_key
             
         except Exception as e:
             logger.error(f"Error generating API key: {e}")
             return None
     
+    def deactivate_api_key(self, api_key: str, customer_id: str = None) -> bool:
+        """Revoke a key (only if it belongs to customer_id, when given); effective in every worker"""
+        try:
+            conn = sqlite3.connect('customer_resources.db')
+            cursor = conn.cursor()
+            
+            if customer_id is None:
+                cursor.execute('UPDATE api_keys SET is_active = 0 WHERE api_key = ?', (api_key,))
+            else:
+                cursor.execute('UPDATE api_keys SET is_active = 0 WHERE api_key = ? AND customer_id = ?',
+                               (api_key, customer_id))
+            updated = cursor.rowcount > 0
+            
+            conn.commit()
+            conn.close()
+            
+            if updated:
+                self.invalidate_api_key(api_key)
+            return updated
+            
+        except Exception as e:
+            logger.error(f"Error deactivating API key: {e}")
+            return False
+    
+    def update_customer(self, customer_id: str, status: str = None, plan_type: str = None) -> bool:
+        """Change a customer's status and/or plan; their cached keys are dropped everywhere"""
+        updates = {column: value for column, value in (('status', status), ('plan_type', plan_type))
+                   if value is not None}
+        if not updates:
+            return False
+        try:
+            conn = sqlite3.connect('customer_resources.db')
+            cursor = conn.cursor()
+            
+            assignments = ', '.join(f'{column} = ?' for column in updates)
+            cursor.execute(f'UPDATE customers SET {assignments} WHERE customer_id = ?',
+                           (*updates.values(), customer_id))
+            updated = cursor.rowcount > 0
+            
+            conn.commit()
+            conn.close()
+            
+            self.invalidate_customer(customer_id)
+            return updated
+            
+        except Exception as e:
+            logger.error(f"Error updating customer {customer_id}: {e}")
+            return False
+    
+    def invalidate_api_key(self, api_key: str):
+        # Broadcast the digest: every subscriber to the channel would see a raw key
+        digest = key_digest(api_key)
+        self.key_cache.invalidate_digest(digest)
+        self._publish_invalidation(f"key:{digest}")
+    
+    def invalidate_customer(self, customer_id: str):
+        """Call after changing a customer's status or plan outside update_customer()"""
+        self.key_cache.invalidate_customer(customer_id)
+        self._publish_invalidation(f"customer:{customer_id}")
+    
+    def _publish_invalidation(self, target: str):
+        if not REDIS_AVAILABLE:
+            return
+        try:
+            redis_client.publish(API_KEY_CHANNEL, f"{self._instance_id}:{target}")
+        except Exception as e:
+            logger.error(f"Error publishing API key invalidation for {target}: {e}")
+    
+    def start_invalidation_listener(self):
+        if not REDIS_AVAILABLE:
+            return
+        listener = threading.Thread(target=self._listen_for_invalidations,
+                                    name='api-key-invalidation', daemon=True)
+        listener.start()
+    
+    def _listen_for_invalidations(self):
+        """Apply other workers' invalidations; after losing the subscription, start cold"""
+        while True:
+            try:
+                pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(API_KEY_CHANNEL)
+                # Anything published while we weren't subscribed is lost
+                self.key_cache.clear()
+                self.reload_policies(broadcast=False)
+                last_reload = time.time()
+                while True:
+                    message = pubsub.get_message(timeout=POLICY_REFRESH_SECONDS)
+                    if time.time() - last_reload >= POLICY_REFRESH_SECONDS:
+                        self.reload_policies(broadcast=False)
+                        last_reload = time.time()
+                    if not message:
+                        continue
+                    sender, _, target = str(message['data']).partition(':')
+                    if sender == self._instance_id:
+                        continue
+                    kind, _, value = target.partition(':')
+                    if kind == 'key':
+                        self.key_cache.invalidate_digest(value)
+                    elif kind == 'customer':
+                        self.key_cache.invalidate_customer(value)
+                    elif kind == 'policies':
+                        self.reload_policies(broadcast=False)
+                        last_reload = time.time()
+                    else:
+                        self.key_cache.clear()
+            except Exception as e:
+                logger.error(f"API key invalidation listener error: {e}")
+                time.sleep(API_KEY_CACHE_TTL_SECONDS)
+    
     def validate_api_key(self, api_key: str) -> Tuple[bool, Optional[Dict]]:
-        """Validate API key and return customer info"""
+        """Validate API key and return customer info (shared, treat as read-only)"""
+        cached = self.key_cache.get(api_key)
+        if cached is not MISS:
+            return cached is not None, cached
+        
+        generation = self.key_cache.generation
         try:
             conn = sqlite3.connect('customer_resources.db')
             cursor = conn.cursor()
@@ -216,123 +428,85 @@ class APIManager:
             conn.close()
             
             if not result:
+                self.key_cache.put(api_key, None, generation)
                 return False, None
             
             customer_id, permissions, is_active, plan_type, status, expires_at = result
             
             # Check if key is active
             if not is_active or status != 'active':
+                self.key_cache.put(api_key, None, generation)
                 return False, None
             
             # Check expiration
+            expires_ts = None
             if expires_at:
                 expires_dt = datetime.fromisoformat(expires_at)
                 if expires_dt < datetime.now():
+                    self.key_cache.put(api_key, None, generation)
                     return False, None
+                # Cached only until the key expires
+                expires_ts = expires_dt.timestamp()
             
-            return True, {
+            customer_info = {
                 'customer_id': customer_id,
                 'permissions': permissions,
                 'plan_type': plan_type
             }
+            self.key_cache.put(api_key, customer_info, generation, expires_ts)
+            return True, customer_info
             
         except Exception as e:
             logger.error(f"Error validating API key: {e}")
             return False, None
     
+    def _check_window(self, identifier: str, per_minute: int, per_day: int):
+        """Count one request in a minute + day window pair; Redis first, local dual windows if it's down"""
+        if self.rate_limiter is not None:
+            try:
+                return self.rate_limiter.check(identifier, per_minute, per_day)
+            except redis.RedisError as e:
+                logger.warning(f"Redis rate limit check failed, using local dual-window limiter: {e}")
+        return self.local_rate_limiter.check(identifier, per_minute, per_day)
+    
     def check_rate_limit(self, api_key: str, endpoint: str, plan_type: str) -> Tuple[bool, Dict]:
-        """Check if request is within rate limits"""
+        """Check if request is within rate limits; `endpoint` is the route path, e.g. /api/v1/stats
+        
+        Every request counts against the key's plan-wide minute and day windows. A route
+        with a rate_limit_override also counts against a window of its own, keyed by key
+        and route, so other routes' traffic doesn't use up its allowance. Each window pair
+        is checked and counted in one atomic Redis script shared by every worker; a
+        host-local dual-window limiter stands in while Redis is down.
+        """
         try:
-            # Get rate limits based on plan
-            plan_limits = {
-                'basic': {'per_minute': 100, 'per_day': 10000},
-                'premium': {'per_minute': 500, 'per_day': 50000},
-                'enterprise': {'per_minute': 2000, 'per_day': 200000}
-            }
-            
-            limits = plan_limits.get(plan_type, plan_limits['basic'])
-            
-            # Check for endpoint-specific overrides
-            conn = sqlite3.connect('customer_resources.db')
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT rate_limit_override FROM api_endpoints 
-                WHERE path = ? AND is_active = 1
-            ''', (endpoint,))
-            
-            override_result = cursor.fetchone()
-            if override_result and override_result[0]:
-                limits['per_minute'] = override_result[0]
-            
-            # Get current usage
-            cursor.execute('''
-                SELECT requests_count, window_start, daily_count, daily_reset
-                FROM api_rate_limits WHERE api_key = ?
-            ''', (api_key,))
-            
-            result = cursor.fetchone()
-            
-            now = datetime.now()
-            
-            if result:
-                requests_count, window_start_str, daily_count, daily_reset_str = result
-                window_start = datetime.fromisoformat(window_start_str)
-                daily_reset = datetime.fromisoformat(daily_reset_str)
-                
-                # Check if we need to reset windows
-                if now - window_start > timedelta(minutes=1):
-                    requests_count = 0
-                    window_start = now
-                
-                if now - daily_reset > timedelta(days=1):
-                    daily_count = 0
-                    daily_reset = now
-                
-                # Check limits
-                if requests_count >= limits['per_minute']:
-                    conn.close()
-                    return False, {
-                        'error': 'Rate limit exceeded',
-                        'limit': limits['per_minute'],
-                        'window': 'per_minute',
-                        'reset_at': (window_start + timedelta(minutes=1)).isoformat()
-                    }
-                
-                if daily_count >= limits['per_day']:
-                    conn.close()
-                    return False, {
-                        'error': 'Daily limit exceeded',
-                        'limit': limits['per_day'],
-                        'window': 'per_day',
-                        'reset_at': (daily_reset + timedelta(days=1)).isoformat()
-                    }
-                
-                # Update counters
-                cursor.execute('''
-                    UPDATE api_rate_limits 
-                    SET requests_count = ?, window_start = ?, 
-                        daily_count = ?, daily_reset = ?
-                    WHERE api_key = ?
-                ''', (requests_count + 1, window_start.isoformat(),
-                     daily_count + 1, daily_reset.isoformat(), api_key))
-                
-            else:
-                # First request for this API key
-                cursor.execute('''
-                    INSERT INTO api_rate_limits 
-                    (api_key, requests_count, window_start, daily_count, daily_reset)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (api_key, 1, now.isoformat(), 1, now.isoformat()))
-            
-            conn.commit()
-            conn.close()
+            results = []
+            for scope, per_minute, per_day in self.policies.windows(endpoint, plan_type):
+                identifier = api_key if scope is None else f"{api_key}:{scope}"
+                result = self._check_window(identifier, per_minute, per_day)
+                results.append(result)
+                if not result.allowed:
+                    break
+            
+            now = time.time()
+            result = results[-1]
+            if not result.allowed:
+                by_day = result.denied_by == DAY
+                return False, {
+                    'error': 'Daily limit exceeded' if by_day else 'Rate limit exceeded',
+                    'limit': result.day_limit if by_day else result.minute_limit,
+                    'window': 'per_day' if by_day else 'per_minute',
+                    'reset_at': datetime.fromtimestamp(now + result.retry_after_seconds).isoformat(),
+                    'retry_after': max(1, math.ceil(result.retry_after_seconds))
+                }
             
+            # The tightest window is what the caller has left
+            minute = min(results, key=lambda r: r.minute_remaining)
+            day = min(results, key=lambda r: r.day_remaining)
             return True, {
-                'remaining_minute': limits['per_minute'] - (requests_count + 1),
-                'remaining_day': limits['per_day'] - (daily_count + 1),
-                'reset_minute': (window_start + timedelta(minutes=1)).isoformat() if result else (now + timedelta(minutes=1)).isoformat(),
-                'reset_day': (daily_reset + timedelta(days=1)).isoformat() if result else (now + timedelta(days=1)).isoformat()
+                'remaining_minute': minute.minute_remaining,
+                'remaining_day': day.day_remaining,
+                'reset_minute': datetime.fromtimestamp(now + minute.minute_reset_seconds).isoformat(),
+                'reset_day': datetime.fromtimestamp(now + day.day_reset_seconds).isoformat()
             }
             
         except Exception as e:
@@ -359,31 +533,52 @@ class APIManager:
                  request.remote_addr, request.headers.get('User-Agent', ''),
                  request_size, response_size, response_time_ms, status_code))
             
-            # Update API key last used
-            cursor.execute('''
-                UPDATE api_keys SET last_used_at = CURRENT_TIMESTAMP,
-                total_requests = total_requests + 1
-                WHERE api_key = ?
-            ''', (api_key,))
-            
             conn.commit()
             conn.close()
             
         except Exception as e:
             logger.error(f"Error logging API usage: {e}")
+        
+        # Key last-used / request count are written behind, off the request path
+        self.key_usage.add(api_key)
 
 # Flask decorators for API authentication
 def require_api_key(required_plan: str = 'basic'):
-    """Decorator to require API key authentication"""
+    """Decorator to require API key authentication
+    
+    The route's api_endpoints policy (plan, methods, limits) wins; required_plan
+    only applies to routes that have no policy row.
+    """
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
+            # Overloaded, or queued too long already: refuse before the key lookup touches SQLite
+            if not api_admission.acquire(queue_wait_seconds(request.headers.get('X-Request-Start'))):
+                return overloaded_response()
+            try:
+                return gated(*args, **kwargs)
+            finally:
+                api_admission.release()
+        
+        def gated(*args, **kwargs):
             api_manager = g.get('api_manager')
             if not api_manager:
                 return jsonify({'error': 'API system not initialized'}), 500
             
             start_time = time.time()
             
+            # Route policy: one dict probe on the rule path, which is what api_endpoints stores
+            endpoint_path = request.url_rule.rule if request.url_rule is not None else request.path
+            policy = api_manager.policies.get(endpoint_path)
+            if policy is not None:
+                if not policy.is_active:
+                    return jsonify({'error': 'Endpoint disabled'}), 404
+                if request.method not in policy.methods:
+                    return jsonify({'error': f'Method {request.method} not allowed on {endpoint_path}'}), 405
+                needed_plan, needed_level = policy.required_plan, policy.required_level
+            else:
+                needed_plan, needed_level = required_plan, plan_level(required_plan)
+            
             # Get API key from header or query parameter
             api_key = request.headers.get('Authorization')
             if api_key and api_key.startswith('Bearer '):
@@ -392,6 +587,7 @@ def require_api_key(required_plan: str = 'basic'):
                 api_key = request.args.get('api_key')
             
             if not api_key:
+                AUTH_REJECTIONS.labels('api', 'missing_key').inc()
                 return jsonify({
                     'error': 'API key required',
                     'message': 'Provide API key in Authorization header (Bearer token) or api_key parameter'
@@ -400,34 +596,36 @@ def require_api_key(required_plan: str = 'basic'):
             # Validate API key
             is_valid, customer_info = api_manager.validate_api_key(api_key)
             if not is_valid:
+                AUTH_REJECTIONS.labels('api', 'invalid_key').inc()
                 return jsonify({
                     'error': 'Invalid API key',
                     'message': 'API key is invalid, expired, or disabled'
                 }), 401
             
             # Check plan requirements
-            plan_hierarchy = {'basic': 0, 'premium': 1, 'enterprise': 2}
-            customer_plan_level = plan_hierarchy.get(customer_info['plan_type'], 0)
-            required_plan_level = plan_hierarchy.get(required_plan, 0)
-            
-            if customer_plan_level < required_plan_level:
+            if plan_level(customer_info['plan_type']) < needed_level:
+                AUTH_REJECTIONS.labels('api', 'insufficient_plan').inc()
                 return jsonify({
                     'error': 'Insufficient plan',
-                    'message': f'This endpoint requires {required_plan} plan or higher',
+                    'message': f'This endpoint requires {needed_plan} plan or higher',
                     'current_plan': customer_info['plan_type'],
                     'upgrade_url': 'https://fastping.it/pricing'
                 }), 403
             
+            # Lower plans shed first, before the rate-limit query
+            if not api_admission.allows(customer_info['plan_type']):
+                return overloaded_response()
+            
             # Check rate limits
-            endpoint_path = request.endpoint or request.path
             rate_ok, rate_info = api_manager.check_rate_limit(
                 api_key, endpoint_path, customer_info['plan_type']
             )
             
             if not rate_ok:
+                RATE_LIMIT_REJECTIONS.labels('api', customer_info['plan_type']).inc()
                 response = jsonify(rate_info)
                 response.status_code = 429
-                response.headers['Retry-After'] = '60'
+                response.headers['Retry-After'] = str(rate_info.get('retry_after', 60))
                 return response
             
             # Store info in g for use in endpoint
@@ -435,12 +633,15 @@ def require_api_key(required_plan: str = 'basic'):
             g.customer_info = customer_info
             g.rate_info = rate_info
             g.start_time = start_time
+            g.upstream_seconds = 0.0
             
             # Execute the actual endpoint
             result = f(*args, **kwargs)
             
             # Log usage
             response_time = (time.time() - start_time) * 1000
+            api_admission.observe(max(0.0, response_time / 1000 - g.upstream_seconds))
+            REQUEST_LATENCY.labels('api', endpoint_path, customer_info['plan_type']).observe(response_time / 1000)
             status_code = result.status_code if hasattr(result, 'status_code') else 200
             
             api_manager.log_api_usage(
@@ -528,7 +729,11 @@ def create_api_endpoints(app, api_manager, whitelist_manager):
     @app.route('/api/v1/proxy', methods=['GET', 'POST', 'PUT', 'DELETE'])
     @require_api_key('premium')
     def api_proxy():
-        """Full proxy request to external URL"""
+        """Full proxy request to external URL
+        
+        mode=raw streams the upstream body back as-is (compressed on the fly when
+        the client accepts it) instead of embedding it in the JSON envelope.
+        """
         target_url = request.args.get('url') or (request.get_json() or {}).get('url')
         
         if not target_url:
@@ -543,13 +748,15 @@ def create_api_endpoints(app, api_manager, whitelist_manager):
             headers.pop('Host', None)  # Remove host header
             headers.pop('Authorization', None)  # Remove API key
             
-            response = requests.request(
+            if request.args.get('mode') in ('raw', 'stream'):
+                return stream_proxy_response(target_url, headers)
+            
+            response = upstream_request(
                 method=request.method,
                 url=target_url,
                 headers=headers,
                 data=request.get_data(),
-                params=request.args,
-                timeout=30
+                params=request.args
             )
             
             # Return proxied response
@@ -575,6 +782,37 @@ def create_api_endpoints(app, api_manager, whitelist_manager):
                 'target_url': target_url
             }), 500
     
+    def stream_proxy_response(target_url, headers):
+        """Relay the upstream body chunk by chunk, never holding all of it"""
+        # requests decodes the upstream Content-Encoding; we re-encode for our client
+        headers.pop('Accept-Encoding', None)
+        upstream = upstream_request(
+            method=request.method,
+            url=target_url,
+            headers=headers,
+            data=request.get_data(),
+            params={key: value for key, value in request.args.items() if key not in ('url', 'mode')},
+            stream=True
+        )
+        
+        def relay():
+            try:
+                yield from upstream.iter_content(PROXY_STREAM_CHUNK_BYTES)
+            finally:
+                upstream.close()
+        
+        encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+        body = relay() if encoding is None else stream_compressed(relay(), encoding)
+        
+        response = Response(body, status=upstream.status_code,
+                            content_type=upstream.headers.get('Content-Type', 'application/octet-stream'))
+        response.vary.add('Accept-Encoding')
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['X-Proxy-Target'] = target_url
+        response.headers['X-Proxy-Time-Ms'] = f"{(time.time() - g.start_time) * 1000:.2f}"
+        return response
+    
     @app.route('/api/v1/stats', methods=['GET'])
     @require_api_key('basic')
     def api_stats():
@@ -599,17 +837,13 @@ def create_api_endpoints(app, api_manager, whitelist_manager):
             ''', (customer_id, thirty_days_ago))
             
             stats = cursor.fetchone()
-            
-            # Get rate limit status
-            cursor.execute('''
-                SELECT requests_count, daily_count FROM api_rate_limits 
-                WHERE api_key = ?
-            ''', (g.api_key,))
-            
-            rate_data = cursor.fetchone()
-            
             conn.close()
             
+            # Rate limit status, as counted by this request's limiter check
+            per_minute, per_day = api_manager.policies.limits(request.url_rule.rule, g.customer_info['plan_type'])
+            remaining_minute = g.rate_info.get('remaining_minute')
+            remaining_day = g.rate_info.get('remaining_day')
+            
             return jsonify({
                 'status': 'success',
                 'customer_id': customer_id,
@@ -621,10 +855,10 @@ def create_api_endpoints(app, api_manager, whitelist_manager):
                     'total_bytes_transferred': stats[3] or 0
                 },
                 'current_limits': {
-                    'requests_this_minute': rate_data[0] if rate_data else 0,
-                    'requests_today': rate_data[1] if rate_data else 0,
-                    'remaining_minute': g.rate_info.get('remaining_minute'),
-                    'remaining_day': g.rate_info.get('remaining_day')
+                    'requests_this_minute': per_minute - remaining_minute,
+                    'requests_today': per_day - remaining_day,
+                    'remaining_minute': remaining_minute,
+                    'remaining_day': remaining_day
                 },
                 'generated_at': datetime.now().isoformat()
             })
@@ -668,9 +902,9 @@ def create_api_endpoints(app, api_manager, whitelist_manager):
                     continue
                 
                 # Process individual request
-                response = requests.get(
-                    req_data['url'],
-                    timeout=10,
+                response = upstream_request(
+                    'GET', req_data['url'],
+                    timeout=(UPSTREAM_CONNECT_TIMEOUT_SECONDS, BATCH_READ_TIMEOUT_SECONDS),
                     headers=req_data.get('headers', {})
                 )
                 
@@ -758,6 +992,42 @@ def create_management_endpoints(app, api_manager):
             return jsonify({
                 'error': 'Failed to create API key'
             }), 500
+    
+    @app.route('/api/account/keys', methods=['DELETE'])
+    @require_api_key('basic')
+    def deactivate_api_key():
+        """Revoke one of the customer's API keys"""
+        data = request.get_json() or {}
+        api_key = data.get('api_key')
+        if not api_key:
+            return jsonify({'error': 'api_key is required'}), 400
+        
+        customer_id = g.customer_info['customer_id']
+        if api_manager.deactivate_api_key(api_key, customer_id):
+            return jsonify({
+                'status': 'success',
+                'message': 'API key deactivated'
+            })
+        else:
+            return jsonify({
+                'error': 'API key not found'
+            }), 404
+
+# Operator endpoints
+def create_admin_endpoints(app, api_manager):
+    """Per-worker internals as JSON; answered on loopback only"""
+    
+    @app.route('/api/admin/stats', methods=['GET'])
+    def api_admin_stats():
+        # The upstream host list shows which sites customers proxy to
+        if not ipaddress.ip_address(request.remote_addr or '0.0.0.0').is_loopback:
+            return jsonify({'error': 'Not found'}), 404
+        return jsonify({
+            'admission': api_admission.stats(),
+            'upstream': upstream_client.stats(),
+            'key_cache': api_manager.key_cache.stats(),
+            'key_usage': api_manager.key_usage.stats()
+        })
 
 # Complete setup function
 def setup_api_system(app, whitelist_manager, customer_manager):
@@ -769,6 +1039,13 @@ def setup_api_system(app, whitelist_manager, customer_manager):
     # Create all endpoints
     create_api_endpoints(app, api_manager, whitelist_manager)
     create_management_endpoints(app, api_manager)
+    create_admin_endpoints(app, api_manager)
+    
+    # Negotiated gzip/zstd for large JSON responses
+    install_compression(app)
+    
+    # Prometheus scrape endpoint, shared with the proxy test app if both run in one process
+    install_metrics_endpoint(app)
     
     logger.info("🚀 Complete API system initialized!")
     
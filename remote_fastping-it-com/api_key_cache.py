@@ -0,0 +1,117 @@
+"""
+API Key Validation Cache
+========================
+
+Bounded in-process cache of validate_api_key results
+- A hit is one dict probe and one clock read; no lock, no SQLite
+- Entries live for a short TTL, never past the key's own expires_at
+- Invalid keys are cached too, so floods of bad keys don't reach the database
+- Explicit invalidation by key, by customer, or everything
+- Entries are keyed by key_digest(), so invalidations can be broadcast without
+  putting the key itself on the wire
+- A generation counter stops a validation that raced an invalidation from
+  re-caching the stale record
+- Size-bounded: the oldest-inserted entry goes first; refreshed entries are
+  re-inserted, so eviction order approximates LRU without reordering on hits
+"""
+
+import hashlib
+import threading
+import time
+from typing import Any, Dict, Optional
+
+MISS = object()
+
+def key_digest(api_key: str) -> str:
+    """Stable, non-reversible name for an API key (keys are random, so no salt is needed)"""
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+class APIKeyCache:
+    def __init__(self, ttl_seconds: float = 30.0, max_entries: int = 50000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # key_digest(api_key) -> (valid until epoch, customer_id or None, record or None)
+        self._entries: Dict[str, tuple] = {}
+        self._by_customer: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self.generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def get(self, api_key: str):
+        """The cached record (None for a known-invalid key), or MISS"""
+        entry = self._entries.get(key_digest(api_key))
+        if entry is not None and entry[0] > time.time():
+            self.hits += 1
+            return entry[2]
+        self.misses += 1
+        return MISS
+
+    def put(self, api_key: str, record: Optional[Dict[str, Any]], generation: int,
+            expires_ts: Optional[float] = None):
+        """Cache a validation result read while the cache was at `generation`"""
+        valid_until = time.time() + self.ttl_seconds
+        if expires_ts is not None:
+            valid_until = min(valid_until, expires_ts)
+        customer_id = record['customer_id'] if record else None
+        digest = key_digest(api_key)
+
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._discard(digest)
+            while len(self._entries) >= self.max_entries:
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+            self._entries[digest] = (valid_until, customer_id, record)
+            if customer_id is not None:
+                self._by_customer.setdefault(customer_id, set()).add(digest)
+
+    def _discard(self, digest: str):
+        entry = self._entries.pop(digest, None)
+        if entry is not None and entry[1] is not None:
+            digests = self._by_customer.get(entry[1])
+            if digests is not None:
+                digests.discard(digest)
+                if not digests:
+                    del self._by_customer[entry[1]]
+
+    def invalidate_key(self, api_key: str):
+        self.invalidate_digest(key_digest(api_key))
+
+    def invalidate_digest(self, digest: str):
+        """Drop a key known only by its key_digest(), e.g. from another worker's broadcast"""
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            self._discard(digest)
+
+    def invalidate_customer(self, customer_id: str):
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            for digest in list(self._by_customer.get(customer_id, ())):
+                self._discard(digest)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            self._entries.clear()
+            self._by_customer.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'invalidations': self.invalidations,
+            'evictions': self.evictions
+        }
@@ -0,0 +1,216 @@
+"""
+Asyncio Serving Mode for the Ping Endpoints
+===========================================
+
+Event-loop server for /ping, /fast-ping and the catch-all echo endpoint
+- One process holds tens of thousands of keep-alive pingers (no thread per connection)
+- Same IPWhitelistManager snapshot, per-plan limits and usage log as the Flask app
+- Rate limiting through redis.asyncio, so the loop never blocks on Redis
+- Usage rows go to the non-blocking write-behind queue
+
+Run:  python async_server.py            (listens on ASYNC_PORT)
+"""
+
+import asyncio
+import importlib
+import time
+from datetime import datetime
+
+import orjson
+import redis
+import redis.asyncio as aioredis
+from aiohttp import web
+
+from rate_limiter import RedisRateLimiter
+from request_context import RequestContext
+
+# proxy-test-app.py isn't a valid module name for a plain import
+proxy_app = importlib.import_module('proxy-test-app')
+whitelist_manager = proxy_app.whitelist_manager
+
+ASYNC_HOST = '0.0.0.0'
+ASYNC_PORT = 9877
+KEEPALIVE_TIMEOUT = 75  # Seconds an idle keep-alive connection is held open
+LISTEN_BACKLOG = 4096
+
+JSON = 'application/json'
+
+def request_context(request: web.Request) -> RequestContext:
+    """This request's parsed forwarding headers, built once and kept on the request"""
+    ctx = request.get('client_context')
+    if ctx is None:
+        ctx = request['client_context'] = RequestContext(request.headers, request.remote)
+    return ctx
+
+def json_response(payload, status: int = 200) -> web.Response:
+    return web.Response(body=orjson.dumps(payload), status=status, content_type=JSON)
+
+async def check_rate_limit(app: web.Application, client_ip: str, client_data: dict):
+    limiter = app['rate_limiter']
+    if limiter is not None:
+        try:
+            return await limiter.acheck(client_ip, client_data['rate_limit'], client_data['plan_type'])
+        except redis.RedisError as e:
+            print(f"Redis rate limit check failed for {client_ip}, using local buckets: {e}")
+    return whitelist_manager.local_rate_limiter.check(client_ip, client_data['rate_limit'],
+                                                      client_data['plan_type'])
+
+@web.middleware
+async def require_whitelisted_ip(request: web.Request, handler):
+    """Async twin of proxy-test-app's decorator: whitelist, rate limit, log usage"""
+    if not getattr(request.match_info.handler, 'whitelisted', True):
+        return await handler(request)
+
+    start_time = time.time()
+    client_ip = request_context(request).whitelist_ip
+    endpoint = request.match_info.route.name or request.path
+
+    denied_cache = whitelist_manager.denied_cache
+    if denied_cache.is_denied(client_ip):
+        return web.Response(body=proxy_app.DENIED_TEMPLATE.render_one(client_ip), status=403,
+                            content_type=JSON)
+
+    is_allowed, client_data = whitelist_manager.is_ip_allowed(client_ip)
+    if not is_allowed:
+        if denied_cache.add(client_ip):
+            whitelist_manager.log_usage(client_ip, 'unknown', endpoint,
+                                        (time.time() - start_time) * 1000, False)
+        return web.Response(body=proxy_app.DENIED_TEMPLATE.render_one(client_ip), status=403,
+                            content_type=JSON)
+
+    rate_status = await check_rate_limit(request.app, client_ip, client_data)
+    if not rate_status.allowed:
+        whitelist_manager.log_usage(client_ip, client_data['customer_id'], endpoint,
+                                    (time.time() - start_time) * 1000, False)
+        response = json_response({
+            'error': 'Rate limit exceeded',
+            'message': f"Rate limit: {client_data['rate_limit']} requests/minute",
+            'plan': client_data['plan_type']
+        }, status=429)
+        response.headers.update(rate_status.headers())
+        response.headers['Retry-After'] = str(max(1, round(rate_status.reset_seconds)))
+        return response
+
+    response = await handler(request)
+
+    whitelist_manager.log_usage(client_ip, client_data['customer_id'], endpoint,
+                                (time.time() - start_time) * 1000, True)
+    response.headers.update(rate_status.headers())
+    return response
+
+def public(handler):
+    """Skip the whitelist middleware for this handler"""
+    handler.whitelisted = False
+    return handler
+
+async def ping(request: web.Request) -> web.Response:
+    ctx = request_context(request)
+    template = proxy_app.PING_TEMPLATES[ctx.anonymity(ctx.remote_addr)]
+    return web.Response(body=template.render_one(ctx.client_ip), content_type=JSON)
+
+async def fast_ping(request: web.Request) -> web.Response:
+    return web.Response(body=orjson.dumps({'pong': time.time()}), content_type=JSON)
+
+async def health(request: web.Request) -> web.Response:
+    return json_response({
+        'status': 'healthy',
+        'timestamp': datetime.now().isoformat(),
+        'service': 'premium-proxy-test'
+    })
+
+@public
+async def status(request: web.Request) -> web.Response:
+    return json_response({
+        'service': 'premium-proxy-test-api',
+        'status': 'operational',
+        'message': 'Contact sales@yourservice.com for access'
+    })
+
+async def _echo_form(request: web.Request) -> dict:
+    if (request.content_type not in ('application/x-www-form-urlencoded', 'multipart/form-data')
+            or not proxy_app.echo_body_allowed(request.content_length)):
+        return {}
+    return {key: value for key, value in (await request.post()).items() if isinstance(value, str)}
+
+async def _echo_json(request: web.Request):
+    if request.content_type != JSON or not proxy_app.echo_body_allowed(request.content_length):
+        return None
+    try:
+        return await request.json(loads=orjson.loads)
+    except ValueError:
+        return None
+
+async def proxy_test_endpoint(request: web.Request) -> web.Response:
+    start_time = time.time()
+    ctx = request_context(request)
+    selector = request.query.get('fields') or request.headers.get('X-Fields')
+    fields = proxy_app.parse_echo_fields(selector)
+    if fields == []:
+        return json_response(proxy_app.unknown_fields_response(selector), status=400)
+
+    connecting_ip = ctx.remote_addr
+    client_ip_from_headers = ctx.client_ip
+    server_processing_latency_ms = (time.time() - start_time) * 1000
+
+    getters = {
+        "status": lambda: "success",
+        "message": lambda: "Premium proxy test endpoint active",
+        "received_path": lambda: request.path,
+        "method": lambda: request.method,
+        # Header names are multidict istr instances, which orjson won't serialize
+        "headers_received": lambda: {str(name): value for name, value in request.headers.items()},
+        "connecting_ip": lambda: connecting_ip,
+        "client_ip_from_headers": lambda: client_ip_from_headers,
+        "anonymity_level": lambda: ctx.anonymity(connecting_ip),
+        "server_processing_latency_ms": lambda: server_processing_latency_ms,
+        "speed_hint": lambda: proxy_app.determine_speed(server_processing_latency_ms),
+        "args": lambda: dict(request.query)
+    }
+    response_data = {}
+    for name in fields or proxy_app.ECHO_FIELDS:
+        if name == 'form':
+            response_data[name] = await _echo_form(request)
+        elif name == 'json_body':
+            response_data[name] = await _echo_json(request)
+        else:
+            response_data[name] = getters[name]()
+    return json_response(response_data)
+
+async def on_startup(app: web.Application):
+    app['redis'] = None
+    app['rate_limiter'] = None
+    if proxy_app.REDIS_AVAILABLE:
+        client = aioredis.Redis(host=proxy_app.REDIS_HOST, port=proxy_app.REDIS_PORT,
+                                db=proxy_app.REDIS_DB, decode_responses=True)
+        app['redis'] = client
+        app['rate_limiter'] = RedisRateLimiter(client, proxy_app.RATE_LIMIT_WINDOW_SECONDS,
+                                               plan_modes=proxy_app.RATE_LIMIT_MODES)
+
+async def on_cleanup(app: web.Application):
+    if app['redis'] is not None:
+        await app['redis'].aclose()
+    await asyncio.get_running_loop().run_in_executor(None, whitelist_manager.usage_writer.flush)
+
+def create_app() -> web.Application:
+    app = web.Application(middlewares=[require_whitelisted_ip])
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+
+    app.router.add_get('/ping', ping, name='ping')
+    app.router.add_get('/fast-ping', fast_ping, name='fast_ping')
+    app.router.add_get('/health', health, name='health')
+    app.router.add_get('/status', status, name='status')
+    app.router.add_route('*', '/{path:.*}', proxy_test_endpoint, name='proxy_test_endpoint')
+    return app
+
+if __name__ == '__main__':
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+
+    print(f"🚀 Async ping server on {ASYNC_HOST}:{ASYNC_PORT}")
+    web.run_app(create_app(), host=ASYNC_HOST, port=ASYNC_PORT,
+                keepalive_timeout=KEEPALIVE_TIMEOUT, backlog=LISTEN_BACKLOG,
+                access_log=None)
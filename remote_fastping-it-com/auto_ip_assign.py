@@ -10,6 +10,7 @@ Automated IP/Port assignment, usage monitoring, and billing preparation
 """
 
 import sqlite3
+import importlib
 import ipaddress
 import random
 import threading
@@ -20,6 +21,13 @@ from dataclasses import dataclass, asdict
 from enum import Enum
 import uuid
 
+from sqlite_pool import SQLitePool
+from usage_rollup import UsageCompactor, ensure_rollup_schema, usage_summary
+
+USAGE_ROLLUP_INTERVAL_SECONDS = 60  # How often raw usage rows are rolled into minute aggregates
+USAGE_RAW_RETENTION_DAYS = 7  # Raw usage rows older than this are deleted once rolled up
+USAGE_ROLLUP_RETENTION_DAYS = 400
+
 class CustomerStatus(Enum):
     ACTIVE = "active"
     SUSPENDED = "suspended"
@@ -59,6 +67,13 @@ class CustomerResourceManager:
         self.lock = threading.Lock()
         self.init_database()
         self.init_resource_pools()
+        # Billing and the onboarding monitor report from this database's roll-ups;
+        # concurrent compactors in other processes are safe (see usage_rollup.roll_up)
+        self.usage_compactor = UsageCompactor(SQLitePool(self.db_path, max_connections=2),
+                                              USAGE_ROLLUP_INTERVAL_SECONDS,
+                                              USAGE_RAW_RETENTION_DAYS * 86400,
+                                              USAGE_ROLLUP_RETENTION_DAYS)
+        self.usage_compactor.start()
         
     def init_database(self):
         """Initialize extended database schema for customer management"""
@@ -148,6 +163,20 @@ class CustomerResourceManager:
             )
         ''')
         
+        # Raw usage rows (same shape as the proxy service's), and their minute roll-ups
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS usage_logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ip_address TEXT NOT NULL,
+                customer_id TEXT NOT NULL,
+                endpoint TEXT NOT NULL,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                response_time_ms REAL,
+                success BOOLEAN DEFAULT 1
+            )
+        ''')
+        ensure_rollup_schema(conn)
+        
         conn.commit()
         conn.close()
     
@@ -230,7 +259,7 @@ class CustomerResourceManager:
                     return False, "No available resources for plan type"
                 
                 # Add to original whitelist system
-                from proxy-test-app import whitelist_manager
+                whitelist_manager = importlib.import_module('proxy-test-app').whitelist_manager
                 rate_limits = {'basic': 100, 'premium': 500, 'enterprise': 2000}
                 success = whitelist_manager.add_ip(
                     resource.ip_address, 
@@ -357,18 +386,10 @@ class CustomerResourceManager:
         
         plan_type, monthly_quota = result
         
-        # Aggregate usage from original usage_logs table
-        cursor.execute('''
-            SELECT COUNT(*) as total_requests,
-                   AVG(response_time_ms) as avg_response_time,
-                   SUM(CASE WHEN success = 0 THEN 1 ELSE 0 END) as error_count
-            FROM usage_logs 
-            WHERE customer_id = ? 
-            AND timestamp BETWEEN ? AND ?
-        ''', (customer_id, period_start.isoformat(), period_end.isoformat()))
-        
-        usage_result = cursor.fetchone()
-        total_requests, avg_response_time, error_count = usage_result or (0, 0, 0)
+        # Aggregate usage from the minute roll-ups (plus raw rows not yet rolled up)
+        usage = usage_summary(conn, customer_id, period_start, period_end)
+        total_requests, avg_response_time, error_count = (
+            usage['requests'], usage['avg_latency_ms'], usage['errors'])
         
         # Calculate costs
         base_costs = {'basic': 29.99, 'premium': 99.99, 'enterprise': 299.99}
@@ -438,7 +459,7 @@ class CustomerResourceManager:
                 ''', (ip_address,))
                 
                 # Remove from whitelist
-                from proxy-test-app import whitelist_manager
+                whitelist_manager = importlib.import_module('proxy-test-app').whitelist_manager
                 whitelist_manager.remove_ip(ip_address)
             
             conn.commit()
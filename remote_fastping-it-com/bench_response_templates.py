@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Response Template Benchmark
+Per-request cost of the templated bodies (/ping and the 403 denial) against
+plain orjson.dumps of the same dict: body encoding alone, then the full Flask
+dispatch (routing + view + Response) with the whitelist decorator left out.
+The templates are imported from response_templates, so this measures what ships.
+"""
+
+import timeit
+
+import orjson
+from flask import Flask, Response
+from werkzeug.test import EnvironBuilder
+
+from response_templates import DENIED_TEMPLATE, PING_TEMPLATES
+
+ITERATIONS = 100000
+REPEATS = 7
+CLIENT_IP = '203.0.113.7'
+
+def ping_dict():
+    return orjson.dumps({
+        "anonymity_level": "elite",
+        "client_ip_from_headers": CLIENT_IP,
+        "message": "Premium proxy test endpoint active",
+        "status": "success"
+    })
+
+def ping_template():
+    return PING_TEMPLATES["elite"].render_one(CLIENT_IP)
+
+def denied_dict():
+    return orjson.dumps({
+        'error': 'Access denied',
+        'message': 'IP not whitelisted for paid service',
+        'ip': CLIENT_IP,
+        'contact': 'sales@yourservice.com'
+    })
+
+def denied_template():
+    return DENIED_TEMPLATE.render_one(CLIENT_IP)
+
+CASES = (
+    ('/ping', ping_dict, ping_template),
+    ('denied (403)', denied_dict, denied_template),
+)
+
+def build_app() -> Flask:
+    app = Flask(__name__)
+    for index, (_, dict_body, template_body) in enumerate(CASES):
+        app.add_url_rule(f'/{index}/dict', f'dict_{index}',
+                         lambda body=dict_body: Response(body(), mimetype='application/json'))
+        app.add_url_rule(f'/{index}/template', f'template_{index}',
+                         lambda body=template_body: Response(body(), content_type='application/json'))
+    return app
+
+def dispatcher(app: Flask, path: str):
+    environ = EnvironBuilder(path=path, environ_base={'REMOTE_ADDR': CLIENT_IP}).get_environ()
+
+    def start_response(status, headers):
+        pass
+
+    def call():
+        for chunk in app.wsgi_app(dict(environ), start_response):
+            pass
+    return call
+
+def per_call_ns(func, number: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=REPEATS)) / number * 1e9
+
+def report(label: str, old_ns: float, new_ns: float):
+    print(f"   {label:<28} {old_ns:8.0f} ns -> {new_ns:8.0f} ns  ({(1 - new_ns / old_ns) * 100:5.1f}% less)")
+
+def main():
+    for label, dict_body, template_body in CASES:
+        assert dict_body() == template_body(), f"{label}: template output differs from orjson.dumps"
+
+    app = build_app()
+    print(f"📊 Response templates (best of {REPEATS})")
+    for label, dict_body, template_body in CASES:
+        report(f'{label} body encode', per_call_ns(dict_body, ITERATIONS),
+               per_call_ns(template_body, ITERATIONS))
+
+    requests = ITERATIONS // 10
+    for index, (label, _, _) in enumerate(CASES):
+        report(f'{label} full dispatch', per_call_ns(dispatcher(app, f'/{index}/dict'), requests),
+               per_call_ns(dispatcher(app, f'/{index}/template'), requests))
+
+if __name__ == '__main__':
+    main()
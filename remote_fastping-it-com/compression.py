@@ -0,0 +1,117 @@
+"""
+Size-Aware Response Compression
+===============================
+
+Negotiated zstd / gzip for the large echo and proxy responses
+- Only bodies of at least min_size bytes are compressed; tiny ping payloads go out untouched
+- zstd preferred when the zstandard package is installed and the client accepts it, else gzip
+- Only textual content types (JSON, text, XML, JavaScript)
+- Streaming compressor for proxied bodies, so they are never buffered whole
+"""
+
+import zlib
+from typing import Iterable, Iterator, Optional
+
+from flask import request
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_MIN_BYTES = 1024  # Smaller bodies cost more CPU to compress than they save
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+COMPRESSIBLE_TYPES = ('application/json', 'application/javascript', 'application/xml')
+
+def _supported_encodings():
+    return ('zstd', 'gzip') if zstandard is not None else ('gzip',)
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Best encoding we support from an Accept-Encoding header, or None for identity"""
+    if not accept_encoding:
+        return None
+
+    accepted = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+
+    for encoding in _supported_encodings():
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > 0:
+            return encoding
+    return None
+
+def is_compressible(mimetype: Optional[str]) -> bool:
+    if not mimetype:
+        return False
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES or mimetype.endswith('+json')
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return gzip_compress(data)
+
+def gzip_compress(data: bytes) -> bytes:
+    # wbits=31 writes the gzip container; faster than the gzip module's mtime/filename handling
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+def stream_compressed(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    """Compress an iterable of chunks on the fly, flushing after each so clients see progress"""
+    if encoding == 'zstd':
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        flush_block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        flush_block = zlib.Z_SYNC_FLUSH
+
+    for chunk in chunks:
+        if not chunk:
+            continue
+        data = compressor.compress(chunk) + compressor.flush(flush_block)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def compress_response(response, accept_encoding: Optional[str], min_size: int = COMPRESSION_MIN_BYTES):
+    """Compress a buffered Flask/Werkzeug response in place when it is worth it"""
+    content_length = response.content_length
+    if content_length is not None and content_length < min_size:
+        return response
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or not is_compressible(response.mimetype)):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None:
+        return response
+
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+def install_compression(app, min_size: int = COMPRESSION_MIN_BYTES):
+    """Register an after_request hook that compresses large responses; once per app"""
+    if 'compression' in app.extensions:
+        return
+    app.extensions['compression'] = min_size
+
+    @app.after_request
+    def compress_large_responses(response):
+        return compress_response(response, request.headers.get('Accept-Encoding'), min_size)
@@ -22,6 +22,8 @@ import json
 from typing import Optional, Dict, Any
 import secrets
 
+from usage_rollup import usage_summary, usage_daily
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = secrets.token_hex(32)  # Generate secure secret
 
@@ -192,67 +194,38 @@ class CustomerDashboard:
         
         try:
             conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            
-            # Get stats for last N days
-            cursor.execute('''
-                SELECT 
-                    COUNT(*) as total_requests,
-                    COUNT(CASE WHEN success = 1 THEN 1 END) as successful_requests,
-                    AVG(response_time_ms) as avg_response_time,
-                    MIN(response_time_ms) as min_response_time,
-                    MAX(response_time_ms) as max_response_time,
-                    COUNT(DISTINCT DATE(timestamp)) as active_days
-                FROM usage_logs 
-                WHERE customer_id = ? 
-                AND timestamp >= datetime('now', '-{} days')
-            '''.format(days), (customer_id,))
             
-            stats = cursor.fetchone()
+            # Minute roll-ups plus the not-yet-rolled tail, never a full usage_logs scan
+            since = time.time() - days * 86400
+            summary = usage_summary(conn, customer_id, since)
+            daily_stats = usage_daily(conn, customer_id, since)
+            conn.close()
             
-            # Get daily breakdown
-            cursor.execute('''
-                SELECT 
-                    DATE(timestamp) as date,
-                    COUNT(*) as requests,
-                    AVG(response_time_ms) as avg_response_time
-                FROM usage_logs 
-                WHERE customer_id = ? 
-                AND timestamp >= datetime('now', '-{} days')
-                GROUP BY DATE(timestamp)
-                ORDER BY date DESC
-            '''.format(days), (customer_id,))
+            total_requests = summary['requests']
+            successful_requests = summary['successful']
             
-            daily_stats = cursor.fetchall()
-            conn.close()
+            stats_data = {
+                'total_requests': total_requests,
+                'successful_requests': successful_requests,
+                'success_rate': (successful_requests / total_requests * 100) if total_requests > 0 else 0,
+                'avg_response_time': round(summary['avg_latency_ms'] or 0, 2),
+                'min_response_time': round(summary['latency_min_ms'] or 0, 2),
+                'max_response_time': round(summary['latency_max_ms'] or 0, 2),
+                'active_days': len(daily_stats),
+                'daily_breakdown': [
+                    {
+                        'date': day['date'],
+                        'requests': day['requests'],
+                        'avg_response_time': round(day['avg_latency_ms'] or 0, 2)
+                    } for day in daily_stats
+                ]
+            }
             
-            if stats:
-                total_requests, successful_requests, avg_response_time, min_response_time, max_response_time, active_days = stats
-                
-                stats_data = {
-                    'total_requests': total_requests or 0,
-                    'successful_requests': successful_requests or 0,
-                    'success_rate': (successful_requests / total_requests * 100) if total_requests > 0 else 0,
-                    'avg_response_time': round(avg_response_time or 0, 2),
-                    'min_response_time': round(min_response_time or 0, 2),
-                    'max_response_time': round(max_response_time or 0, 2),
-                    'active_days': active_days or 0,
-                    'daily_breakdown': [
-                        {
-                            'date': row[0],
-                            'requests': row[1],
-                            'avg_response_time': round(row[2] or 0, 2)
-                        } for row in daily_stats
-                    ]
-                }
-                
-                # Cache for shorter time due to changing data
-                if REDIS_AVAILABLE:
-                    redis_client.setex(cache_key, 60, json.dumps(stats_data))  # 1 minute cache
-                
-                return stats_data
+            # Cache for shorter time due to changing data
+            if REDIS_AVAILABLE:
+                redis_client.setex(cache_key, 60, json.dumps(stats_data))  # 1 minute cache
             
-            return {'total_requests': 0, 'successful_requests': 0, 'success_rate': 0}
+            return stats_data
             
         except Exception as e:
             print(f"Error getting customer stats: {e}")
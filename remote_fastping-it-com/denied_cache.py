@@ -0,0 +1,135 @@
+"""
+Negative Cache for Denied IPs
+=============================
+
+Keeps scanners from turning into datastore and usage-log load
+- Short-TTL map of recently denied addresses, checked before any lookup
+- Bounded: oldest entries are evicted first once max_entries is reached
+- Optional Bloom filter of denied addresses, reset every bloom_reset_seconds:
+  an address already in it is not logged again when its TTL entry lapses
+- The Bloom filter never denies on its own, so a false positive can only
+  suppress a log row, never block a whitelisted address
+- invalidate() drops an address (or every cached address inside a network)
+  as soon as it is whitelisted
+"""
+
+import hashlib
+import ipaddress
+import threading
+import time
+from typing import Dict, Any
+
+class BloomFilter:
+    def __init__(self, bits: int, hashes: int = 4):
+        self.bits = max(8, int(bits))
+        self.hashes = hashes
+        self._array = bytearray((self.bits + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self._array[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        array = self._array
+        return all(array[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def clear(self):
+        self._array = bytearray(len(self._array))
+
+class DeniedIPCache:
+    def __init__(self, ttl_seconds: float = 10.0, max_entries: int = 100000,
+                 bloom_bits: int = 0, bloom_hashes: int = 4, bloom_reset_seconds: float = 3600):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.bloom = BloomFilter(bloom_bits, bloom_hashes) if bloom_bits else None
+        self.bloom_reset_seconds = bloom_reset_seconds
+        self._bloom_reset_at = time.monotonic() + bloom_reset_seconds
+
+        self._entries: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.suppressed_logs = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def is_denied(self, ip_address: str) -> bool:
+        """True while a recent denial for this address is cached"""
+        expires = self._entries.get(ip_address)
+        if expires is None:
+            self.misses += 1
+            return False
+        if expires < time.monotonic():
+            self._entries.pop(ip_address, None)
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def add(self, ip_address: str) -> bool:
+        """Cache a denial; returns whether it should still be written to the usage log"""
+        now = time.monotonic()
+        with self._lock:
+            # Re-insert so dict order stays oldest-first for eviction
+            if self._entries.pop(ip_address, None) is None and len(self._entries) >= self.max_entries:
+                self._entries.pop(next(iter(self._entries)), None)
+                self.evictions += 1
+            self._entries[ip_address] = now + self.ttl_seconds
+
+            if self.bloom is None:
+                return True
+            if now >= self._bloom_reset_at:
+                self.bloom.clear()
+                self._bloom_reset_at = now + self.bloom_reset_seconds
+            if ip_address in self.bloom:
+                self.suppressed_logs += 1
+                return False
+            self.bloom.add(ip_address)
+            return True
+
+    def invalidate(self, entry: str):
+        """Forget cached denials covered by a newly whitelisted address or network"""
+        with self._lock:
+            if '/' not in entry:
+                if self._entries.pop(entry, None) is not None:
+                    self.invalidations += 1
+                return
+
+            try:
+                network = ipaddress.ip_network(entry, strict=False)
+            except ValueError:
+                return
+            for ip_address in list(self._entries):
+                try:
+                    covered = ipaddress.ip_address(ip_address) in network
+                except ValueError:
+                    covered = False
+                if covered:
+                    del self._entries[ip_address]
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            if self.bloom is not None:
+                self.bloom.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'suppressed_logs': self.suppressed_logs,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'bloom_bits': self.bloom.bits if self.bloom is not None else 0
+        }
@@ -0,0 +1,107 @@
+"""
+Compiled Endpoint Policy Table
+==============================
+
+Per-route API policy, read from api_endpoints once and swapped in whole on reload
+- Keyed by the Flask route rule ('/api/v1/stats'), the same path create_default_endpoints stores
+- Each policy carries the required plan level, allowed methods, and the
+  per-minute / per-day limits for every plan with rate_limit_override already applied
+- windows() lists the rate-limit windows a request counts against: the key's plan-wide
+  window, plus a window of the route's own when it has an override
+- Resolving a request is one dict probe; nothing touches the database per request
+"""
+
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Optional, Tuple
+
+PLAN_LEVELS = {'basic': 0, 'premium': 1, 'enterprise': 2}
+# (per minute, per day) by plan
+PLAN_LIMITS = {
+    'basic': (100, 10000),
+    'premium': (500, 50000),
+    'enterprise': (2000, 200000)
+}
+
+POLICY_QUERY = '''
+    SELECT path, method, required_plan, rate_limit_override, is_active
+    FROM api_endpoints
+'''
+
+def plan_level(plan_type: Optional[str]) -> int:
+    return PLAN_LEVELS.get(plan_type, 0)
+
+class EndpointPolicy:
+    __slots__ = ('path', 'methods', 'required_plan', 'required_level', 'is_active',
+                 'rate_limit_override', 'limits')
+
+    def __init__(self, path: str, methods: Iterable[str], required_plan: str,
+                 rate_limit_override: Optional[int] = None, is_active: bool = True):
+        self.path = path
+        self.methods = frozenset(m.strip().upper() for m in methods if m.strip())
+        self.required_plan = required_plan if required_plan in PLAN_LEVELS else 'basic'
+        self.required_level = PLAN_LEVELS[self.required_plan]
+        self.is_active = bool(is_active)
+        self.rate_limit_override = rate_limit_override or None
+        # Override replaces the per-minute limit only, as it always has
+        self.limits = MappingProxyType({
+            plan: (rate_limit_override or per_minute, per_day)
+            for plan, (per_minute, per_day) in PLAN_LIMITS.items()
+        })
+
+    def limits_for(self, plan_type: str) -> Tuple[int, int]:
+        return self.limits.get(plan_type) or self.limits['basic']
+
+    def as_dict(self) -> Dict:
+        return {
+            'path': self.path,
+            'methods': sorted(self.methods),
+            'required_plan': self.required_plan,
+            'is_active': self.is_active,
+            'rate_limit_override': self.rate_limit_override,
+            'limits': {plan: {'per_minute': m, 'per_day': d} for plan, (m, d) in self.limits.items()}
+        }
+
+class PolicyTable:
+    """Immutable route -> EndpointPolicy map; build a new one to change it"""
+
+    __slots__ = ('_policies',)
+
+    def __init__(self, rows: Iterable[Tuple] = ()):
+        policies = {}
+        for path, method, required_plan, rate_limit_override, is_active in rows:
+            policies[path] = EndpointPolicy(path, (method or '').split(','), required_plan,
+                                            rate_limit_override, is_active)
+        self._policies = MappingProxyType(policies)
+
+    @classmethod
+    def from_connection(cls, conn) -> 'PolicyTable':
+        return cls(conn.execute(POLICY_QUERY).fetchall())
+
+    def get(self, rule: Optional[str]) -> Optional[EndpointPolicy]:
+        return self._policies.get(rule)
+
+    def limits(self, rule: Optional[str], plan_type: str) -> Tuple[int, int]:
+        """(per minute, per day) for a plan on a route; plan defaults for unlisted routes"""
+        policy = self._policies.get(rule)
+        if policy is not None:
+            return policy.limits_for(plan_type)
+        return PLAN_LIMITS.get(plan_type) or PLAN_LIMITS['basic']
+
+    def windows(self, rule: Optional[str], plan_type: str) -> List[Tuple[Optional[str], int, int]]:
+        """(scope, per minute, per day) for each window a request on `rule` counts against
+
+        Every request counts against the key's plan-wide window (scope None). A route
+        with an override also gets its own window (scope = the route), so traffic on
+        other routes doesn't use up the override's allowance. Narrowest first.
+        """
+        per_minute, per_day = PLAN_LIMITS.get(plan_type) or PLAN_LIMITS['basic']
+        policy = self._policies.get(rule)
+        if policy is None or policy.rate_limit_override is None:
+            return [(None, per_minute, per_day)]
+        return [(policy.path, policy.rate_limit_override, per_day), (None, per_minute, per_day)]
+
+    def as_dict(self) -> Dict:
+        return {path: policy.as_dict() for path, policy in self._policies.items()}
+
+    def __len__(self) -> int:
+        return len(self._policies)
@@ -0,0 +1,66 @@
+"""
+Gunicorn Configuration for the Proxy Test Service
+=================================================
+
+One master, one worker process per core, state loaded once
+- preload_app: the master imports proxy-test-app (schema check, Redis ping, whitelist
+  snapshot) and freezes the GC before each fork, so workers share those pages copy-on-write
+- reuse_port: SO_REUSEPORT on the listener, so a new master (USR2 upgrade) can bind next to the old one
+- gthread workers: a fixed thread pool per worker, so pooled SQLite connections stay warm
+- post_fork re-arms per-process state (locks, background threads, instance ids) and sizes
+  admission control for the thread count; each worker stamps X-Request-Start as requests
+  join its thread pool, so admission control sees time spent waiting for a thread
+- on_starting empties PROMETHEUS_MULTIPROC_DIR (set in proxy-test.service, since this file
+  imports metrics at load time), so counters don't carry over from the last run
+- HUP respawns workers gracefully; TERM lets in-flight requests finish and flushes usage rows
+
+Run:  gunicorn -c gunicorn.conf.py proxy-test-app:app
+"""
+
+import gc
+import importlib
+import os
+
+from admission import stamp_gthread_queue
+from metrics import mark_process_dead, reset_multiprocess_dir
+
+bind = '127.0.0.1:9876'  # Behind the reverse proxy
+workers = os.cpu_count() or 1
+worker_class = 'gthread'
+threads = 8  # Concurrent requests per worker
+backlog = 4096
+keepalive = 5
+graceful_timeout = 30  # Seconds workers get to finish in-flight requests on TERM / HUP
+timeout = 30
+preload_app = True
+reuse_port = True
+
+def _proxy_app():
+    # Already imported by the master (preload_app); proxy-test-app.py isn't a valid module name
+    return importlib.import_module('proxy-test-app')
+
+def on_starting(server):
+    # A USR2 upgrade starts next to the old master's workers, which still write there
+    if not server.master_pid:
+        reset_multiprocess_dir()
+
+def pre_fork(server, worker):
+    # A fresh snapshot for the new worker, then keep the GC from touching shared pages
+    _proxy_app().whitelist_manager.reload_snapshot()
+    gc.collect()
+    gc.freeze()
+
+def post_fork(server, worker):
+    proxy_app = _proxy_app()
+    proxy_app.whitelist_manager.after_fork()
+    # At most `threads` requests are in flight per worker; the limit has to sit below that to shed
+    proxy_app.admission.after_fork(worker.cfg.threads)
+
+def post_worker_init(worker):
+    stamp_gthread_queue(worker)
+
+def worker_exit(server, worker):
+    _proxy_app().whitelist_manager.usage_writer.close()
+
+def child_exit(server, worker):
+    mark_process_dead(worker.pid)
@@ -0,0 +1,112 @@
+"""
+Prometheus Metrics
+==================
+
+Hot-path visibility for the whitelist and API-key gates
+- Request latency histograms per app, endpoint and plan
+- Whitelist lookups by source (denied cache, snapshot, Redis, SQLite) and result
+- Rate-limit rejections per plan, usage-queue depth
+- Load shedding per plan and each worker's admission limit
+- Multi-process aware: with PROMETHEUS_MULTIPROC_DIR set (before start-up; proxy-test.service
+  does), /metrics aggregates every gunicorn worker. gunicorn.conf.py empties the directory
+  when the master starts and marks dead workers
+- prometheus_client is optional; without it every metric is a no-op
+"""
+
+import glob
+import os
+
+from flask import Response
+
+try:
+    from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry,
+                                   Counter, Gauge, Histogram, generate_latest, multiprocess)
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+
+MULTIPROCESS = bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+# Pings are answered in well under a millisecond; keep resolution down there
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 10.0)
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, value):
+        pass
+
+    def inc(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+if PROMETHEUS_AVAILABLE:
+    REQUEST_LATENCY = Histogram(
+        'fastping_request_latency_seconds', 'Time spent in a gated request, gate included',
+        ['app', 'endpoint', 'plan'], buckets=LATENCY_BUCKETS)
+    WHITELIST_LOOKUPS = Counter(
+        'fastping_whitelist_lookups_total', 'Whitelist lookups by answering source and result',
+        ['source', 'result'])
+    RATE_LIMIT_REJECTIONS = Counter(
+        'fastping_rate_limit_rejections_total', 'Requests refused with 429',
+        ['app', 'plan'])
+    AUTH_REJECTIONS = Counter(
+        'fastping_auth_rejections_total', 'Requests refused before reaching the endpoint',
+        ['app', 'reason'])
+    USAGE_QUEUE_DEPTH = Gauge(
+        'fastping_usage_queue_depth', 'Usage rows waiting for the write-behind logger',
+        multiprocess_mode='livesum')
+    LOAD_SHED = Counter(
+        'fastping_load_shed_total', 'Requests refused with 503 by admission control',
+        ['app', 'plan'])
+    ADMISSION_LIMIT = Gauge(
+        'fastping_admission_limit', 'Current adaptive concurrency limit per worker',
+        ['app'], multiprocess_mode='liveall')
+else:
+    REQUEST_LATENCY = WHITELIST_LOOKUPS = RATE_LIMIT_REJECTIONS = _NoopMetric()
+    AUTH_REJECTIONS = USAGE_QUEUE_DEPTH = _NoopMetric()
+    LOAD_SHED = ADMISSION_LIMIT = _NoopMetric()
+
+def metrics_response() -> Response:
+    if not PROMETHEUS_AVAILABLE:
+        return Response(b'# prometheus_client is not installed\n', status=503, mimetype='text/plain')
+
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+def install_metrics_endpoint(app, refresh=None):
+    """Serve /metrics on this Flask app; `refresh` runs before each scrape. Once per app."""
+    if 'metrics' in app.extensions:
+        return
+    app.extensions['metrics'] = True
+
+    def metrics():
+        if refresh is not None:
+            refresh()
+        return metrics_response()
+
+    app.add_url_rule('/metrics', 'metrics', metrics)
+
+def mark_process_dead(pid: int):
+    """Drop a dead worker's live gauges from the multi-process directory"""
+    if PROMETHEUS_AVAILABLE and MULTIPROCESS:
+        multiprocess.mark_process_dead(pid)
+
+def reset_multiprocess_dir():
+    """Delete the previous run's metric files, which /metrics would otherwise keep summing"""
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, '*.db')):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -426,28 +426,13 @@ class CustomerStatusMonitor:
                     status = 'critical'
             
             # Check recent usage
-            conn = sqlite3.connect('customer_resources.db')
-            cursor = conn.cursor()
-            
-            # Check for recent activity (last 24 hours)
-            cursor.execute('''
-                SELECT COUNT(*) FROM usage_logs 
-                WHERE customer_id = ? AND timestamp > ?
-            ''', (customer_id, (datetime.now() - timedelta(hours=24)).isoformat()))
-            
-            recent_requests = cursor.fetchone()[0]
-            
-            # Check for high error rate
-            cursor.execute('''
-                SELECT 
-                    COUNT(*) as total,
-                    SUM(CASE WHEN success = 0 THEN 1 ELSE 0 END) as errors
-                FROM usage_logs 
-                WHERE customer_id = ? AND timestamp > ?
-            ''', (customer_id, (datetime.now() - timedelta(hours=24)).isoformat()))
+            # The database whose roll-ups the customer manager's compactor maintains
+            conn = sqlite3.connect(self.customer_manager.db_path)
             
-            usage_stats = cursor.fetchone()
-            total_requests, error_count = usage_stats or (0, 0)
+            # Recent activity and error rate (last 24 hours), from the minute roll-ups
+            usage = usage_summary(conn, customer_id, datetime.utcnow() - timedelta(hours=24))
+            recent_requests = usage['requests']
+            total_requests, error_count = usage['requests'], usage['errors']
             
             if total_requests > 0:
                 error_rate = error_count / total_requests
@@ -9,17 +9,34 @@ High-performance IP whitelisting + full proxy detection capabilities
 - Usage tracking for billing
 """
 
-from flask import Flask, request, jsonify, render_template_string, Response
+from flask import Flask, request, jsonify, render_template_string, Response, g
 from functools import wraps
 import redis
-import sqlite3
-import ipaddress
+import threading
 import time
+import uuid
 from datetime import datetime, timedelta
+import csv
+import io
 import json
-from typing import Optional, Dict, Any
+import math
+from typing import Optional, Dict, Any, Iterable, Iterator
 import orjson
 
+from admission import AdmissionController, overloaded_response, queue_wait_seconds
+from compression import install_compression
+from denied_cache import DeniedIPCache
+from metrics import (REQUEST_LATENCY, WHITELIST_LOOKUPS, RATE_LIMIT_REJECTIONS, AUTH_REJECTIONS,
+                     USAGE_QUEUE_DEPTH, install_metrics_endpoint)
+from rate_limiter import RedisRateLimiter, SharedTokenBucket, RateLimitResult, SLIDING_WINDOW, GCRA
+from request_context import RequestContext, parse_ip
+from response_templates import DENIED_TEMPLATE, PING_TEMPLATES
+from sqlite_pool import SQLitePool
+from timing_wheel import TimingWheel
+from usage_rollup import UsageCompactor
+from usage_writer import BatchWriter
+from whitelist_snapshot import WhitelistSnapshot, SNAPSHOT_QUERY, normalize_whitelist_entry, expiry_to_epoch
+
 app = Flask(__name__)
 print("Available routes:", [rule.rule for rule in app.url_map.iter_rules()])
 
@@ -28,6 +45,54 @@ REDIS_HOST = 'localhost'
 REDIS_PORT = 6379
 REDIS_DB = 0
 DB_PATH = 'whitelist.db'
+DB_MMAP_SIZE = 256 * 1024 * 1024  # Bytes of the database file memory-mapped per connection
+DB_CACHE_SIZE_KB = 64 * 1024  # SQLite page cache per connection
+DB_BUSY_TIMEOUT_MS = 5000
+DB_POOL_MAX_CONNECTIONS = 16  # Pooled SQLite connections per process; more callers wait for one
+SNAPSHOT_CHANNEL = 'whitelist:changes'  # Redis pub/sub channel for whitelist changes
+SNAPSHOT_REFRESH_SECONDS = 30  # Safety-net rebuild interval for missed notifications
+USAGE_QUEUE_SIZE = 50000  # Usage rows buffered before new ones are dropped
+USAGE_BATCH_SIZE = 500  # Rows per executemany transaction
+USAGE_FLUSH_INTERVAL_MS = 250  # Max time a usage row waits before being written
+RATE_LIMIT_WINDOW_SECONDS = 60
+# Limiter algorithm per plan: sliding_window smooths window edges, gcra spaces requests evenly
+RATE_LIMIT_MODES = {'basic': SLIDING_WINDOW, 'premium': SLIDING_WINDOW, 'enterprise': GCRA}
+SHARED_BUCKET_PATH = None  # mmap'd token-bucket table for the no-Redis path; None = /dev/shm default
+SHARED_BUCKET_SLOTS = 65536
+DENIED_CACHE_TTL_SECONDS = 10  # How long a denial is answered without any lookup
+DENIED_CACHE_MAX_ENTRIES = 100000
+DENIED_BLOOM_BITS = 8 * 1024 * 1024  # 1 MiB Bloom filter of denied IPs for log suppression; 0 disables
+DENIED_BLOOM_RESET_SECONDS = 3600  # A denied IP gets a fresh usage-log row at most once per reset
+EXPIRY_TICK_SECONDS = 1.0  # Resolution of proactive whitelist expiry
+COMPRESSION_MIN_BYTES = 1024  # Responses smaller than this (every ping) are never compressed
+PLAN_RATE_LIMITS = {'basic': 100, 'premium': 500, 'enterprise': 2000}  # Requests/minute by default
+BULK_MAX_ERRORS = 100  # Rejected rows reported back per bulk import
+BULK_PIPELINE_CHUNK = 1000  # Redis SETEX commands per pipeline round trip
+BULK_DEFAULT_EXPIRES_DAYS = 30
+BULK_MAX_EXPIRES_DAYS = 3650  # Longest expiry a bulk row may ask for
+BULK_MAX_RATE_LIMIT = 1000000  # Requests/minute
+EXPORT_BATCH_ROWS = 1000  # Rows fetched per fetchmany() while streaming an export
+BULK_CHANGE = '*'  # Change notification meaning "many entries changed"
+WARMUP_BATCH_ROWS = 1000  # Rows read and cached per batch during warm-up
+WARMUP_RETRY_SECONDS = 5  # Back-off before retrying a failed warm-up
+USAGE_ROLLUP_INTERVAL_SECONDS = 60  # How often raw usage rows are rolled into minute aggregates
+USAGE_RAW_RETENTION_DAYS = 7  # Raw usage rows older than this are deleted once rolled up
+USAGE_ROLLUP_RETENTION_DAYS = 400
+ADMISSION_INITIAL_LIMIT = 64  # Concurrent gated requests per worker before adapting (gunicorn resizes to its threads)
+ADMISSION_MAX_LIMIT = 1024
+ADMISSION_TARGET_LATENCY_MS = 50  # Gated latency (or queue wait) above this shrinks the concurrency limit
+ADMISSION_MAX_QUEUE_WAIT_MS = 500  # Requests queued longer than this are shed on arrival
+
+# Pre-bound label sets for the per-request counters
+SNAPSHOT_HITS = WHITELIST_LOOKUPS.labels('snapshot', 'hit')
+SNAPSHOT_MISSES = WHITELIST_LOOKUPS.labels('snapshot', 'miss')
+REDIS_HITS = WHITELIST_LOOKUPS.labels('redis', 'hit')
+REDIS_MISSES = WHITELIST_LOOKUPS.labels('redis', 'miss')
+SQLITE_HITS = WHITELIST_LOOKUPS.labels('sqlite', 'hit')
+SQLITE_MISSES = WHITELIST_LOOKUPS.labels('sqlite', 'miss')
+DENIED_CACHE_HITS = WHITELIST_LOOKUPS.labels('denied_cache', 'hit')
+NOT_WHITELISTED = AUTH_REJECTIONS.labels('proxy', 'not_whitelisted')
+ADMIN_NOT_LOCAL = AUTH_REJECTIONS.labels('proxy', 'admin_not_local')
 
 # Initialize Redis connection
 try:
@@ -38,79 +103,185 @@ except:
     REDIS_AVAILABLE = False
     print("⚠️ Redis not available - using database only")
 
+def _bulk_text(record: Dict[str, Any], field: str, required: bool = False) -> Optional[str]:
+    """A stripped string field; ints are accepted as their decimal text (JSON ids)"""
+    value = record.get(field)
+    if value is None or value == '':
+        if required:
+            raise ValueError(f'missing {field}')
+        return None
+    if isinstance(value, int) and not isinstance(value, bool):
+        value = str(value)
+    if not isinstance(value, str):
+        raise ValueError(f'{field} must be a string, got {type(value).__name__}')
+    value = value.strip()
+    if required and not value:
+        raise ValueError(f'{field} is empty')
+    return value or None
+
+def _bulk_number(record: Dict[str, Any], field: str) -> Optional[float]:
+    """A finite number from a JSON number or a numeric CSV string; None if absent"""
+    value = record.get(field)
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f'{field} must be a number, got {type(value).__name__}')
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f'{field} must be a number, got {value!r}') from None
+    if not math.isfinite(number):
+        raise ValueError(f'{field} must be finite')
+    return number
+
+def parse_bulk_record(record: Any, now: datetime) -> tuple:
+    """Validate one bulk-import row into an ip_whitelist insert tuple
+
+    Raises ValueError describing the first problem; the caller rejects just that row.
+    """
+    if not isinstance(record, dict):
+        raise ValueError('not a JSON object')
+    
+    ip_address = normalize_whitelist_entry(_bulk_text(record, 'ip_address', required=True))
+    customer_id = _bulk_text(record, 'customer_id', required=True)
+    
+    plan_type = _bulk_text(record, 'plan_type') or 'basic'
+    if plan_type not in PLAN_RATE_LIMITS:
+        raise ValueError(f'unknown plan_type {plan_type!r}')
+    
+    rate_limit = _bulk_number(record, 'rate_limit')
+    if rate_limit is None:
+        rate_limit = PLAN_RATE_LIMITS[plan_type]
+    elif not rate_limit.is_integer() or not 0 < rate_limit <= BULK_MAX_RATE_LIMIT:
+        raise ValueError(f'rate_limit must be a whole number from 1 to {BULK_MAX_RATE_LIMIT}')
+    
+    expires_days = _bulk_number(record, 'expires_days')
+    if expires_days is None:
+        expires_days = BULK_DEFAULT_EXPIRES_DAYS
+    elif not 0 < expires_days <= BULK_MAX_EXPIRES_DAYS:
+        raise ValueError(f'expires_days must be above 0 and at most {BULK_MAX_EXPIRES_DAYS}')
+    
+    notes = record.get('notes')
+    if notes is None:
+        notes = ''
+    elif isinstance(notes, (dict, list)):
+        notes = orjson.dumps(notes).decode()
+    elif not isinstance(notes, str):
+        notes = str(notes)
+    
+    return (ip_address, customer_id, plan_type, int(rate_limit),
+            now + timedelta(days=expires_days), notes)
+
 class IPWhitelistManager:
     def __init__(self):
+        self.db_pool = SQLitePool(DB_PATH, mmap_size=DB_MMAP_SIZE, cache_size_kb=DB_CACHE_SIZE_KB,
+                                  busy_timeout_ms=DB_BUSY_TIMEOUT_MS,
+                                  max_connections=DB_POOL_MAX_CONNECTIONS)
         self.init_database()
         self.cache_timeout = 300
+        self.snapshot: Optional[WhitelistSnapshot] = None
+        self._snapshot_lock = threading.Lock()
+        self._instance_id = uuid.uuid4().hex
+        self.usage_writer = BatchWriter(
+            DB_PATH,
+            '''
+                INSERT INTO usage_logs (ip_address, customer_id, endpoint, timestamp, response_time_ms, success)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''',
+            pool=self.db_pool,
+            max_queue=USAGE_QUEUE_SIZE,
+            batch_size=USAGE_BATCH_SIZE,
+            flush_interval_ms=USAGE_FLUSH_INTERVAL_MS,
+            name='usage-log-writer'
+        )
+        self.rate_limiter = None
+        if REDIS_AVAILABLE:
+            self.rate_limiter = RedisRateLimiter(redis_client, RATE_LIMIT_WINDOW_SECONDS,
+                                                 plan_modes=RATE_LIMIT_MODES)
+        self.local_rate_limiter = SharedTokenBucket(SHARED_BUCKET_PATH, SHARED_BUCKET_SLOTS,
+                                                    window_seconds=RATE_LIMIT_WINDOW_SECONDS)
+        self.denied_cache = DeniedIPCache(DENIED_CACHE_TTL_SECONDS, DENIED_CACHE_MAX_ENTRIES,
+                                          bloom_bits=DENIED_BLOOM_BITS,
+                                          bloom_reset_seconds=DENIED_BLOOM_RESET_SECONDS)
+        self.expiry_wheel = TimingWheel(EXPIRY_TICK_SECONDS)
+        # entry -> expires epoch as currently scheduled on the wheel
+        self._scheduled_expiries: Dict[str, int] = {}
+        # Not restarted after fork: under gunicorn --preload only the master compacts
+        self.usage_compactor = UsageCompactor(self.db_pool, USAGE_ROLLUP_INTERVAL_SECONDS,
+                                              USAGE_RAW_RETENTION_DAYS * 86400,
+                                              USAGE_ROLLUP_RETENTION_DAYS)
+        self.usage_compactor.start()
+        self.warmup = self._new_warmup_state()
+        self._warmup_lock = threading.Lock()
+        self.reload_snapshot()
+        self.start_snapshot_watcher()
+        self.start_expiry_wheel()
+        self.start_warm_up()
         
     def init_database(self):
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS ip_whitelist (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                ip_address TEXT UNIQUE NOT NULL,
-                customer_id TEXT NOT NULL,
-                plan_type TEXT DEFAULT 'basic',
-                rate_limit INTEGER DEFAULT 100,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                expires_at TIMESTAMP,
-                is_active BOOLEAN DEFAULT 1,
-                notes TEXT
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS usage_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                ip_address TEXT NOT NULL,
-                customer_id TEXT NOT NULL,
-                endpoint TEXT NOT NULL,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                response_time_ms REAL,
-                success BOOLEAN DEFAULT 1
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS rate_limits (
-                ip_address TEXT PRIMARY KEY,
-                requests_count INTEGER DEFAULT 0,
-                window_start TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        with self.db_pool.transaction() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS ip_whitelist (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    ip_address TEXT UNIQUE NOT NULL,
+                    customer_id TEXT NOT NULL,
+                    plan_type TEXT DEFAULT 'basic',
+                    rate_limit INTEGER DEFAULT 100,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    expires_at TIMESTAMP,
+                    is_active BOOLEAN DEFAULT 1,
+                    notes TEXT
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS usage_logs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    ip_address TEXT NOT NULL,
+                    customer_id TEXT NOT NULL,
+                    endpoint TEXT NOT NULL,
+                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    response_time_ms REAL,
+                    success BOOLEAN DEFAULT 1
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS rate_limits (
+                    ip_address TEXT PRIMARY KEY,
+                    requests_count INTEGER DEFAULT 0,
+                    window_start TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
         
     def add_ip(self, ip_address: str, customer_id: str, plan_type: str = 'basic', 
                rate_limit: int = 100, expires_days: int = 30, notes: str = '') -> bool:
         try:
-            ipaddress.ip_address(ip_address)
+            ip_address = normalize_whitelist_entry(ip_address)
             expires_at = datetime.now() + timedelta(days=expires_days)
             
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT OR REPLACE INTO ip_whitelist 
-                (ip_address, customer_id, plan_type, rate_limit, expires_at, notes)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (ip_address, customer_id, plan_type, rate_limit, expires_at, notes))
-            
-            conn.commit()
-            conn.close()
+            with self.db_pool.transaction() as conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO ip_whitelist 
+                    (ip_address, customer_id, plan_type, rate_limit, expires_at, notes)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (ip_address, customer_id, plan_type, rate_limit, expires_at, notes))
             
             if REDIS_AVAILABLE:
-                cache_key = f"whitelist:{ip_address}"
                 cache_data = {
                     'customer_id': customer_id,
                     'plan_type': plan_type,
                     'rate_limit': rate_limit,
-                    'expires_at': expires_at.isoformat()
+                    'expires_at': expires_at.isoformat(),
+                    'expires_ts': expiry_to_epoch(expires_at)
                 }
-                redis_client.setex(cache_key, self.cache_timeout, json.dumps(cache_data))
+                self._cache_entry(ip_address, cache_data)
+            
+            self.reload_snapshot()
+            self.denied_cache.invalidate(ip_address)
+            self.publish_change(ip_address)
                 
             return True
             
@@ -120,21 +291,329 @@ class IPWhitelistManager:
     
     def remove_ip(self, ip_address: str) -> bool:
         try:
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            cursor.execute('UPDATE ip_whitelist SET is_active = 0 WHERE ip_address = ?', (ip_address,))
-            conn.commit()
-            conn.close()
+            ip_address = normalize_whitelist_entry(ip_address)
+            with self.db_pool.transaction() as conn:
+                conn.execute('UPDATE ip_whitelist SET is_active = 0 WHERE ip_address = ?', (ip_address,))
             
             if REDIS_AVAILABLE:
                 redis_client.delete(f"whitelist:{ip_address}")
+            
+            self.reload_snapshot()
+            self.publish_change(ip_address)
                 
             return True
         except Exception as e:
             print(f"Error removing IP {ip_address}: {e}")
             return False
     
+    def _cache_entry(self, ip_address: str, data: Dict[str, Any]):
+        """Cache in Redis for cache_timeout, but never past the entry's own expiry"""
+        ttl = min(self.cache_timeout, int(data['expires_ts'] - time.time()))
+        if ttl > 0:
+            redis_client.setex(f"whitelist:{ip_address}", ttl, json.dumps(data))
+
+    def _cache_rows(self, rows) -> int:
+        """Cache (ip_address, customer_id, plan_type, rate_limit, expires_at, ...) rows
+        in one pipeline round trip; returns how many were still worth caching"""
+        pipe = redis_client.pipeline(transaction=False)
+        now = time.time()
+        cached = 0
+        for ip_address, customer_id, plan_type, rate_limit, expires_at, *_ in rows:
+            try:
+                expires_ts = expiry_to_epoch(expires_at)
+            except (TypeError, ValueError):
+                continue
+            ttl = min(self.cache_timeout, int(expires_ts - now))
+            if ttl <= 0:
+                continue
+            pipe.setex(f"whitelist:{ip_address}", ttl, json.dumps({
+                'customer_id': customer_id,
+                'plan_type': plan_type,
+                'rate_limit': rate_limit,
+                'expires_at': expires_at.isoformat() if isinstance(expires_at, datetime) else expires_at,
+                'expires_ts': expires_ts
+            }))
+            cached += 1
+        if cached:
+            pipe.execute()
+        return cached
+
+    @staticmethod
+    def _new_warmup_state() -> Dict[str, Any]:
+        return {'state': 'pending', 'ready': False, 'rows_total': 0, 'attempts': 0,
+                'started_at': None, 'finished_at': None, 'duration_seconds': None, 'error': None,
+                'redis_fill': {'state': 'pending', 'rows_loaded': 0, 'attempts': 0,
+                               'finished_at': None, 'error': None}}
+
+    @property
+    def is_ready(self) -> bool:
+        """True once the snapshot is loaded; Redis being down or unfilled doesn't take the service out"""
+        return self.warmup['ready']
+
+    def start_warm_up(self):
+        warmer = threading.Thread(target=self._run_warm_up, name='whitelist-warm-up', daemon=True)
+        warmer.start()
+
+    def _run_warm_up(self):
+        while not self.warm_up():
+            time.sleep(WARMUP_RETRY_SECONDS)
+
+    def warm_up(self) -> bool:
+        """Load every active, unexpired entry into the snapshot and Redis before taking traffic
+
+        Without this, the first request from each customer after a restart or a Redis
+        flush falls through to SQLite at the same moment. The snapshot is built first if
+        missing (one query); once it is in place the service is ready, since lookups are
+        served from it whether or not Redis is up. Redis is then filled WARMUP_BATCH_ROWS
+        rows per pipeline, tracked separately under warmup['redis_fill']. Returns False
+        if either step failed, so the caller retries; safe to re-run after a Redis flush.
+        """
+        with self._warmup_lock:
+            warmup = self.warmup
+            warmup.update(state='warming', started_at=time.time(),
+                          finished_at=None, duration_seconds=None, error=None)
+            warmup['attempts'] += 1
+            # Built synchronously at start-up; only retried here if that failed
+            if self.snapshot is None and not self.reload_snapshot():
+                warmup.update(state='failed', error='snapshot rebuild failed')
+                print("❌ Whitelist warm-up failed: snapshot rebuild failed")
+                return False
+
+            finished = time.time()
+            warmup.update(state='ready', ready=True, rows_total=len(self.snapshot), finished_at=finished,
+                          duration_seconds=round(finished - warmup['started_at'], 3))
+            return self._fill_redis()
+
+    def _fill_redis(self) -> bool:
+        """Copy every active, unexpired row into Redis; failures leave readiness alone"""
+        fill = self.warmup['redis_fill']
+        if not REDIS_AVAILABLE:
+            fill.update(state='skipped', error=None)
+            return True
+
+        started = time.time()
+        fill.update(state='filling', rows_loaded=0, finished_at=None, error=None)
+        fill['attempts'] += 1
+        try:
+            with self.db_pool.connection() as conn:
+                cursor = conn.execute(SNAPSHOT_QUERY)
+                try:
+                    while True:
+                        rows = cursor.fetchmany(WARMUP_BATCH_ROWS)
+                        if not rows:
+                            break
+                        fill['rows_loaded'] += self._cache_rows(rows)
+                finally:
+                    cursor.close()
+        except Exception as e:
+            fill.update(state='failed', error=str(e))
+            print(f"❌ Whitelist Redis fill failed: {e}")
+            return False
+
+        fill.update(state='filled', finished_at=time.time())
+        print(f"🔥 Whitelist warm-up: {fill['rows_loaded']} entries in {round(time.time() - started, 3)}s")
+        return True
+
+    def bulk_upsert(self, records: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """Validate and upsert many entries in one transaction, then fill Redis in pipelines
+        
+        `records` is validated as it streams in; the write transaction only opens once
+        every row has been read, so a slow upload never holds the database write lock.
+        Invalid rows are skipped and reported; the valid ones are written together.
+        """
+        now = datetime.now()
+        rows = []
+        errors = []
+        rejected = 0
+        
+        for number, record in enumerate(records, 1):
+            try:
+                rows.append(parse_bulk_record(record, now))
+            except (TypeError, ValueError, OverflowError) as e:
+                rejected += 1
+                if len(errors) < BULK_MAX_ERRORS:
+                    errors.append({'row': number, 'error': str(e)})
+        
+        if rows:
+            with self.db_pool.transaction() as conn:
+                conn.executemany('''
+                    INSERT OR REPLACE INTO ip_whitelist 
+                    (ip_address, customer_id, plan_type, rate_limit, expires_at, notes)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', rows)
+        
+        if rows and REDIS_AVAILABLE:
+            try:
+                for start in range(0, len(rows), BULK_PIPELINE_CHUNK):
+                    self._cache_rows(rows[start:start + BULK_PIPELINE_CHUNK])
+            except redis.RedisError as e:
+                print(f"Error filling Redis after bulk import: {e}")
+        
+        imported = len(rows)
+        if imported:
+            self.reload_snapshot()
+            self.denied_cache.clear()
+            self.publish_change(BULK_CHANGE)
+        
+        return {'imported': imported, 'rejected': rejected, 'errors': errors}
+    
+    def iter_whitelist(self, batch_size: int = EXPORT_BATCH_ROWS) -> Iterator[tuple]:
+        """Every ip_whitelist row, fetched batch_size at a time
+        
+        Holds one pooled connection until the iteration finishes or is closed.
+        """
+        with self.db_pool.connection() as conn:
+            cursor = conn.execute('''
+                SELECT ip_address, customer_id, plan_type, rate_limit, created_at, expires_at, is_active, notes
+                FROM ip_whitelist ORDER BY id
+            ''')
+            try:
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        return
+                    yield from rows
+            finally:
+                cursor.close()
+    
+    def reload_snapshot(self) -> bool:
+        """Rebuild the in-process whitelist snapshot and swap it in atomically"""
+        with self._snapshot_lock:
+            try:
+                with self.db_pool.connection() as conn:
+                    snapshot = WhitelistSnapshot.from_connection(conn)
+            except Exception as e:
+                print(f"Error rebuilding whitelist snapshot: {e}")
+                return False
+            
+            self.snapshot = snapshot
+            self._schedule_expirations(snapshot)
+            return True
+    
+    def _schedule_expirations(self, snapshot: WhitelistSnapshot):
+        """Bring the timing wheel in line with a new snapshot, touching only changed entries"""
+        offset = time.monotonic() - time.time()
+        previous = self._scheduled_expiries
+        current = dict(snapshot.expirations())
+        for entry in previous.keys() - current.keys():
+            self.expiry_wheel.cancel(entry)
+        self.expiry_wheel.schedule_many((entry, expires_ts + offset)
+                                        for entry, expires_ts in current.items()
+                                        if previous.get(entry) != expires_ts)
+        self._scheduled_expiries = current
+    
+    def start_expiry_wheel(self):
+        ticker = threading.Thread(target=self._run_expiry_wheel,
+                                  name='whitelist-expiry-wheel', daemon=True)
+        ticker.start()
+    
+    def _run_expiry_wheel(self):
+        while True:
+            time.sleep(EXPIRY_TICK_SECONDS)
+            try:
+                expired = self.expiry_wheel.advance()
+                if expired:
+                    self.evict_expired(expired)
+            except Exception as e:
+                print(f"Whitelist expiry error: {e}")
+    
+    def evict_expired(self, entries):
+        """Drop entries that just hit their deadline from Redis
+        
+        The snapshot needs no rebuild: its lookups already refuse entries past expires_ts.
+        """
+        if REDIS_AVAILABLE:
+            pipe = redis_client.pipeline(transaction=False)
+            for entry in entries:
+                pipe.delete(f"whitelist:{entry}")
+            pipe.execute()
+        
+        print(f"⏰ Expired {len(entries)} whitelist entries")
+    
+    def publish_change(self, ip_address: str):
+        """Tell every other worker to rebuild its snapshot"""
+        if not REDIS_AVAILABLE:
+            return
+        try:
+            redis_client.publish(SNAPSHOT_CHANNEL, f"{self._instance_id}:{ip_address}")
+        except Exception as e:
+            print(f"Error publishing whitelist change for {ip_address}: {e}")
+    
+    def start_snapshot_watcher(self):
+        watcher = threading.Thread(target=self._watch_snapshot_changes,
+                                   name='whitelist-snapshot-watcher', daemon=True)
+        watcher.start()
+    
+    def after_fork(self):
+        """Re-arm per-process state in a freshly forked worker
+        
+        Threads don't survive fork() and any lock a parent thread held would stay
+        held forever, so locks are replaced and the background threads restarted.
+        Each worker also gets its own instance id, so siblings don't ignore each
+        other's change notifications.
+        """
+        self._snapshot_lock = threading.Lock()
+        self._warmup_lock = threading.Lock()
+        self._instance_id = uuid.uuid4().hex
+        self.denied_cache = DeniedIPCache(DENIED_CACHE_TTL_SECONDS, DENIED_CACHE_MAX_ENTRIES,
+                                          bloom_bits=DENIED_BLOOM_BITS,
+                                          bloom_reset_seconds=DENIED_BLOOM_RESET_SECONDS)
+        self.expiry_wheel = TimingWheel(EXPIRY_TICK_SECONDS)
+        self._scheduled_expiries = {}
+        if self.snapshot is not None:
+            self._schedule_expirations(self.snapshot)
+        self.start_snapshot_watcher()
+        self.start_expiry_wheel()
+        # Forked before the parent finished warming: finish the job here (the
+        # parent's warm-up thread didn't come along)
+        if not self.is_ready:
+            self.warmup = self._new_warmup_state()
+            self.start_warm_up()
+        elif self.warmup['redis_fill']['state'] not in ('filled', 'skipped'):
+            self.start_warm_up()
+    
+    def _watch_snapshot_changes(self):
+        """Rebuild on Redis change notifications, and periodically as a safety net"""
+        while True:
+            if not REDIS_AVAILABLE:
+                time.sleep(SNAPSHOT_REFRESH_SECONDS)
+                self.reload_snapshot()
+                continue
+            
+            try:
+                pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(SNAPSHOT_CHANNEL)
+                last_reload = time.time()
+                
+                while True:
+                    message = pubsub.get_message(timeout=SNAPSHOT_REFRESH_SECONDS)
+                    if message and not str(message['data']).startswith(self._instance_id):
+                        self.reload_snapshot()
+                        entry = str(message['data']).split(':', 1)[-1]
+                        if entry == BULK_CHANGE:
+                            self.denied_cache.clear()
+                        else:
+                            self.denied_cache.invalidate(entry)
+                        last_reload = time.time()
+                    elif time.time() - last_reload >= SNAPSHOT_REFRESH_SECONDS:
+                        self.reload_snapshot()
+                        last_reload = time.time()
+            except Exception as e:
+                print(f"Whitelist snapshot watcher error: {e}")
+                time.sleep(SNAPSHOT_REFRESH_SECONDS)
+                self.reload_snapshot()
+    
     def is_ip_allowed(self, ip_address: str) -> tuple[bool, Optional[Dict[str, Any]]]:
+        # In-process snapshot is authoritative once built
+        snapshot = self.snapshot
+        if snapshot is not None:
+            data = snapshot.lookup(ip_address)
+            if data is not None:
+                SNAPSHOT_HITS.inc()
+                return True, data
+            SNAPSHOT_MISSES.inc()
+            return False, None
+        
         # Redis cache check first
         if REDIS_AVAILABLE:
             cache_key = f"whitelist:{ip_address}"
@@ -142,141 +621,88 @@ class IPWhitelistManager:
             if cached_data:
                 try:
                     data = json.loads(cached_data)
-                    if datetime.fromisoformat(data['expires_at']) > datetime.now():
+                    # Entries cached before expires_ts existed fall through to the database
+                    if data.get('expires_ts', 0) > time.time():
+                        REDIS_HITS.inc()
                         return True, data
                 except:
                     pass
+            REDIS_MISSES.inc()
         
         # Database fallback
         try:
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT customer_id, plan_type, rate_limit, expires_at 
-                FROM ip_whitelist 
-                WHERE ip_address = ? AND is_active = 1
-            ''', (ip_address,))
-            
-            result = cursor.fetchone()
-            conn.close()
+            with self.db_pool.connection() as conn:
+                result = conn.execute('''
+                    SELECT customer_id, plan_type, rate_limit, expires_at 
+                    FROM ip_whitelist 
+                    WHERE ip_address = ? AND is_active = 1
+                ''', (ip_address,)).fetchone()
             
             if result:
                 customer_id, plan_type, rate_limit, expires_at = result
-                expires_dt = datetime.fromisoformat(expires_at)
+                expires_ts = expiry_to_epoch(expires_at)
                 
-                if expires_dt > datetime.now():
+                if expires_ts > time.time():
                     data = {
                         'customer_id': customer_id,
                         'plan_type': plan_type,
                         'rate_limit': rate_limit,
-                        'expires_at': expires_at
+                        'expires_at': expires_at,
+                        'expires_ts': expires_ts
                     }
                     
                     if REDIS_AVAILABLE:
-                        cache_key = f"whitelist:{ip_address}"
-                        redis_client.setex(cache_key, self.cache_timeout, json.dumps(data))
+                        self._cache_entry(ip_address, data)
                     
+                    SQLITE_HITS.inc()
                     return True, data
                     
+            SQLITE_MISSES.inc()
             return False, None
             
         except Exception as e:
             print(f"Error checking IP {ip_address}: {e}")
             return False, None
     
-    def check_rate_limit(self, ip_address: str, rate_limit: int) -> bool:
-        window_duration = 60
+    def check_rate_limit(self, ip_address: str, rate_limit: int, plan_type: str = 'basic') -> bool:
+        return self.rate_limit_status(ip_address, rate_limit, plan_type).allowed
+    
+    def rate_limit_status(self, ip_address: str, rate_limit: int,
+                          plan_type: str = 'basic') -> RateLimitResult:
+        """Count this request against the IP's limit and report what's left"""
+        if self.rate_limiter is not None:
+            try:
+                return self.rate_limiter.check(ip_address, rate_limit, plan_type)
+            except redis.RedisError as e:
+                print(f"Redis rate limit check failed for {ip_address}, using local buckets: {e}")
         
-        if REDIS_AVAILABLE:
-            key = f"rate_limit:{ip_address}"
-            current_count = redis_client.incr(key)
-            if current_count == 1:
-                redis_client.expire(key, window_duration)
-            return current_count <= rate_limit
-        else:
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT requests_count, window_start FROM rate_limits WHERE ip_address = ?
-            ''', (ip_address,))
-            
-            result = cursor.fetchone()
-            
-            if result:
-                count, window_start = result
-                window_start_dt = datetime.fromisoformat(window_start)
-                
-                if datetime.now() - window_start_dt > timedelta(seconds=window_duration):
-                    cursor.execute('''
-                        UPDATE rate_limits SET requests_count = 1, window_start = CURRENT_TIMESTAMP
-                        WHERE ip_address = ?
-                    ''', (ip_address,))
-                    count = 1
-                else:
-                    cursor.execute('''
-                        UPDATE rate_limits SET requests_count = requests_count + 1
-                        WHERE ip_address = ?
-                    ''', (ip_address,))
-                    count += 1
-            else:
-                cursor.execute('''
-                    INSERT INTO rate_limits (ip_address, requests_count)
-                    VALUES (?, 1)
-                ''', (ip_address,))
-                count = 1
-            
-            conn.commit()
-            conn.close()
-            return count <= rate_limit
+        return self.local_rate_limiter.check(ip_address, rate_limit, plan_type)
     
     def log_usage(self, ip_address: str, customer_id: str, endpoint: str, 
                   response_time_ms: float, success: bool = True):
-        try:
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO usage_logs (ip_address, customer_id, endpoint, response_time_ms, success)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (ip_address, customer_id, endpoint, response_time_ms, success))
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            print(f"Error logging usage: {e}")
+        """Queue a usage row; the background writer batches it into SQLite"""
+        # Same format as SQLite's CURRENT_TIMESTAMP, captured now rather than at flush time
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+        self.usage_writer.submit((ip_address, customer_id, endpoint, timestamp,
+                                  response_time_ms, success))
+        USAGE_QUEUE_DEPTH.set(self.usage_writer.queue_depth)
 
 # Initialize whitelist manager
 whitelist_manager = IPWhitelistManager()
 
-# Proxy detection functions
-def get_client_ip(req):
-    """Get real client IP considering proxy headers"""
-    x_forwarded_for = req.headers.get('X-Forwarded-For')
-    if x_forwarded_for:
-        ips = [ip.strip() for ip in x_forwarded_for.split(',')]
-        for ip_str in ips:
-            try:
-                ip_obj = ipaddress.ip_address(ip_str)
-                if not ip_obj.is_private:
-                    return ip_str
-            except ValueError:
-                continue
-        return ips[0] if ips else req.remote_addr
-    return req.remote_addr
+# Negotiated gzip/zstd for large echo responses
+install_compression(app, COMPRESSION_MIN_BYTES)
 
-def determine_anonymity(req, proxy_ip):
-    """Determine proxy anonymity level"""
-    via_header = req.headers.get('Via')
-    x_forwarded_for = req.headers.get('X-Forwarded-For')
-    connecting_ip = req.remote_addr
+# Prometheus scrape endpoint (aggregates all workers when PROMETHEUS_MULTIPROC_DIR is set)
+install_metrics_endpoint(app, refresh=lambda: USAGE_QUEUE_DEPTH.set(whitelist_manager.usage_writer.queue_depth))
 
-    if via_header or (x_forwarded_for and x_forwarded_for != connecting_ip):
-        return "transparent"
-    
-    if proxy_ip and connecting_ip != proxy_ip:
-        return "anonymous"
-    
-    return "elite"
+# Proxy detection functions
+def request_context() -> RequestContext:
+    """This request's parsed forwarding headers, built once and kept on flask.g"""
+    ctx = g.get('client_context')
+    if ctx is None:
+        ctx = g.client_context = RequestContext(request.headers, request.remote_addr)
+    return ctx
 
 def determine_speed(latency_ms):
     """Determine proxy speed from latency"""
@@ -287,48 +713,111 @@ def determine_speed(latency_ms):
     else:
         return "slow"
 
+# A full content_type skips Werkzeug's mimetype -> content-type resolution.
+JSON_CONTENT_TYPE = 'application/json'
+
+# Per-worker load shedding for the gated endpoints
+admission = AdmissionController('proxy', ADMISSION_INITIAL_LIMIT, max_limit=ADMISSION_MAX_LIMIT,
+                                target_latency_ms=ADMISSION_TARGET_LATENCY_MS,
+                                max_queue_wait_ms=ADMISSION_MAX_QUEUE_WAIT_MS)
+
 def require_whitelisted_ip(f):
     """Decorator for IP whitelisting with minimal overhead"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
+        # Overloaded, or queued too long already: refuse before any lookup
+        if not admission.acquire(queue_wait_seconds(request.headers.get('X-Request-Start'))):
+            return overloaded_response()
+        try:
+            return gated(*args, **kwargs)
+        finally:
+            admission.release()
+    
+    def gated(*args, **kwargs):
         start_time = time.time()
-        client_ip = request.headers.get('X-Forwarded-For', request.remote_addr)
+        client_ip = request_context().whitelist_ip
         
-        if ',' in client_ip:
-            client_ip = client_ip.split(',')[0].strip()
+        # Recently denied: answer before touching any datastore, and don't log it again
+        if whitelist_manager.denied_cache.is_denied(client_ip):
+            DENIED_CACHE_HITS.inc()
+            NOT_WHITELISTED.inc()
+            return Response(DENIED_TEMPLATE.render_one(client_ip), status=403,
+                            content_type=JSON_CONTENT_TYPE)
         
         is_allowed, client_data = whitelist_manager.is_ip_allowed(client_ip)
         
         if not is_allowed:
-            whitelist_manager.log_usage(client_ip, 'unknown', request.endpoint, 
-                                      (time.time() - start_time) * 1000, False)
-            return Response(orjson.dumps({
-                'error': 'Access denied',
-                'message': 'IP not whitelisted for paid service',
-                'ip': client_ip,
-                'contact': 'sales@yourservice.com'
-            }), status=403, mimetype='application/json')
+            NOT_WHITELISTED.inc()
+            if whitelist_manager.denied_cache.add(client_ip):
+                whitelist_manager.log_usage(client_ip, 'unknown', request.endpoint, 
+                                          (time.time() - start_time) * 1000, False)
+            REQUEST_LATENCY.labels('proxy', request.endpoint, 'none').observe(time.time() - start_time)
+            return Response(DENIED_TEMPLATE.render_one(client_ip), status=403,
+                            content_type=JSON_CONTENT_TYPE)
         
-        if not whitelist_manager.check_rate_limit(client_ip, client_data['rate_limit']):
+        # Lower plans shed first, still before the Redis rate limiter
+        if not admission.allows(client_data['plan_type']):
+            return overloaded_response()
+        
+        rate_status = whitelist_manager.rate_limit_status(client_ip, client_data['rate_limit'],
+                                                          client_data['plan_type'])
+        if not rate_status.allowed:
+            RATE_LIMIT_REJECTIONS.labels('proxy', client_data['plan_type']).inc()
+            elapsed = time.time() - start_time
+            REQUEST_LATENCY.labels('proxy', request.endpoint, client_data['plan_type']).observe(elapsed)
             whitelist_manager.log_usage(client_ip, client_data['customer_id'], 
-                                      request.endpoint, (time.time() - start_time) * 1000, False)
-            return Response(orjson.dumps({
+                                      request.endpoint, elapsed * 1000, False)
+            response = Response(orjson.dumps({
                 'error': 'Rate limit exceeded',
                 'message': f"Rate limit: {client_data['rate_limit']} requests/minute",
                 'plan': client_data['plan_type']
             }), status=429, mimetype='application/json')
+            response.headers.update(rate_status.headers())
+            response.headers['Retry-After'] = str(max(1, round(rate_status.reset_seconds)))
+            return response
         
         result = f(*args, **kwargs)
         
-        response_time = (time.time() - start_time) * 1000
+        elapsed = time.time() - start_time
+        admission.observe(elapsed)
+        REQUEST_LATENCY.labels('proxy', request.endpoint, client_data['plan_type']).observe(elapsed)
         whitelist_manager.log_usage(client_ip, client_data['customer_id'], 
-                                  request.endpoint, response_time, True)
+                                  request.endpoint, elapsed * 1000, True)
+        
+        if hasattr(result, 'headers'):
+            result.headers.update(rate_status.headers())
         
         return result
     
     return decorated_function
 
 # Main proxy test endpoint - ultra-fast with full detection
+# Fields echoed by the catch-all endpoint, in response order. Callers can ask for a
+# subset with ?fields=a,b or an X-Fields header; only requested fields are computed.
+ECHO_FIELDS = (
+    "status", "message", "received_path", "method", "headers_received",
+    "connecting_ip", "client_ip_from_headers", "anonymity_level",
+    "server_processing_latency_ms", "speed_hint", "args", "form", "json_body"
+)
+ECHO_MAX_BODY_BYTES = 64 * 1024  # Larger (or unsized) bodies are never buffered for echoing
+
+def parse_echo_fields(selector: Optional[str]):
+    """Requested echo fields in response order; None means all, [] means none were valid"""
+    if not selector:
+        return None
+    requested = {name.strip() for name in selector.split(',')}
+    return [name for name in ECHO_FIELDS if name in requested]
+
+def echo_body_allowed(content_length: Optional[int]) -> bool:
+    return content_length is not None and content_length <= ECHO_MAX_BODY_BYTES
+
+def unknown_fields_response(selector: str) -> Dict[str, Any]:
+    return {
+        'error': 'No known fields requested',
+        'requested': selector,
+        'available': list(ECHO_FIELDS)
+    }
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 @require_whitelisted_ip
@@ -336,41 +825,47 @@ def proxy_test_endpoint(path):
     """Ultra-fast proxy testing endpoint with complete analysis"""
     start_time = time.time()
 
-    connecting_ip = request.remote_addr
-    client_ip_from_headers = get_client_ip(request)
+    ctx = request_context()
+    selector = request.args.get('fields') or request.headers.get('X-Fields')
+    fields = parse_echo_fields(selector)
+    if fields == []:
+        return Response(orjson.dumps(unknown_fields_response(selector)), status=400,
+                        mimetype='application/json')
+
+    connecting_ip = ctx.remote_addr
+    client_ip_from_headers = ctx.client_ip
     server_processing_latency_ms = (time.time() - start_time) * 1000
-    anonymity_level = determine_anonymity(request, connecting_ip)
-    
-    response_data = {
-        "status": "success",
-        "message": "Premium proxy test endpoint active",
-        "received_path": f"/{path}",
-        "method": request.method,
-        "headers_received": dict(request.headers),
-        "connecting_ip": connecting_ip,
-        "client_ip_from_headers": client_ip_from_headers,
-        "anonymity_level": anonymity_level,
-        "server_processing_latency_ms": server_processing_latency_ms,
-        "speed_hint": determine_speed(server_processing_latency_ms),
-        "args": dict(request.args),
-        "form": dict(request.form),
-        "json_body": request.json if request.is_json else None
+    
+    getters = {
+        "status": lambda: "success",
+        "message": lambda: "Premium proxy test endpoint active",
+        "received_path": lambda: f"/{path}",
+        "method": lambda: request.method,
+        "headers_received": lambda: dict(request.headers),
+        "connecting_ip": lambda: connecting_ip,
+        "client_ip_from_headers": lambda: client_ip_from_headers,
+        "anonymity_level": lambda: ctx.anonymity(connecting_ip),
+        "server_processing_latency_ms": lambda: server_processing_latency_ms,
+        "speed_hint": lambda: determine_speed(server_processing_latency_ms),
+        "args": lambda: dict(request.args),
+        # Bodies are only read (and parsed) when echoed and small enough
+        "form": lambda: dict(request.form) if echo_body_allowed(request.content_length) else {},
+        "json_body": lambda: (request.json if request.is_json and echo_body_allowed(request.content_length)
+                              else None)
     }
+    response_data = {name: getters[name]() for name in (fields or ECHO_FIELDS)}
     
     return Response(orjson.dumps(response_data), mimetype='application/json')
 
 # Dedicated ping endpoints for different use cases
+# /ping bodies are pre-encoded (response_templates); only the client IP is serialized per request.
 @app.route("/ping", methods=["GET"])
 @require_whitelisted_ip
 def ping():
     """Ultra-fast ping endpoint"""
-    payload = {
-        "anonymity_level": determine_anonymity(request, request.remote_addr),
-        "client_ip_from_headers": get_client_ip(request),
-        "message": "Premium proxy test endpoint active",
-        "status": "success"
-    }
-    return Response(orjson.dumps(payload), mimetype='application/json')
+    ctx = request_context()
+    template = PING_TEMPLATES[ctx.anonymity(ctx.remote_addr)]
+    return Response(template.render_one(ctx.client_ip), content_type=JSON_CONTENT_TYPE)
 
 @app.route('/health')
 @require_whitelisted_ip  
@@ -384,7 +879,25 @@ def health():
 @app.route('/fast-ping')
 @require_whitelisted_ip
 def fast_ping():
-    return Response(orjson.dumps({'pong': time.time()}), mimetype='application/json')
+    # Too small for a template to beat orjson
+    return Response(orjson.dumps({'pong': time.time()}), content_type=JSON_CONTENT_TYPE)
+
+NOT_FOUND_BODY = b'{"error":"Not found"}'
+
+def local_admin_only(f):
+    """Operator endpoint: direct loopback callers only, anyone else gets a 404
+
+    The reverse proxy connects from loopback too, so a request carrying forwarding
+    headers was relayed from outside and is refused like a remote one.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        peer = parse_ip(request.remote_addr or '')
+        if peer is None or not peer.is_loopback or request_context().hops:
+            ADMIN_NOT_LOCAL.inc()
+            return Response(NOT_FOUND_BODY, status=404, content_type=JSON_CONTENT_TYPE)
+        return f(*args, **kwargs)
+    return decorated_function
 
 # Admin interface
 @app.route('/admin/whitelist')
@@ -398,7 +911,7 @@ def admin_whitelist():
         
         <h2>Add New IP</h2>
         <form action="/admin/add_ip" method="post">
-            <input type="text" name="ip_address" placeholder="IP Address" required><br><br>
+            <input type="text" name="ip_address" placeholder="IP Address or CIDR (e.g. 203.0.113.0/24)" required><br><br>
             <input type="text" name="customer_id" placeholder="Customer ID" required><br><br>
             <select name="plan_type">
                 <option value="basic">Basic (100/min)</option>
@@ -412,7 +925,7 @@ def admin_whitelist():
         
         <h2>Remove IP</h2>
         <form action="/admin/remove_ip" method="post">
-            <input type="text" name="ip_address" placeholder="IP Address" required><br><br>
+            <input type="text" name="ip_address" placeholder="IP Address or CIDR" required><br><br>
             <button type="submit">Remove IP</button>
         </form>
     </body>
@@ -428,8 +941,12 @@ def admin_add_ip():
     expires_days = int(request.form.get('expires_days', 30))
     notes = request.form.get('notes', '')
     
-    rate_limits = {'basic': 100, 'premium': 500, 'enterprise': 2000}
-    rate_limit = rate_limits.get(plan_type, 100)
+    rate_limit = PLAN_RATE_LIMITS.get(plan_type, 100)
+    
+    try:
+        ip_address = normalize_whitelist_entry(ip_address or '')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Invalid IP address or network: {e}'}), 400
     
     success = whitelist_manager.add_ip(ip_address, customer_id, plan_type, 
                                      rate_limit, expires_days, notes)
@@ -449,6 +966,103 @@ def admin_remove_ip():
     else:
         return jsonify({'success': False, 'message': 'Failed to remove IP'}), 400
 
+EXPORT_COLUMNS = ('ip_address', 'customer_id', 'plan_type', 'rate_limit',
+                  'created_at', 'expires_at', 'is_active', 'notes')
+
+def _stream_lines():
+    """Decoded lines of the request body, read incrementally"""
+    for line in request.stream:
+        yield line.decode('utf-8-sig') if isinstance(line, bytes) else line
+
+@app.route('/admin/bulk_import', methods=['POST'])
+@local_admin_only
+def admin_bulk_import():
+    """Streamed CSV (header row) or NDJSON upload of whitelist entries
+    
+    Columns / keys: ip_address, customer_id, plan_type, rate_limit, expires_days, notes
+    """
+    fmt = request.args.get('format') or ('ndjson' if 'json' in (request.mimetype or '') else 'csv')
+    
+    if fmt == 'ndjson':
+        def records():
+            for line in _stream_lines():
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    # Rejected (and counted) by validation like any other bad row
+                    yield None
+    elif fmt == 'csv':
+        records = lambda: csv.DictReader(_stream_lines())
+    else:
+        return jsonify({'success': False, 'message': f'Unknown format {fmt!r}; use csv or ndjson'}), 400
+    
+    try:
+        result = whitelist_manager.bulk_upsert(records())
+    except Exception as e:
+        print(f"Error during bulk import: {e}")
+        return jsonify({'success': False, 'message': 'Bulk import failed, nothing was written'}), 500
+    
+    return Response(orjson.dumps({'success': True, **result}), mimetype='application/json')
+
+@app.route('/admin/export')
+@local_admin_only
+def admin_export():
+    """Stream the whole whitelist as NDJSON (default) or CSV without buffering it"""
+    fmt = 'csv' if request.args.get('format') == 'csv' else 'ndjson'
+    
+    if fmt == 'csv':
+        def generate():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_COLUMNS)
+            for row in whitelist_manager.iter_whitelist():
+                writer.writerow(row)
+                if buffer.tell() >= 64 * 1024:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+        mimetype = 'text/csv'
+    else:
+        def generate():
+            for row in whitelist_manager.iter_whitelist():
+                yield orjson.dumps(dict(zip(EXPORT_COLUMNS, row))) + b'\n'
+        mimetype = 'application/x-ndjson'
+    
+    response = Response(generate(), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=whitelist.{fmt}'
+    return response
+
+@app.route('/admin/stats')
+@local_admin_only
+def admin_stats():
+    return Response(orjson.dumps({
+        'usage_writer': whitelist_manager.usage_writer.stats(),
+        'db_pool': whitelist_manager.db_pool.stats(),
+        'denied_cache': whitelist_manager.denied_cache.stats(),
+        'expiry_wheel': {'scheduled': len(whitelist_manager.expiry_wheel)},
+        'warmup': whitelist_manager.warmup,
+        'usage_rollup': whitelist_manager.usage_compactor.stats(),
+        'admission': admission.stats()
+    }), mimetype='application/json')
+
+@app.route('/admin/warm_up', methods=['POST'])
+@local_admin_only
+def admin_warm_up():
+    """Re-run the cache warm-up, e.g. after a Redis flush"""
+    if not whitelist_manager.warm_up():
+        return Response(orjson.dumps(whitelist_manager.warmup), status=500, mimetype='application/json')
+    return Response(orjson.dumps(whitelist_manager.warmup), mimetype='application/json')
+
+# Readiness probe (no whitelist): 503 until the whitelist snapshot is loaded
+@app.route('/ready')
+def ready():
+    return Response(orjson.dumps(whitelist_manager.warmup),
+                    status=200 if whitelist_manager.is_ready else 503, mimetype='application/json')
+
 # Public status endpoint (no whitelist)
 @app.route('/status')
 def status():
@@ -0,0 +1,436 @@
+"""
+Atomic Rate Limiters
+====================
+
+One round trip per check, no INCR/EXPIRE race
+- Redis server-side scripts (sliding window or GCRA), chosen per plan
+- Dual-window script for API keys: sliding minute and calendar (UTC) day in one call
+- Every check returns allowed / remaining / reset for X-RateLimit headers
+- Shared-memory tables for when Redis is down (one per host): token buckets, and the
+  dual-window counters with the script's exact arithmetic
+"""
+
+import hashlib
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import NamedTuple, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: buckets stay per-process
+    fcntl = None
+
+SLIDING_WINDOW = 'sliding_window'
+GCRA = 'gcra'
+
+# Weighted two-window counter: previous window's count decays linearly as the
+# current window progresses, so there is no 2x burst at the boundary.
+# KEYS[1] = hash key, ARGV[1] = limit, ARGV[2] = window in ms
+# Returns {allowed, remaining, reset_ms}
+SLIDING_WINDOW_SCRIPT = """
+if redis.replicate_commands then redis.replicate_commands() end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local start = now - (now % window)
+
+local data = redis.call('HMGET', KEYS[1], 'w', 'c', 'p')
+local w = tonumber(data[1]) or start
+local c = tonumber(data[2]) or 0
+local p = tonumber(data[3]) or 0
+if w ~= start then
+    if w == start - window then p = c else p = 0 end
+    c = 0
+    w = start
+end
+
+local elapsed = now - start
+local estimated = p * (window - elapsed) / window + c
+local allowed = 1
+local reset = window - elapsed
+
+if estimated + 1 > limit then
+    allowed = 0
+    if p > 0 then
+        local decay = math.ceil((estimated + 1 - limit) * window / p)
+        if decay < reset then reset = decay end
+    end
+else
+    c = c + 1
+    estimated = estimated + 1
+end
+
+redis.call('HSET', KEYS[1], 'w', w, 'c', c, 'p', p)
+redis.call('PEXPIRE', KEYS[1], window * 2)
+
+local remaining = math.floor(limit - estimated)
+if remaining < 0 then remaining = 0 end
+return {allowed, remaining, reset}
+"""
+
+# Generic cell rate algorithm: stores only the theoretical arrival time (TAT).
+# KEYS[1] = TAT key, ARGV[1] = limit, ARGV[2] = period in ms, ARGV[3] = burst
+# Returns {allowed, remaining, reset_ms}; reset is retry-after when denied
+GCRA_SCRIPT = """
+if redis.replicate_commands then redis.replicate_commands() end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + tonumber(t[2]) / 1000
+local limit = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local emission = period / limit
+local tolerance = emission * burst
+
+local tat = tonumber(redis.call('GET', KEYS[1]) or '0')
+if tat < now then tat = now end
+local new_tat = tat + emission
+local allow_at = new_tat - tolerance
+
+if now < allow_at then
+    return {0, 0, math.ceil(allow_at - now)}
+end
+
+local ttl = math.ceil(new_tat - now)
+redis.call('SET', KEYS[1], string.format('%.3f', new_tat), 'PX', ttl)
+return {1, math.floor((now - allow_at) / emission), ttl}
+"""
+
+# Per-minute (sliding, as above) and per-day (fixed UTC day) limits in one hash.
+# Nothing is counted unless both windows have room.
+# KEYS[1] = hash key, ARGV[1] = per-minute limit, ARGV[2] = per-day limit
+# Returns {allowed, denied_by (0 none, 1 minute, 2 day),
+#          minute_remaining, minute_reset_ms, day_remaining, day_reset_ms}
+DUAL_WINDOW_SCRIPT = """
+if redis.replicate_commands then redis.replicate_commands() end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local minute_limit = tonumber(ARGV[1])
+local day_limit = tonumber(ARGV[2])
+local minute = 60000
+local day = 86400000
+local m_start = now - (now % minute)
+local d_start = now - (now % day)
+
+local data = redis.call('HMGET', KEYS[1], 'mw', 'mc', 'mp', 'dw', 'dc')
+local mw = tonumber(data[1]) or m_start
+local mc = tonumber(data[2]) or 0
+local mp = tonumber(data[3]) or 0
+local dw = tonumber(data[4]) or d_start
+local dc = tonumber(data[5]) or 0
+if mw ~= m_start then
+    if mw == m_start - minute then mp = mc else mp = 0 end
+    mc = 0
+    mw = m_start
+end
+if dw ~= d_start then
+    dc = 0
+    dw = d_start
+end
+
+local elapsed = now - m_start
+local estimated = mp * (minute - elapsed) / minute + mc
+local minute_reset = minute - elapsed
+local day_reset = d_start + day - now
+local denied_by = 0
+
+if estimated + 1 > minute_limit then
+    denied_by = 1
+    if mp > 0 then
+        local decay = math.ceil((estimated + 1 - minute_limit) * minute / mp)
+        if decay < minute_reset then minute_reset = decay end
+    end
+elseif dc + 1 > day_limit then
+    denied_by = 2
+else
+    mc = mc + 1
+    dc = dc + 1
+    estimated = estimated + 1
+end
+
+redis.call('HSET', KEYS[1], 'mw', mw, 'mc', mc, 'mp', mp, 'dw', dw, 'dc', dc)
+redis.call('PEXPIRE', KEYS[1], day_reset + minute)
+
+local minute_remaining = math.floor(minute_limit - estimated)
+if minute_remaining < 0 then minute_remaining = 0 end
+local day_remaining = day_limit - dc
+if day_remaining < 0 then day_remaining = 0 end
+local allowed = 1
+if denied_by > 0 then allowed = 0 end
+return {allowed, denied_by, minute_remaining, minute_reset, day_remaining, day_reset}
+"""
+
+MINUTE = 'minute'
+DAY = 'day'
+_DENIED_BY = {0: None, 1: MINUTE, 2: DAY}
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_seconds: float
+
+    def headers(self) -> Dict[str, str]:
+        return {
+            'X-RateLimit-Limit': str(self.limit),
+            'X-RateLimit-Remaining': str(self.remaining),
+            'X-RateLimit-Reset': str(max(1, round(self.reset_seconds)))
+        }
+
+class RedisRateLimiter:
+    """Single EVALSHA per check; mode picked per plan (sliding window by default)"""
+
+    def __init__(self, client, window_seconds: int = 60,
+                 plan_modes: Optional[Dict[str, str]] = None,
+                 default_mode: str = SLIDING_WINDOW, key_prefix: str = 'rl'):
+        self.window_ms = window_seconds * 1000
+        self.plan_modes = plan_modes or {}
+        self.default_mode = default_mode
+        self.key_prefix = key_prefix
+        self._sliding_window = client.register_script(SLIDING_WINDOW_SCRIPT)
+        self._gcra = client.register_script(GCRA_SCRIPT)
+
+    def mode_for(self, plan_type: str) -> str:
+        return self.plan_modes.get(plan_type, self.default_mode)
+
+    def _invocation(self, identifier: str, limit: int, plan_type: str, burst: Optional[int]):
+        if self.mode_for(plan_type) == GCRA:
+            return self._gcra, [f"{self.key_prefix}:gcra:{identifier}"], [limit, self.window_ms, burst or limit]
+        return self._sliding_window, [f"{self.key_prefix}:sw:{identifier}"], [limit, self.window_ms]
+
+    def check(self, identifier: str, limit: int, plan_type: str = 'basic',
+              burst: Optional[int] = None) -> RateLimitResult:
+        script, keys, args = self._invocation(identifier, limit, plan_type, burst)
+        allowed, remaining, reset_ms = script(keys=keys, args=args)
+        return RateLimitResult(bool(allowed), limit, int(remaining), int(reset_ms) / 1000.0)
+
+    async def acheck(self, identifier: str, limit: int, plan_type: str = 'basic',
+                     burst: Optional[int] = None) -> RateLimitResult:
+        """Same as check(), for limiters built on a redis.asyncio client"""
+        script, keys, args = self._invocation(identifier, limit, plan_type, burst)
+        allowed, remaining, reset_ms = await script(keys=keys, args=args)
+        return RateLimitResult(bool(allowed), limit, int(remaining), int(reset_ms) / 1000.0)
+
+class DualWindowResult(NamedTuple):
+    allowed: bool
+    denied_by: Optional[str]  # MINUTE, DAY or None
+    minute_limit: int
+    minute_remaining: int
+    minute_reset_seconds: float
+    day_limit: int
+    day_remaining: int
+    day_reset_seconds: float
+
+    @property
+    def retry_after_seconds(self) -> float:
+        return self.day_reset_seconds if self.denied_by == DAY else self.minute_reset_seconds
+
+class RedisDualWindowLimiter:
+    """Per-minute and per-day limits for one identifier in a single EVALSHA"""
+
+    def __init__(self, client, key_prefix: str = 'rl:dual'):
+        self.key_prefix = key_prefix
+        self._script = client.register_script(DUAL_WINDOW_SCRIPT)
+
+    def check(self, identifier: str, per_minute: int, per_day: int) -> DualWindowResult:
+        allowed, denied_by, minute_remaining, minute_reset_ms, day_remaining, day_reset_ms = self._script(
+            keys=[f"{self.key_prefix}:{identifier}"], args=[per_minute, per_day])
+        return DualWindowResult(bool(allowed), _DENIED_BY[int(denied_by)],
+                                per_minute, int(minute_remaining), int(minute_reset_ms) / 1000.0,
+                                per_day, int(day_remaining), int(day_reset_ms) / 1000.0)
+
+# Slot layout: key hash, tokens, last refill (epoch seconds)
+_SLOT = struct.Struct('<Qdd')
+# Dual-window slot, the Lua script's hash fields: key hash, minute window start (ms),
+# minute count, previous minute count, day start (ms), day count, last use (epoch seconds)
+_DUAL_SLOT = struct.Struct('<Qqqqqqd')
+_MINUTE_MS = 60000
+_DAY_MS = 86400000
+
+def default_bucket_path() -> str:
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, 'fastping-ratelimit.bin')
+
+class SharedSlotTable:
+    """Fixed-slot hash table in an mmap'd file, shared by every worker on the host
+
+    The table is split into stripes of contiguous slots. A key hashes to one
+    stripe and probes linearly inside it; each stripe is guarded by a thread
+    lock plus an fcntl byte-range lock, so workers only contend on the same stripe.
+    A slot's first field is the key hash and its last the time it was last used;
+    slots idle longer than idle_seconds are free to take.
+    """
+
+    def __init__(self, path: str, slot: struct.Struct, slots: int = 65536, stripes: int = 256,
+                 idle_seconds: float = 60):
+        if slots % stripes:
+            raise ValueError('slots must be a multiple of stripes')
+
+        self.path = path
+        self.slot = slot
+        self.slots = slots
+        self.stripes = stripes
+        self.slots_per_stripe = slots // stripes
+        self.idle_seconds = idle_seconds
+        self.evictions = 0
+
+        size = slots * slot.size
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def _locate(self, identifier: str) -> tuple:
+        """(key hash, stripe, home slot within the stripe)"""
+        key_hash = int.from_bytes(hashlib.blake2b(identifier.encode(), digest_size=8).digest(), 'little') or 1
+        return key_hash, key_hash % self.stripes, (key_hash // self.stripes) % self.slots_per_stripe
+
+    def _lock(self, stripe: int):
+        self._locks[stripe].acquire()
+        if fcntl is not None:
+            stripe_bytes = self.slots_per_stripe * self.slot.size
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, stripe_bytes, stripe * stripe_bytes)
+
+    def _unlock(self, stripe: int):
+        if fcntl is not None:
+            stripe_bytes = self.slots_per_stripe * self.slot.size
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, stripe_bytes, stripe * stripe_bytes)
+        self._locks[stripe].release()
+
+    def _find_slot(self, stripe: int, home: int, key_hash: int, now: float) -> tuple:
+        """Offset of the key's slot and its fields; fields are None if the key is new
+
+        A new key claims a free slot, an idle one or, with the stripe full, the stalest.
+        """
+        base = stripe * self.slots_per_stripe
+        reusable = None
+        victim = None
+        victim_last = None
+
+        for probe in range(self.slots_per_stripe):
+            offset = (base + (home + probe) % self.slots_per_stripe) * self.slot.size
+            fields = self.slot.unpack_from(self._map, offset)
+            if fields[0] == key_hash:
+                return offset, fields
+            if fields[0] == 0:
+                return (reusable if reusable is not None else offset), None
+            last = fields[-1]
+            if reusable is None and now - last > self.idle_seconds:
+                reusable = offset
+            if victim is None or last < victim_last:
+                victim, victim_last = offset, last
+
+        if reusable is not None:
+            return reusable, None
+        self.evictions += 1
+        return victim, None
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+class SharedTokenBucket(SharedSlotTable):
+    """Token buckets in a SharedSlotTable, one per key, refilled continuously over the window"""
+
+    def __init__(self, path: Optional[str] = None, slots: int = 65536, stripes: int = 256,
+                 window_seconds: int = 60):
+        # A bucket idle for a whole window has refilled completely, so its slot is free to take
+        super().__init__(path or default_bucket_path(), _SLOT, slots, stripes, idle_seconds=window_seconds)
+        self.window_seconds = window_seconds
+
+    def check(self, identifier: str, limit: int, plan_type: str = 'basic') -> RateLimitResult:
+        key_hash, stripe, home = self._locate(identifier)
+        rate = limit / self.window_seconds
+
+        self._lock(stripe)
+        try:
+            now = time.time()
+            offset, fields = self._find_slot(stripe, home, key_hash, now)
+            if fields is None:
+                tokens = float(limit)
+            else:
+                _, tokens, last = fields
+                tokens = min(float(limit), tokens + (now - last) * rate)
+
+            allowed = tokens >= 1.0
+            if allowed:
+                tokens -= 1.0
+            _SLOT.pack_into(self._map, offset, key_hash, tokens, now)
+        finally:
+            self._unlock(stripe)
+
+        if allowed:
+            reset_seconds = (limit - tokens) / rate
+        else:
+            reset_seconds = (1.0 - tokens) / rate
+        return RateLimitResult(allowed, limit, int(tokens), reset_seconds)
+
+class LocalDualWindowLimiter(SharedSlotTable):
+    """Host-local stand-in for RedisDualWindowLimiter, with the same arithmetic
+
+    Each key's slot holds what DUAL_WINDOW_SCRIPT keeps in its Redis hash: a
+    sliding minute (current and previous minute counts) and a count for the
+    current UTC day. Both windows are checked before either is counted, so
+    results only differ from Redis by the clock they read.
+    """
+
+    def __init__(self, path: Optional[str] = None, slots: int = 65536, stripes: int = 256):
+        # A key unused for a day has nothing left to remember in either window
+        super().__init__(f"{path or default_bucket_path()}.api-dual", _DUAL_SLOT, slots, stripes,
+                         idle_seconds=86400 + 60)
+
+    def check(self, identifier: str, per_minute: int, per_day: int,
+              now: Optional[float] = None) -> DualWindowResult:
+        key_hash, stripe, home = self._locate(identifier)
+
+        self._lock(stripe)
+        try:
+            now = time.time() if now is None else now
+            now_ms = int(now * 1000)
+            m_start = now_ms - now_ms % _MINUTE_MS
+            d_start = now_ms - now_ms % _DAY_MS
+
+            offset, fields = self._find_slot(stripe, home, key_hash, now)
+            if fields is None:
+                mw, mc, mp, dw, dc = m_start, 0, 0, d_start, 0
+            else:
+                _, mw, mc, mp, dw, dc, _ = fields
+            if mw != m_start:
+                mp = mc if mw == m_start - _MINUTE_MS else 0
+                mc = 0
+                mw = m_start
+            if dw != d_start:
+                dc = 0
+                dw = d_start
+
+            elapsed = now_ms - m_start
+            estimated = mp * (_MINUTE_MS - elapsed) / _MINUTE_MS + mc
+            minute_reset = _MINUTE_MS - elapsed
+            day_reset = d_start + _DAY_MS - now_ms
+            denied_by = None
+
+            if estimated + 1 > per_minute:
+                denied_by = MINUTE
+                if mp > 0:
+                    decay = math.ceil((estimated + 1 - per_minute) * _MINUTE_MS / mp)
+                    minute_reset = min(minute_reset, decay)
+            elif dc + 1 > per_day:
+                denied_by = DAY
+            else:
+                mc += 1
+                dc += 1
+                estimated += 1
+
+            _DUAL_SLOT.pack_into(self._map, offset, key_hash, mw, mc, mp, dw, dc, now)
+        finally:
+            self._unlock(stripe)
+
+        return DualWindowResult(denied_by is None, denied_by,
+                                per_minute, max(0, math.floor(per_minute - estimated)), minute_reset / 1000.0,
+                                per_day, max(0, per_day - dc), day_reset / 1000.0)
@@ -0,0 +1,109 @@
+"""
+Per-Request Client Context
+==========================
+
+Forwarding headers parsed once per request, shared by the whitelist check and the handlers
+- X-Forwarded-For, then Forwarded (RFC 7239 for=), then X-Real-IP give the hop list
+  used for client_ip and anonymity; the whitelist identity trusts X-Forwarded-For only
+- Each piece computed on first use and kept for the rest of the request
+- IP parsing memoized in a bounded LRU (the same pingers send the same addresses all day)
+- Framework-agnostic: built from any case-insensitive headers mapping plus the peer address
+"""
+
+import ipaddress
+from functools import lru_cache
+from typing import List, Optional, Union
+
+IP_PARSE_CACHE_SIZE = 65536
+
+_UNSET = object()
+
+@lru_cache(maxsize=IP_PARSE_CACHE_SIZE)
+def parse_ip(value: str) -> Optional[Union[ipaddress.IPv4Address, ipaddress.IPv6Address]]:
+    """ipaddress object for `value`, or None if it isn't an address"""
+    try:
+        return ipaddress.ip_address(value)
+    except ValueError:
+        return None
+
+def parse_forwarded(header: str) -> List[str]:
+    """The for= node of each element of an RFC 7239 Forwarded header, ports and brackets stripped"""
+    nodes = []
+    for element in header.split(','):
+        for pair in element.split(';'):
+            key, _, value = pair.partition('=')
+            if key.strip().lower() != 'for':
+                continue
+            node = value.strip().strip('"')
+            if node.startswith('['):
+                node = node[1:node.find(']')] if ']' in node else node[1:]
+            elif node.count(':') == 1:
+                node = node.split(':', 1)[0]
+            if node:
+                nodes.append(node)
+    return nodes
+
+class RequestContext:
+    __slots__ = ('headers', 'remote_addr', '_hops', '_client_ip')
+
+    def __init__(self, headers, remote_addr: Optional[str]):
+        self.headers = headers
+        self.remote_addr = remote_addr
+        self._hops = _UNSET
+        self._client_ip = _UNSET
+
+    @property
+    def hops(self) -> List[str]:
+        """Client-side addresses claimed by forwarding headers, nearest-to-client first"""
+        if self._hops is _UNSET:
+            x_forwarded_for = self.headers.get('X-Forwarded-For')
+            if x_forwarded_for:
+                hops = [hop.strip() for hop in x_forwarded_for.split(',')]
+            else:
+                forwarded = self.headers.get('Forwarded')
+                hops = parse_forwarded(forwarded) if forwarded else []
+                if not hops:
+                    real_ip = self.headers.get('X-Real-IP')
+                    hops = [real_ip.strip()] if real_ip else []
+            self._hops = hops
+        return self._hops
+
+    @property
+    def whitelist_ip(self) -> Optional[str]:
+        """Address checked against the whitelist: the first X-Forwarded-For hop, else the peer
+
+        Forwarded and X-Real-IP are deliberately ignored here: they would only add
+        more client-settable ways to claim a whitelisted address.
+        """
+        x_forwarded_for = self.headers.get('X-Forwarded-For')
+        if x_forwarded_for:
+            return x_forwarded_for.split(',', 1)[0].strip()
+        return self.remote_addr
+
+    @property
+    def client_ip(self) -> Optional[str]:
+        """Real client IP: the first public hop, else the first hop, else the peer"""
+        if self._client_ip is _UNSET:
+            hops = self.hops
+            client_ip = hops[0] if hops else self.remote_addr
+            for hop in hops:
+                ip_obj = parse_ip(hop)
+                if ip_obj is not None and not ip_obj.is_private:
+                    client_ip = hop
+                    break
+            self._client_ip = client_ip
+        return self._client_ip
+
+    def anonymity(self, proxy_ip: Optional[str] = None) -> str:
+        """transparent if the proxy reveals itself or another address, anonymous if the
+        connecting address differs from the expected proxy, elite otherwise"""
+        if self.headers.get('Via'):
+            return "transparent"
+        hops = self.hops
+        if hops and (len(hops) > 1 or hops[0] != self.remote_addr):
+            return "transparent"
+
+        if proxy_ip and self.remote_addr != proxy_ip:
+            return "anonymous"
+
+        return "elite"
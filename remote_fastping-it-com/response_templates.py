@@ -0,0 +1,62 @@
+"""
+Pre-Encoded JSON Response Templates
+===================================
+
+For hot endpoints whose payload is mostly constant
+- Constant keys and values are encoded to bytes once, at startup
+- Only the variable fields are encoded per request and spliced in with one bytes %-format
+- Low-cardinality fields (e.g. anonymity level) are best baked in: one template per value
+- Output is byte-for-byte what orjson.dumps() gives for the same dict
+- Only pays off when the constant part dominates: tiny or mostly-variable bodies
+  ({"pong": <ts>}, the UDP pong) encode faster with plain orjson.dumps(), so they
+  aren't templated. bench_response_templates.py measures the shipped templates.
+"""
+
+from typing import Any, Dict, List
+
+import orjson
+
+class ResponseTemplate:
+    def __init__(self, template: Dict[str, Any], variables: List[str]):
+        """`template` fixes key order and constant values; keys in `variables` are filled per call"""
+        missing = [name for name in variables if name not in template]
+        if missing:
+            raise ValueError(f"Template variables not in template: {missing}")
+
+        markers = {name: f"__tpl_{index}__" for index, name in enumerate(variables)}
+        encoded = orjson.dumps({key: markers.get(key, value) for key, value in template.items()})
+
+        # Escape literal '%' in the constant parts, then swap each encoded marker for %b
+        fmt = encoded.replace(b'%', b'%%')
+        positions = sorted((fmt.index(orjson.dumps(marker)), name) for name, marker in markers.items())
+        for marker in markers.values():
+            fmt = fmt.replace(orjson.dumps(marker), b'%b')
+
+        self.variables = tuple(name for _, name in positions)
+        self._format = fmt
+
+    def render(self, **values) -> bytes:
+        return self._format % tuple([orjson.dumps(values[name]) for name in self.variables])
+
+    def render_one(self, value) -> bytes:
+        """Fast path for single-variable templates: the /ping client IP, the 403 denial IP"""
+        return self._format % orjson.dumps(value)
+
+
+# Shipped templates, shared by the Flask app, the asyncio server and the benchmark.
+# /ping bakes in the anonymity level: one template per value.
+PING_TEMPLATES = {
+    level: ResponseTemplate({
+        "anonymity_level": level,
+        "client_ip_from_headers": None,
+        "message": "Premium proxy test endpoint active",
+        "status": "success"
+    }, ["client_ip_from_headers"])
+    for level in ("transparent", "anonymous", "elite")
+}
+DENIED_TEMPLATE = ResponseTemplate({
+    'error': 'Access denied',
+    'message': 'IP not whitelisted for paid service',
+    'ip': None,
+    'contact': 'sales@yourservice.com'
+}, ['ip'])
@@ -0,0 +1,238 @@
+"""
+Pooled SQLite Connections
+=========================
+
+Bounded pool of tuned connections per process, checked out and returned per use
+- WAL journal, synchronous=NORMAL, mmap and page cache sized once per connection
+- Busy timeout instead of instant "database is locked" errors
+- Prepared statements cached per connection (sqlite3 statement LRU)
+- Connections aren't tied to a thread, so servers that start a thread per request
+  still reuse them; at most max_connections are open, extra callers wait
+- Fork-safe: a child process gets a fresh lock and never reuses its parent's handles,
+  and fork() holds new checkouts and waits (up to fork_wait_ms) for checked-out
+  connections to come back, so no other thread is inside SQLite - and holding its
+  global mutexes - at the fork; a fork that can't wait that out is logged and counted
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator
+
+class PoolTimeout(sqlite3.OperationalError):
+    """No connection came free within the checkout timeout"""
+
+class SQLitePool:
+    def __init__(self, db_path: str, mmap_size: int = 256 * 1024 * 1024,
+                 cache_size_kb: int = 64 * 1024, busy_timeout_ms: int = 5000,
+                 cached_statements: int = 256, max_connections: int = 16,
+                 checkout_timeout_ms: int = 5000, fork_wait_ms: int = 5000):
+        self.db_path = db_path
+        self.mmap_size = mmap_size
+        self.cache_size_kb = cache_size_kb
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self.max_connections = max_connections
+        self.checkout_timeout = checkout_timeout_ms / 1000.0
+        self.fork_wait = fork_wait_ms / 1000.0
+
+        self._lock = threading.Lock()
+        self._quiet = threading.Condition(self._lock)
+        self._holding_for_fork = False
+        # Connections checked out right now; survives close_all(), whose stragglers still come back
+        self._busy = 0
+        self._reset()
+        self._inherited = []
+
+        # Another thread may hold the lock (or the idle queue's) at fork time
+        ref = weakref.ref(self)
+        os.register_at_fork(before=lambda: ref() is not None and ref()._before_fork(),
+                            after_in_parent=lambda: ref() is not None and ref()._after_fork_in_parent(),
+                            after_in_child=lambda: ref() is not None and ref()._after_fork())
+
+    def _reset(self):
+        # LIFO keeps the most recently used (warmest) connections busy
+        self._idle = queue.LifoQueue()
+        self._all = []
+        self._pid = os.getpid()
+        self.opened = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.unsafe_forks = 0
+
+    def _before_fork(self):
+        # Hold off new checkouts and wait for the ones out to come back; a thread
+        # inside SQLite at fork time can leave its mutexes held in the child.
+        # fork() can't be refused from here, so a drain that times out is reported.
+        if not self._lock.acquire(timeout=self.fork_wait):
+            self.unsafe_forks += 1
+            print(f"⚠️ SQLitePool({self.db_path}): pool lock busy for {self.fork_wait}s, forking anyway")
+            return
+        self._holding_for_fork = True
+        if self._pid == os.getpid():
+            if not self._quiet.wait_for(lambda: self._busy == 0, timeout=self.fork_wait):
+                self.unsafe_forks += 1
+                print(f"⚠️ SQLitePool({self.db_path}): forking with {self._busy} connection(s) "
+                      f"still checked out after {self.fork_wait}s")
+
+    def _after_fork_in_parent(self):
+        if self._holding_for_fork:
+            self._holding_for_fork = False
+            # Checkouts that arrived during the drain are waiting on this
+            self._quiet.notify_all()
+            self._lock.release()
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._quiet = threading.Condition(self._lock)
+        self._holding_for_fork = False
+        self._busy = 0
+        # Inherited handles belong to the parent: keep them referenced so
+        # they are never closed (or finalized) from this process
+        self._inherited.extend(self._all)
+        self._reset()
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout_ms / 1000.0,
+                               cached_statements=self.cached_statements,
+                               check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        # Negative cache_size is in KiB rather than pages
+        conn.execute(f'PRAGMA cache_size=-{int(self.cache_size_kb)}')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        with self._lock:
+            # A fork is draining the pool; waiting here releases the lock to it
+            self._quiet.wait_for(lambda: not self._holding_for_fork)
+            self.checkouts += 1
+            try:
+                conn = self._idle.get_nowait()
+                self._busy += 1
+                return conn
+            except queue.Empty:
+                pass
+            reserved = len(self._all) < self.max_connections
+            if reserved:
+                self._busy += 1
+                # Reserve the slot now, open outside the lock
+                self._all.append(None)
+                self.opened += 1
+            else:
+                self.waits += 1
+                idle = self._idle
+
+        if not reserved:
+            deadline = time.monotonic() + self.checkout_timeout
+            while True:
+                try:
+                    conn = idle.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    self.timeouts += 1
+                    raise PoolTimeout(f'no SQLite connection free within {self.checkout_timeout}s')
+                with self._lock:
+                    if not self._holding_for_fork:
+                        self._busy += 1
+                        return conn
+                    # Returned mid-drain: hand it back and wait out the fork like a new checkout
+                    idle.put(conn)
+                    self._quiet.wait_for(lambda: not self._holding_for_fork)
+
+        try:
+            conn = self._open()
+        except Exception:
+            with self._lock:
+                self._all.remove(None)
+                self.opened -= 1
+                self._checked_in()
+            raise
+        with self._lock:
+            self._all[self._all.index(None)] = conn
+        return conn
+
+    def _checked_in(self):
+        # Under self._lock
+        self._busy -= 1
+        if not self._busy:
+            self._quiet.notify_all()
+
+    def _release(self, conn: sqlite3.Connection, pid: int):
+        if pid != os.getpid():
+            return
+        try:
+            if conn not in self._all:
+                # Checked out before close_all()
+                conn.close()
+                return
+            if conn.in_transaction:
+                # Never hand the next caller someone else's half-finished transaction
+                conn.rollback()
+            self._idle.put(conn)
+        finally:
+            with self._lock:
+                self._checked_in()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Check out a connection for the `with` block; it goes back to the pool afterwards"""
+        pid = os.getpid()
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn, pid)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Check out a connection; commit on success, roll back on error"""
+        with self.connection() as conn:
+            with conn:
+                yield conn
+
+    def close_all(self):
+        """Close every connection; ones checked out right now are closed when returned"""
+        with self._lock:
+            if self._pid == os.getpid():
+                while True:
+                    try:
+                        conn = self._idle.get_nowait()
+                    except queue.Empty:
+                        break
+                    try:
+                        conn.close()
+                    except sqlite3.Error:
+                        pass
+            self._reset()
+
+    def stats(self) -> Dict[str, Any]:
+        current = self._pid == os.getpid()
+        return {
+            'db_path': self.db_path,
+            'open_connections': len(self._all) if current else 0,
+            'idle_connections': self._idle.qsize() if current else 0,
+            'checked_out_connections': self._busy if current else 0,
+            'max_connections': self.max_connections,
+            'connections_opened': self.opened,
+            'checkouts': self.checkouts,
+            'reused_checkouts': max(0, self.checkouts - self.opened),
+            'checkout_waits': self.waits,
+            'checkout_timeouts': self.timeouts,
+            'unsafe_forks': self.unsafe_forks,
+            'cached_statements': self.cached_statements,
+            'pragmas': {
+                'journal_mode': 'wal',
+                'synchronous': 'NORMAL',
+                'mmap_size': self.mmap_size,
+                'cache_size_kb': self.cache_size_kb,
+                'busy_timeout_ms': self.busy_timeout_ms
+            }
+        }
@@ -0,0 +1,55 @@
+import importlib
+import os
+import sys
+import types
+
+import pytest
+
+# Modules live flat at the repo root (and api.py under api_access/)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope='session')
+def proxy_app(tmp_path_factory):
+    """proxy-test-app, imported once against fakeredis and a throwaway whitelist.db"""
+    fakeredis = pytest.importorskip('fakeredis')
+    import redis
+
+    workdir = tmp_path_factory.mktemp('proxy-app')
+    server = fakeredis.FakeServer()
+    real_redis = redis.Redis
+    redis.Redis = lambda *args, **kwargs: fakeredis.FakeRedis(
+        server=server, decode_responses=kwargs.get('decode_responses', False))
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        module = importlib.import_module('proxy-test-app')
+    finally:
+        os.chdir(cwd)
+        redis.Redis = real_redis
+    # DB_PATH is relative; keep new pooled connections in the work directory
+    module.whitelist_manager.db_pool.db_path = str(workdir / module.DB_PATH)
+    return module
+
+
+@pytest.fixture(scope='session')
+def api_module():
+    """api_access/api.py against fakeredis; the file is Python followed by its HTML docs"""
+    fakeredis = pytest.importorskip('fakeredis')
+    import redis
+
+    path = os.path.join(ROOT, 'api_access', 'api.py')
+    with open(path) as f:
+        source = f.read()
+    module = types.ModuleType('api')
+    module.__file__ = path
+    server = fakeredis.FakeServer()
+    real_redis = redis.Redis
+    redis.Redis = lambda *args, **kwargs: fakeredis.FakeRedis(
+        server=server, decode_responses=kwargs.get('decode_responses', False))
+    try:
+        exec(compile(source[:source.index('<!DOCTYPE html>')], path, 'exec'), module.__dict__)
+    finally:
+        redis.Redis = real_redis
+    return module
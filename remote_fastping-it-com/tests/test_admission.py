@@ -0,0 +1,148 @@
+import json
+
+import pytest
+
+import admission
+from admission import UNIDENTIFIED, AdmissionController, overloaded_response
+
+
+def make(**kwargs):
+    kwargs.setdefault('initial_limit', 10)
+    kwargs.setdefault('min_limit', 2)
+    kwargs.setdefault('max_limit', 20)
+    return AdmissionController('test', **kwargs)
+
+
+def test_acquire_sheds_over_the_limit():
+    controller = make(initial_limit=3)
+    assert [controller.acquire() for _ in range(4)] == [True, True, True, False]
+    assert controller.shed[UNIDENTIFIED] == 1
+    controller.release()
+    assert controller.acquire()
+    assert controller.stats()['admitted'] == 4
+
+
+def test_lower_plans_shed_first():
+    controller = make()
+    for _ in range(8):
+        controller.acquire()
+    # 8 in flight: over basic's 7, within premium's 8.5
+    assert not controller.allows('basic')
+    assert controller.allows('premium')
+    assert controller.allows('enterprise')
+    # Unknown plans get the smallest share
+    assert not controller.allows('legacy')
+    assert controller.shed['basic'] == 1
+    assert controller.shed['legacy'] == 1
+
+
+def test_slow_latency_shrinks_the_limit_once_per_round_trip(monkeypatch):
+    controller = make()
+    clock = [1000.0]
+    monkeypatch.setattr(admission.time, 'monotonic', lambda: clock[0])
+
+    controller.observe(0.5)
+    assert controller.limit == pytest.approx(9.0)
+    # A burst within the same round trip doesn't back off again
+    controller.observe(0.5)
+    assert controller.limit == pytest.approx(9.0)
+    clock[0] += 1.0
+    controller.observe(0.5)
+    assert controller.limit == pytest.approx(8.1)
+
+
+def test_limit_never_drops_below_min(monkeypatch):
+    controller = make(initial_limit=3, min_limit=2)
+    clock = [1000.0]
+    monkeypatch.setattr(admission.time, 'monotonic', lambda: clock[0])
+    for _ in range(20):
+        clock[0] += 10
+        controller.observe(1.0)
+    assert controller.limit == 2
+
+
+def test_fast_latency_grows_the_limit_only_when_in_use():
+    controller = make(initial_limit=10, max_limit=11)
+    controller.observe(0.001)
+    assert controller.limit == 10
+
+    for _ in range(5):
+        controller.acquire()
+    controller.observe(0.001)
+    assert controller.limit == pytest.approx(10.1)
+    # Half the limit no longer in use: stays put
+    controller.observe(0.001)
+    assert controller.limit == pytest.approx(10.1)
+
+    for _ in range(5):
+        controller.acquire()
+    for _ in range(50):
+        controller.observe(0.001)
+    assert controller.limit == 11
+
+
+def test_after_fork_resets_in_flight():
+    controller = make()
+    controller.acquire()
+    controller.after_fork()
+    assert controller.in_flight == 0
+    assert controller.acquire()
+
+
+def test_overloaded_response():
+    response = overloaded_response(3)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '3'
+    assert json.loads(response.get_data())['error'] == 'Service overloaded'
+
+
+NOW = 1_700_000_000.0
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('t=1699999995.5', 4.5),
+    ('1699999995.5', 4.5),
+    ('1699999995500', 4.5),
+    ('1699999995500000', 4.5),
+    ('t=1700000005', 0.0),
+    (None, 0.0),
+    ('', 0.0),
+    ('t=soon', 0.0),
+    ('nan', 0.0),
+])
+def test_queue_wait_seconds(header, expected):
+    assert admission.queue_wait_seconds(header, now=NOW) == pytest.approx(expected, abs=1e-3)
+
+
+def test_size_for_threads_lets_the_limit_shed(monkeypatch):
+    controller = make(initial_limit=64, min_limit=8, max_limit=1024)
+    controller.size_for(8)
+    assert (controller.limit, controller.min_limit, controller.max_limit) == (8, 2, 8)
+
+    clock = [1000.0]
+    monkeypatch.setattr(admission.time, 'monotonic', lambda: clock[0])
+    for _ in range(5):
+        clock[0] += 1
+        assert controller.acquire(queue_wait=0.5)
+        controller.release()
+    # Queueing backed the limit off below the thread count, so a full worker sheds
+    assert controller.limit < 7
+    for _ in range(6):
+        controller.acquire()
+    assert not controller.acquire()
+
+
+def test_requests_queued_past_max_wait_are_shed():
+    controller = make(target_latency_ms=50, max_queue_wait_ms=200)
+    assert controller.acquire(queue_wait=0.1)
+    assert not controller.acquire(queue_wait=0.3)
+    stats = controller.stats()
+    assert stats['queue_timeouts'] == 1
+    assert stats['in_flight'] == 1
+    assert stats['queue_wait_ewma_ms'] > 100
+
+
+def test_after_fork_sizes_for_concurrency():
+    controller = make()
+    controller.after_fork(4)
+    assert (controller.limit, controller.min_limit, controller.max_limit) == (4, 1, 4)
@@ -0,0 +1,124 @@
+"""Admission control inside a real gunicorn gthread worker, where threads bound concurrency"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import textwrap
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip('gunicorn')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+APP = '''
+import time
+
+from flask import Flask, jsonify, request
+
+from admission import AdmissionController, overloaded_response, queue_wait_seconds
+
+app = Flask(__name__)
+admission = AdmissionController('gthread-test', initial_limit=64, min_limit=8,
+                                target_latency_ms=50, max_queue_wait_ms=300)
+
+@app.route('/slow')
+def slow():
+    if not admission.acquire(queue_wait_seconds(request.headers.get('X-Request-Start'))):
+        return overloaded_response()
+    try:
+        time.sleep(0.2)
+        return 'ok'
+    finally:
+        admission.release()
+
+@app.route('/stats')
+def stats():
+    return jsonify(admission.stats())
+'''
+
+CONFIG = '''
+from admission import stamp_gthread_queue
+
+workers = 1
+worker_class = 'gthread'
+threads = 2
+
+def post_fork(server, worker):
+    import gated_app
+    gated_app.admission.after_fork(worker.cfg.threads)
+
+def post_worker_init(worker):
+    stamp_gthread_queue(worker)
+'''
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def get(url, headers=None):
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers or {}), timeout=30) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+@pytest.fixture
+def server(tmp_path):
+    (tmp_path / 'gated_app.py').write_text(textwrap.dedent(APP))
+    (tmp_path / 'gated.conf.py').write_text(textwrap.dedent(CONFIG))
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(tmp_path), ROOT]))
+    env.pop('PROMETHEUS_MULTIPROC_DIR', None)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gated.conf.py', '--bind', f'127.0.0.1:{port}', 'gated_app:app'],
+        cwd=str(tmp_path), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f'http://127.0.0.1:{port}'
+    try:
+        deadline = time.monotonic() + 15
+        while True:
+            try:
+                get(f'{base}/stats')
+                break
+            except OSError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    pytest.fail('gunicorn did not start')
+                time.sleep(0.1)
+        yield base
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def test_gthread_worker_sheds_queued_requests(server):
+    stats = json.loads(get(f'{server}/stats')[1])
+    # Sized for the two threads, not the constructor's 64 / 8
+    assert (stats['limit'], stats['min_limit'], stats['max_limit']) == (2, 1, 2)
+
+    # Sixteen at once against two threads: most of them wait in gthread's queue
+    with ThreadPoolExecutor(16) as pool:
+        statuses = [status for status, _ in pool.map(lambda _: get(f'{server}/slow'), range(16))]
+    assert statuses.count(200) >= 2
+    assert statuses.count(503) >= 4
+
+    stats = json.loads(get(f'{server}/stats')[1])
+    assert stats['queue_timeouts'] >= 4
+    assert stats['queue_wait_ewma_ms'] > 0
+    assert stats['limit'] < 2
+
+
+def test_front_proxy_stamp_is_kept(server):
+    # Stamped ten seconds ago by the proxy: long past max_queue_wait, whatever gthread adds
+    status, _ = get(f'{server}/slow', headers={'X-Request-Start': f't={time.time() - 10:.3f}'})
+    assert status == 503
+    assert get(f'{server}/slow')[0] == 200
@@ -0,0 +1,122 @@
+import sqlite3
+import time
+from datetime import timedelta
+
+import pytest
+from flask import Flask
+
+from admission import AdmissionController
+
+
+class FakeUpstreamResponse:
+    status_code = 200
+    headers = {'Content-Type': 'text/plain'}
+    text = 'upstream body'
+    content = b'upstream body'
+    elapsed = timedelta(milliseconds=100)
+
+
+@pytest.fixture
+def api(api_module, tmp_path, monkeypatch):
+    # api.py keeps its tables in ./customer_resources.db
+    monkeypatch.chdir(tmp_path)
+    conn = sqlite3.connect('customer_resources.db')
+    conn.execute('''CREATE TABLE customers (customer_id TEXT PRIMARY KEY, email TEXT,
+                    plan_type TEXT DEFAULT 'basic', status TEXT DEFAULT 'active')''')
+    conn.execute("INSERT INTO customers VALUES ('c1', 'c1@example.com', 'enterprise', 'active')")
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(api_module, 'api_admission', AdmissionController('api-test', target_latency_ms=1000))
+    app = Flask('api-test')
+    manager = api_module.setup_api_system(app, None, None)
+    api_module.app, api_module.manager = app, manager
+    api_module.key = manager.generate_api_key('c1')
+    yield api_module
+    # Flush the write-behind counters here, not at exit from some other directory
+    manager.key_usage.close()
+
+
+def slow_upstream(seconds):
+    def request(method, url, **kwargs):
+        time.sleep(seconds)
+        return FakeUpstreamResponse()
+    return request
+
+
+def test_admission_ignores_upstream_wait(api, monkeypatch):
+    monkeypatch.setattr(api.upstream_client, 'request', slow_upstream(0.3))
+    client = api.app.test_client()
+    response = client.get(f'/api/v1/proxy?url=http://upstream.test/&api_key={api.key}')
+    assert response.status_code == 200
+    assert response.get_json()['request_info']['processing_time_ms'] >= 300
+
+    stats = api.api_admission.stats()
+    assert stats['admitted'] == 1
+    assert stats['latency_ewma_ms'] < 150
+
+
+def test_batch_upstream_calls_are_excluded_too(api, monkeypatch):
+    monkeypatch.setattr(api.upstream_client, 'request', slow_upstream(0.1))
+    client = api.app.test_client()
+    response = client.post(f'/api/v1/batch?api_key={api.key}',
+                           json={'requests': [{'url': 'http://upstream.test/a'},
+                                              {'url': 'http://upstream.test/b'}]})
+    assert response.status_code == 200
+    assert response.get_json()['successful_requests'] == 2
+    assert api.api_admission.stats()['latency_ewma_ms'] < 100
+
+
+def test_admin_stats_on_loopback_only(api):
+    client = api.app.test_client()
+    client.get(f'/api/v1/ping?api_key={api.key}')
+    client.get(f'/api/v1/ping?api_key={api.key}')
+    stats = client.get('/api/admin/stats').get_json()
+    assert stats['admission']['admitted'] == 2
+    assert stats['admission']['in_flight'] == 0
+    assert (stats['key_cache']['misses'], stats['key_cache']['hits']) == (1, 1)
+    assert stats['key_usage']['added'] == 2
+    assert stats['upstream']['max_hosts'] == api.UPSTREAM_MAX_HOSTS
+
+    remote = client.get('/api/admin/stats', environ_base={'REMOTE_ADDR': '93.184.216.34'})
+    assert remote.status_code == 404
+
+
+def test_reload_policies_swaps_in_database_changes(api):
+    manager = api.manager
+    assert manager.policies.limits('/api/v1/stats', 'basic') == (10, 10000)
+    conn = sqlite3.connect('customer_resources.db')
+    conn.execute("UPDATE api_endpoints SET rate_limit_override = 7 WHERE path = '/api/v1/stats'")
+    conn.commit()
+    conn.close()
+
+    before = manager.policies
+    assert manager.reload_policies(broadcast=False)
+    assert manager.policies is not before
+    assert manager.policies.limits('/api/v1/stats', 'basic') == (7, 10000)
+
+
+def test_route_override_has_its_own_window(api):
+    client = api.app.test_client()
+    headers = {'Authorization': f'Bearer {api.key}'}
+    for _ in range(15):
+        assert client.get('/api/v1/ping', headers=headers).status_code == 200
+    # /api/v1/stats allows 10/min of its own, untouched by the pings above
+    statuses = [client.get('/api/v1/stats', headers=headers).status_code for _ in range(11)]
+    assert statuses == [200] * 10 + [429]
+    limited = client.get('/api/v1/stats', headers=headers).get_json()
+    assert (limited['limit'], limited['window']) == (10, 'per_minute')
+    # The plan-wide window counted every request and still has room
+    assert client.get('/api/v1/ping', headers=headers).status_code == 200
+
+
+def test_key_invalidations_never_broadcast_the_key(api, monkeypatch):
+    published = []
+    monkeypatch.setattr(api.manager, '_publish_invalidation', published.append)
+    key = api.manager.generate_api_key('c1')
+    assert api.manager.validate_api_key(key)[0]
+    assert api.manager.deactivate_api_key(key)
+    assert published == [f'key:{api.key_digest(key)}'] * 2
+    assert not any(key in message for message in published)
+    # The revocation took effect locally, not only on the other workers
+    assert not api.manager.validate_api_key(key)[0]
@@ -0,0 +1,91 @@
+import api_key_cache
+from api_key_cache import MISS, APIKeyCache, key_digest
+
+
+def record(customer_id):
+    return {'customer_id': customer_id, 'plan_type': 'basic'}
+
+
+def test_hit_miss_and_negative_entries():
+    cache = APIKeyCache()
+    assert cache.get('k1') is MISS
+    cache.put('k1', record('c1'), cache.generation)
+    cache.put('bad', None, cache.generation)
+    assert cache.get('k1') == record('c1')
+    assert cache.get('bad') is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (2, 1, 2)
+
+
+def test_entries_expire_at_ttl_or_key_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(api_key_cache.time, 'time', lambda: now[0])
+    cache = APIKeyCache(ttl_seconds=30)
+    cache.put('k1', record('c1'), cache.generation)
+    cache.put('k2', record('c1'), cache.generation, expires_ts=1005.0)
+    now[0] = 1006.0
+    assert cache.get('k1') == record('c1')
+    assert cache.get('k2') is MISS
+    now[0] = 1031.0
+    assert cache.get('k1') is MISS
+
+
+def test_invalidate_key_and_customer():
+    cache = APIKeyCache()
+    for key, customer in (('a', 'c1'), ('b', 'c1'), ('c', 'c2')):
+        cache.put(key, record(customer), cache.generation)
+    cache.invalidate_key('c')
+    assert cache.get('c') is MISS
+    cache.invalidate_customer('c1')
+    assert cache.get('a') is MISS and cache.get('b') is MISS
+    assert cache._by_customer == {}
+    cache.invalidate_customer('unknown')
+    assert cache.stats()['invalidations'] == 3
+
+
+def test_put_that_raced_an_invalidation_is_dropped():
+    cache = APIKeyCache()
+    generation = cache.generation
+    # Validation reads the database, then the key is revoked before it caches
+    cache.invalidate_key('k1')
+    cache.put('k1', record('c1'), generation)
+    assert cache.get('k1') is MISS
+    cache.put('k1', None, cache.generation)
+    assert cache.get('k1') is None
+
+
+def test_eviction_drops_oldest_inserted():
+    cache = APIKeyCache(max_entries=2)
+    cache.put('a', record('c1'), cache.generation)
+    cache.put('b', record('c1'), cache.generation)
+    # Refreshing 'a' moves it to the back
+    cache.put('a', record('c1'), cache.generation)
+    cache.put('c', record('c2'), cache.generation)
+    assert cache.get('b') is MISS
+    assert cache.get('a') is not MISS and cache.get('c') is not MISS
+    assert cache.stats()['evictions'] == 1
+    assert cache._by_customer == {'c1': {key_digest('a')}, 'c2': {key_digest('c')}}
+
+
+def test_customer_change_moves_the_index():
+    cache = APIKeyCache()
+    cache.put('k', record('c1'), cache.generation)
+    cache.put('k', record('c2'), cache.generation)
+    cache.invalidate_customer('c1')
+    assert cache.get('k') == record('c2')
+
+
+def test_clear():
+    cache = APIKeyCache()
+    cache.put('k', record('c1'), cache.generation)
+    cache.clear()
+    assert cache.get('k') is MISS
+    assert cache.stats()['entries'] == 0
+
+
+def test_entries_are_keyed_by_digest():
+    cache = APIKeyCache()
+    cache.put('secret-key', record('c1'), cache.generation)
+    assert 'secret-key' not in cache._entries
+    cache.invalidate_digest(key_digest('secret-key'))
+    assert cache.get('secret-key') is MISS
@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from denied_cache import DeniedIPCache
+from rate_limiter import RateLimitResult
+
+aiohttp_test_utils = pytest.importorskip('aiohttp.test_utils')
+
+CLIENT = {'customer_id': 'c1', 'plan_type': 'basic', 'rate_limit': 2}
+
+
+@pytest.fixture
+def server(proxy_app, monkeypatch):
+    fakeredis = pytest.importorskip('fakeredis')
+    import async_server
+    manager = async_server.whitelist_manager
+    monkeypatch.setattr(async_server.aioredis, 'Redis',
+                        lambda **kwargs: fakeredis.FakeAsyncRedis(decode_responses=True))
+    monkeypatch.setattr(proxy_app, 'REDIS_AVAILABLE', True)
+    monkeypatch.setattr(manager, 'is_ip_allowed',
+                        lambda ip: (True, CLIENT) if ip == '93.184.216.34' else (False, None))
+    monkeypatch.setattr(manager, 'denied_cache', DeniedIPCache(60, 100))
+    usage = []
+    monkeypatch.setattr(manager, 'log_usage', lambda *row: usage.append(row))
+    async_server.usage = usage
+    return async_server
+
+
+def run(server, scenario):
+    async def main():
+        async with aiohttp_test_utils.TestClient(aiohttp_test_utils.TestServer(server.create_app())) as client:
+            return await scenario(client)
+    return asyncio.run(main())
+
+
+ALLOWED = {'X-Forwarded-For': '93.184.216.34'}
+
+
+def test_whitelisted_ping_is_rate_limited_through_redis(server):
+    async def scenario(client):
+        responses = [await client.get('/ping', headers=ALLOWED) for _ in range(3)]
+        return [(r.status, r.headers.get('X-RateLimit-Limit'), await r.json()) for r in responses]
+
+    (first, _, body), (second, _, _), (third, _, limited) = run(server, scenario)
+    assert (first, second, third) == (200, 200, 429)
+    assert body['client_ip_from_headers'] == '93.184.216.34'
+    assert limited['error'] == 'Rate limit exceeded'
+    assert [row[2] for row in server.usage] == ['ping', 'ping', 'ping']
+    assert [row[4] for row in server.usage] == [True, True, False]
+
+
+def test_denied_ip_is_logged_once(server):
+    async def scenario(client):
+        return [(await client.get('/fast-ping')).status for _ in range(2)]
+
+    assert run(server, scenario) == [403, 403]
+    assert [(row[0], row[1], row[4]) for row in server.usage] == [('127.0.0.1', 'unknown', False)]
+
+
+def test_status_skips_the_whitelist(server):
+    async def scenario(client):
+        response = await client.get('/status')
+        return response.status, await response.json()
+
+    status, body = run(server, scenario)
+    assert status == 200 and body['status'] == 'operational'
+    assert server.usage == []
+
+
+def test_echo_selects_fields_and_parses_json(server):
+    async def scenario(client):
+        echo = await client.post('/anything?fields=method,json_body,args', headers=ALLOWED,
+                                 json={'a': 1})
+        unknown = await client.get('/anything?fields=nope', headers=ALLOWED)
+        return await echo.json(), unknown.status
+
+    body, unknown_status = run(server, scenario)
+    assert body == {'method': 'POST', 'json_body': {'a': 1}, 'args': {'fields': 'method,json_body,args'}}
+    assert unknown_status == 400
+
+
+def test_falls_back_to_local_buckets_when_redis_fails(server, monkeypatch):
+    import redis
+
+    async def failing(*args, **kwargs):
+        raise redis.ConnectionError('down')
+
+    monkeypatch.setattr(server.RedisRateLimiter, 'acheck', failing)
+    checks = []
+
+    class Limiter:
+        def check(self, identifier, limit, plan_type):
+            checks.append(identifier)
+            return RateLimitResult(True, limit, limit - 1, 60)
+
+    monkeypatch.setattr(server.whitelist_manager, 'local_rate_limiter', Limiter())
+
+    async def scenario(client):
+        return (await client.get('/fast-ping', headers=ALLOWED)).status
+
+    assert run(server, scenario) == 200
+    assert checks == ['93.184.216.34']
@@ -0,0 +1,138 @@
+import math
+from datetime import datetime, timedelta
+
+import orjson
+import pytest
+
+NOW = datetime(2026, 1, 1)
+
+
+@pytest.fixture
+def parse(proxy_app):
+    return lambda record: proxy_app.parse_bulk_record(record, NOW)
+
+
+def test_valid_row_with_defaults(parse):
+    assert parse({'ip_address': '203.0.113.0/24', 'customer_id': ' c1 '}) == (
+        '203.0.113.0/24', 'c1', 'basic', 100, NOW + timedelta(days=30), '')
+
+
+def test_csv_strings_are_converted(parse):
+    row = parse({'ip_address': '10.0.0.1', 'customer_id': 'c1', 'plan_type': 'premium',
+                 'rate_limit': '250', 'expires_days': '7.5', 'notes': 'batch 3'})
+    assert row == ('10.0.0.1', 'c1', 'premium', 250, NOW + timedelta(days=7.5), 'batch 3')
+
+
+def test_json_int_customer_id_and_structured_notes(parse):
+    row = parse({'ip_address': '10.0.0.1', 'customer_id': 42, 'notes': {'team': 'ops', 'tags': [1]}})
+    assert row[1] == '42'
+    assert orjson.loads(row[5]) == {'team': 'ops', 'tags': [1]}
+    assert parse({'ip_address': '10.0.0.1', 'customer_id': 'c', 'notes': 12.5})[5] == '12.5'
+
+
+@pytest.mark.parametrize('record, message', [
+    ('not a dict', 'not a JSON object'),
+    ({'customer_id': 'c1'}, 'missing ip_address'),
+    ({'ip_address': 'nope', 'customer_id': 'c1'}, 'does not appear to be'),
+    ({'ip_address': 123, 'customer_id': 'c1'}, 'does not appear to be'),
+    ({'ip_address': '203.0.113.7/8', 'customer_id': 'c1'}, 'has host bits set'),
+    ({'ip_address': '10.0.0.0/8', 'customer_id': 'c1'}, 'wider than /16'),
+    ({'ip_address': ['10.0.0.1'], 'customer_id': 'c1'}, 'ip_address must be a string'),
+    # A CSV row without customer_id used to be imported as the string 'None'
+    ({'ip_address': '10.0.0.1', 'customer_id': None}, 'missing customer_id'),
+    ({'ip_address': '10.0.0.1'}, 'missing customer_id'),
+    ({'ip_address': '10.0.0.1', 'customer_id': '   '}, 'customer_id is empty'),
+    ({'ip_address': '10.0.0.1', 'customer_id': True}, 'customer_id must be a string'),
+    ({'ip_address': '10.0.0.1', 'customer_id': 'c1', 'plan_type': 3}, 'unknown plan_type'),
+    ({'ip_address': '10.0.0.1', 'customer_id': 'c1', 'plan_type': {'tier': 1}}, 'plan_type must be a string'),
+    ({'ip_address': '10.0.0.1', 'customer_id': 'c1', 'plan_type': 'gold'}, 'unknown plan_type'),
+    ({'ip_address': '10.0.0.1', 'customer_id': 'c1', 'rate_limit': 'fast'}, 'rate_limit must be a number'),
+    ({'ip_address': '10.0.0.1', 'customer_id': 'c1', 'rate_limit': 1.5}, 'rate_limit must be a whole number'),
+    ({'ip_address': '10.0.0.1', 'customer_id': 'c1', 'rate_limit': 0}, 'rate_limit must be a whole number'),
+    ({'ip_address': '10.0.0.1', 'customer_id': 'c1', 'rate_limit': 1e12}, 'rate_limit must be a whole number'),
+    ({'ip_address': '10.0.0.1', 'customer_id': 'c1', 'expires_days': 1e9}, 'expires_days must be above 0'),
+    ({'ip_address': '10.0.0.1', 'customer_id': 'c1', 'expires_days': math.inf}, 'expires_days must be finite'),
+    ({'ip_address': '10.0.0.1', 'customer_id': 'c1', 'expires_days': 'inf'}, 'expires_days must be finite'),
+    ({'ip_address': '10.0.0.1', 'customer_id': 'c1', 'expires_days': 'nan'}, 'expires_days must be finite'),
+    ({'ip_address': '10.0.0.1', 'customer_id': 'c1', 'expires_days': -1}, 'expires_days must be above 0'),
+    ({'ip_address': '10.0.0.1', 'customer_id': 'c1', 'expires_days': [30]}, 'expires_days must be a number'),
+])
+def test_invalid_rows_raise_value_error(parse, record, message):
+    with pytest.raises(ValueError, match=message):
+        parse(record)
+
+
+def test_bad_rows_are_rejected_one_by_one(proxy_app):
+    manager = proxy_app.whitelist_manager
+    result = manager.bulk_upsert([
+        {'ip_address': '198.51.100.1', 'customer_id': 'bulk-1'},
+        {'ip_address': '198.51.100.2', 'customer_id': 'bulk-1', 'plan_type': 1},
+        {'ip_address': '198.51.100.3', 'customer_id': 'bulk-1', 'expires_days': 1e9},
+        {'ip_address': '198.51.100.4', 'customer_id': 'bulk-1', 'expires_days': math.inf},
+        {'ip_address': '198.51.100.5', 'customer_id': 'bulk-1', 'notes': {'a': 1}},
+        {'ip_address': '198.51.100.6', 'customer_id': None},
+        None,
+        {'ip_address': '198.51.100.7', 'customer_id': 'bulk-1', 'notes': ['x']},
+    ])
+    assert result['imported'] == 3
+    assert result['rejected'] == 5
+    assert [error['row'] for error in result['errors']] == [2, 3, 4, 6, 7]
+
+    assert manager.is_ip_allowed('198.51.100.1')[0]
+    assert manager.is_ip_allowed('198.51.100.5')[0]
+    assert not manager.is_ip_allowed('198.51.100.6')[0]
+    with manager.db_pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM ip_whitelist WHERE customer_id = 'None'").fetchone()[0] == 0
+        notes = conn.execute("SELECT notes FROM ip_whitelist WHERE ip_address = '198.51.100.7'").fetchone()[0]
+    assert notes == '["x"]'
+
+
+def test_csv_upload_reports_row_errors(proxy_app):
+    client = proxy_app.app.test_client()
+    body = ('ip_address,customer_id,plan_type,expires_days\n'
+            '192.0.2.10,csv-1,basic,10\n'
+            '192.0.2.11,,basic,10\n'
+            '192.0.2.12,csv-1,basic,inf\n'
+            '192.0.2.13\n')
+    response = client.post('/admin/bulk_import?format=csv', data=body, content_type='text/csv')
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result['imported'] == 1
+    assert result['rejected'] == 3
+    assert [e['error'] for e in result['errors']] == [
+        'missing customer_id', 'expires_days must be finite', 'missing customer_id']
+
+
+def test_ndjson_upload_survives_odd_types(proxy_app):
+    client = proxy_app.app.test_client()
+    lines = [
+        {'ip_address': '192.0.2.20', 'customer_id': 'nd-1', 'notes': {'k': 'v'}},
+        {'ip_address': '192.0.2.21', 'customer_id': 'nd-1', 'plan_type': 7},
+        {'ip_address': '192.0.2.22', 'customer_id': 'nd-1', 'expires_days': 10 ** 12},
+    ]
+    body = b'\n'.join(orjson.dumps(line) for line in lines) + b'\n{broken\n'
+    response = client.post('/admin/bulk_import?format=ndjson', data=body)
+    assert response.status_code == 200
+    result = response.get_json()
+    assert (result['imported'], result['rejected']) == (1, 3)
+
+
+@pytest.mark.parametrize('method, path', [('post', '/admin/bulk_import?format=ndjson'), ('get', '/admin/export')])
+@pytest.mark.parametrize('environ, headers', [
+    ({'REMOTE_ADDR': '93.184.216.34'}, {}),
+    # Relayed by the reverse proxy, which connects from loopback
+    ({}, {'X-Forwarded-For': '93.184.216.34'}),
+])
+def test_bulk_endpoints_refuse_non_local_callers(proxy_app, method, path, environ, headers):
+    client = proxy_app.app.test_client()
+    body = orjson.dumps({'ip_address': '192.0.2.30', 'customer_id': 'remote'})
+    response = getattr(client, method)(path, data=body, headers=headers, environ_base=environ)
+    assert response.status_code == 404
+    assert not proxy_app.whitelist_manager.is_ip_allowed('192.0.2.30')[0]
+    assert b'192.0.2' not in response.data
+
+
+def test_export_streams_for_local_callers(proxy_app):
+    response = proxy_app.app.test_client().get('/admin/export?format=csv')
+    assert response.status_code == 200
+    assert response.data.startswith(b'ip_address,customer_id')
@@ -0,0 +1,118 @@
+import gzip
+import zlib
+
+import pytest
+from flask import Flask, Response
+
+import compression
+from compression import (choose_encoding, compress_response, install_compression,
+                         is_compressible, stream_compressed)
+
+
+@pytest.fixture
+def gzip_only(monkeypatch):
+    monkeypatch.setattr(compression, 'zstandard', None)
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, None),
+    ('', None),
+    ('gzip', 'gzip'),
+    ('br, gzip;q=0.5', 'gzip'),
+    ('gzip;q=0', None),
+    ('gzip;q=bogus', None),
+    ('*', 'gzip'),
+    ('*, gzip;q=0', None),
+    ('identity', None),
+])
+def test_choose_encoding(gzip_only, header, expected):
+    assert choose_encoding(header) == expected
+
+
+def test_choose_encoding_prefers_zstd_when_installed(monkeypatch):
+    monkeypatch.setattr(compression, 'zstandard', object())
+    assert choose_encoding('gzip, zstd') == 'zstd'
+    assert choose_encoding('gzip, zstd;q=0') == 'gzip'
+
+
+@pytest.mark.parametrize('mimetype, expected', [
+    ('application/json', True),
+    ('text/html', True),
+    ('application/problem+json', True),
+    ('image/png', False),
+    ('application/octet-stream', False),
+    (None, False),
+])
+def test_is_compressible(mimetype, expected):
+    assert is_compressible(mimetype) is expected
+
+
+def test_stream_compressed_gzip_round_trips():
+    chunks = [b'a' * 5000, b'', b'b' * 3000]
+    assert gzip.decompress(b''.join(stream_compressed(chunks, 'gzip'))) == b''.join(chunks)
+
+
+def test_zstd_round_trips():
+    zstandard = pytest.importorskip('zstandard')
+    data = b'{"x": 1}' * 1000
+    body = b''.join(stream_compressed([data[:4000], data[4000:]], 'zstd'))
+    assert zstandard.ZstdDecompressor().decompressobj().decompress(body) == data
+    assert zstandard.ZstdDecompressor().decompress(compression.compress(data, 'zstd')) == data
+
+
+@pytest.fixture
+def client(gzip_only):
+    app = Flask(__name__)
+    install_compression(app, min_size=100)
+    install_compression(app, min_size=100)
+
+    @app.route('/big')
+    def big():
+        return {'data': 'x' * 500}
+
+    @app.route('/small')
+    def small():
+        return {'ok': True}
+
+    @app.route('/binary')
+    def binary():
+        return Response(b'\0' * 500, mimetype='application/octet-stream')
+
+    @app.route('/stream')
+    def stream():
+        return Response((b'y' * 200 for _ in range(3)), mimetype='text/plain')
+
+    @app.route('/encoded')
+    def encoded():
+        return Response(b'z' * 500, mimetype='text/plain', headers={'Content-Encoding': 'br'})
+
+    return app.test_client()
+
+
+def test_large_json_is_gzipped(client):
+    response = client.get('/big', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.data) == b'{"data":"' + b'x' * 500 + b'"}\n'
+
+
+def test_identity_when_client_does_not_accept(client):
+    response = client.get('/big')
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.headers['Vary']
+
+
+@pytest.mark.parametrize('path', ['/small', '/binary', '/stream', '/encoded'])
+def test_left_alone(client, path):
+    response = client.get(path, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers.get('Content-Encoding') == ('br' if path == '/encoded' else None)
+
+
+def test_compress_response_respects_min_size_on_unknown_length(gzip_only):
+    app = Flask(__name__)
+    with app.test_request_context():
+        response = Response(b'x' * 50, mimetype='text/plain')
+        response.headers.pop('Content-Length', None)
+        assert 'Content-Encoding' not in compress_response(response, 'gzip', min_size=100).headers
+        response = Response(b'x' * 500, mimetype='text/plain')
+        assert zlib.decompress(compress_response(response, 'gzip', min_size=100).get_data(), 31) == b'x' * 500
@@ -0,0 +1,82 @@
+import time
+
+from denied_cache import BloomFilter, DeniedIPCache
+
+
+def test_denial_is_cached_for_its_ttl(monkeypatch):
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now)
+    cache = DeniedIPCache(ttl_seconds=10)
+    assert not cache.is_denied('198.51.100.1')
+    cache.add('198.51.100.1')
+    assert cache.is_denied('198.51.100.1')
+
+    monkeypatch.setattr(time, 'monotonic', lambda: now + 11)
+    assert not cache.is_denied('198.51.100.1')
+    assert cache.stats()['entries'] == 0
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_oldest_entry_is_evicted_first():
+    cache = DeniedIPCache(max_entries=2)
+    cache.add('198.51.100.1')
+    cache.add('198.51.100.2')
+    cache.add('198.51.100.1')  # Refreshed, so .2 is now the oldest
+    cache.add('198.51.100.3')
+    assert cache.is_denied('198.51.100.1')
+    assert not cache.is_denied('198.51.100.2')
+    assert cache.evictions == 1
+
+
+def test_whitelisting_invalidates_addresses_and_networks():
+    cache = DeniedIPCache()
+    for ip in ('10.0.0.1', '10.0.0.2', '10.1.0.1', '2001:db8::1'):
+        cache.add(ip)
+    cache.invalidate('10.0.0.1')
+    assert not cache.is_denied('10.0.0.1')
+    cache.invalidate('10.0.0.0/16')
+    assert not cache.is_denied('10.0.0.2')
+    assert cache.is_denied('10.1.0.1')
+    cache.invalidate('2001:db8::/32')
+    assert not cache.is_denied('2001:db8::1')
+    cache.invalidate('not a network/8')
+    assert cache.invalidations == 3
+
+
+def test_without_bloom_every_denial_is_logged():
+    cache = DeniedIPCache(ttl_seconds=0)
+    assert cache.add('198.51.100.1')
+    assert cache.add('198.51.100.1')
+
+
+def test_bloom_suppresses_repeat_log_rows_until_reset(monkeypatch):
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now)
+    cache = DeniedIPCache(ttl_seconds=1, bloom_bits=8192, bloom_reset_seconds=60)
+    assert cache.add('198.51.100.1')
+    assert not cache.add('198.51.100.1')
+    assert cache.add('198.51.100.2')
+    assert cache.suppressed_logs == 1
+
+    monkeypatch.setattr(time, 'monotonic', lambda: now + 61)
+    assert cache.add('198.51.100.1')
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(64 * 1024)
+    keys = [f'10.0.{i // 256}.{i % 256}' for i in range(2000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    false_positives = sum(f'172.16.{i // 256}.{i % 256}' in bloom for i in range(2000))
+    assert false_positives < 20
+    bloom.clear()
+    assert keys[0] not in bloom
+
+
+def test_clear_forgets_everything():
+    cache = DeniedIPCache(bloom_bits=1024)
+    cache.add('198.51.100.1')
+    cache.clear()
+    assert not cache.is_denied('198.51.100.1')
+    assert cache.add('198.51.100.1')
@@ -0,0 +1,61 @@
+import pytest
+
+from rate_limiter import RateLimitResult
+
+CLIENT = {'customer_id': 'c1', 'plan_type': 'basic', 'rate_limit': 1000}
+ALLOWED = {'X-Forwarded-For': '93.184.216.34'}
+
+
+@pytest.fixture
+def client(proxy_app, monkeypatch):
+    manager = proxy_app.whitelist_manager
+    monkeypatch.setattr(manager, 'is_ip_allowed', lambda ip: (True, CLIENT))
+    monkeypatch.setattr(manager, 'rate_limit_status',
+                        lambda ip, limit, plan: RateLimitResult(True, limit, limit - 1, 60))
+    monkeypatch.setattr(manager, 'log_usage', lambda *args: None)
+    return proxy_app.app.test_client()
+
+
+def test_all_fields_by_default(client, proxy_app):
+    body = client.get('/some/path?a=1', headers=ALLOWED).get_json()
+    assert list(body) == list(proxy_app.ECHO_FIELDS)
+    assert body['received_path'] == '/some/path'
+    assert body['client_ip_from_headers'] == '93.184.216.34'
+    assert (body['form'], body['json_body']) == ({}, None)
+
+
+def test_selected_fields_come_back_in_canonical_order(client):
+    response = client.get('/x?fields=args, method,bogus', headers=ALLOWED)
+    assert list(response.get_json()) == ['method', 'args']
+
+    response = client.get('/x', headers={**ALLOWED, 'X-Fields': 'status'})
+    assert response.get_json() == {'status': 'success'}
+
+
+def test_no_known_fields_is_a_400(client, proxy_app):
+    response = client.get('/x?fields=nope', headers=ALLOWED)
+    assert response.status_code == 400
+    body = response.get_json()
+    assert (body['requested'], body['available']) == ('nope', list(proxy_app.ECHO_FIELDS))
+
+
+def test_small_bodies_are_echoed(client):
+    # The catch-all route only takes GET; probes that echo a body send it with GET
+    body = client.get('/x?fields=json_body', headers=ALLOWED, json={'a': 1}).get_json()
+    assert body == {'json_body': {'a': 1}}
+    body = client.get('/x?fields=form', headers=ALLOWED, data={'k': 'v'}).get_json()
+    assert body == {'form': {'k': 'v'}}
+
+
+def test_large_bodies_are_not_buffered(client, proxy_app):
+    payload = '"' + 'x' * proxy_app.ECHO_MAX_BODY_BYTES + '"'
+    response = client.get('/x?fields=json_body', headers=ALLOWED, data=payload,
+                           content_type='application/json')
+    assert response.get_json() == {'json_body': None}
+
+
+def test_echo_body_allowed(proxy_app):
+    assert proxy_app.echo_body_allowed(0)
+    assert proxy_app.echo_body_allowed(proxy_app.ECHO_MAX_BODY_BYTES)
+    assert not proxy_app.echo_body_allowed(proxy_app.ECHO_MAX_BODY_BYTES + 1)
+    assert not proxy_app.echo_body_allowed(None)
@@ -0,0 +1,65 @@
+import sqlite3
+
+import pytest
+
+from endpoint_policy import PLAN_LIMITS, EndpointPolicy, PolicyTable, plan_level
+
+
+def test_plan_level_defaults_to_basic():
+    assert plan_level('enterprise') == 2
+    assert plan_level('unknown') == 0
+    assert plan_level(None) == 0
+
+
+def test_policy_parses_methods_and_applies_override():
+    policy = EndpointPolicy('/api/v1/echo', [' get', 'POST ', ''], 'premium', rate_limit_override=5)
+    assert policy.methods == {'GET', 'POST'}
+    assert policy.required_level == 1
+    # The override replaces the per-minute limit only
+    assert policy.limits_for('enterprise') == (5, PLAN_LIMITS['enterprise'][1])
+    assert policy.limits_for('unknown') == (5, PLAN_LIMITS['basic'][1])
+    with pytest.raises(TypeError):
+        policy.limits['basic'] = (1, 1)
+
+
+def test_unknown_required_plan_falls_back_to_basic():
+    policy = EndpointPolicy('/x', ['GET'], 'platinum')
+    assert (policy.required_plan, policy.required_level) == ('basic', 0)
+    assert policy.limits_for('premium') == PLAN_LIMITS['premium']
+
+
+def test_table_from_connection():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE api_endpoints (path TEXT, method TEXT, required_plan TEXT, '
+                 'rate_limit_override INTEGER, is_active BOOLEAN)')
+    conn.executemany('INSERT INTO api_endpoints VALUES (?, ?, ?, ?, ?)', [
+        ('/api/v1/stats', 'GET', 'premium', None, 1),
+        ('/api/v1/batch', 'POST', 'enterprise', 10, 0),
+        ('/api/v1/odd', None, 'basic', None, 1),
+    ])
+    table = PolicyTable.from_connection(conn)
+
+    assert len(table) == 3
+    assert table.get('/api/v1/stats').methods == {'GET'}
+    assert not table.get('/api/v1/batch').is_active
+    assert table.get('/api/v1/odd').methods == frozenset()
+    assert table.get('/missing') is None
+    assert table.get(None) is None
+
+    assert table.limits('/api/v1/batch', 'enterprise') == (10, PLAN_LIMITS['enterprise'][1])
+    assert table.limits('/missing', 'premium') == PLAN_LIMITS['premium']
+    assert table.limits(None, 'unknown') == PLAN_LIMITS['basic']
+
+    described = table.as_dict()['/api/v1/batch']
+    assert described['methods'] == ['POST']
+    assert described['limits']['basic'] == {'per_minute': 10, 'per_day': PLAN_LIMITS['basic'][1]}
+
+
+def test_windows_add_a_route_window_only_for_overrides():
+    table = PolicyTable([('/api/v1/stats', 'GET', 'basic', 10, 1), ('/api/v1/ping', 'GET', 'basic', None, 1)])
+    per_minute, per_day = PLAN_LIMITS['premium']
+    assert table.windows('/api/v1/stats', 'premium') == [
+        ('/api/v1/stats', 10, per_day), (None, per_minute, per_day)]
+    assert table.windows('/api/v1/ping', 'premium') == [(None, per_minute, per_day)]
+    assert table.windows(None, 'unknown') == [(None, *PLAN_LIMITS['basic'])]
+    assert table.as_dict()['/api/v1/stats']['rate_limit_override'] == 10
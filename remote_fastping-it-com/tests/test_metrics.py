@@ -0,0 +1,59 @@
+import pytest
+from flask import Flask
+
+import metrics
+
+
+def make_app(**kwargs):
+    app = Flask(__name__)
+    metrics.install_metrics_endpoint(app, **kwargs)
+    metrics.install_metrics_endpoint(app, **kwargs)
+    return app.test_client()
+
+
+def test_metrics_endpoint_serves_the_registry():
+    pytest.importorskip('prometheus_client')
+    refreshed = []
+    metrics.RATE_LIMIT_REJECTIONS.labels('metrics-test', 'basic').inc()
+    response = make_app(refresh=lambda: refreshed.append(True)).get('/metrics')
+    assert response.status_code == 200
+    assert refreshed == [True]
+    assert b'fastping_rate_limit_rejections_total{app="metrics-test",plan="basic"} 1.0' in response.data
+
+
+def test_multiprocess_mode_reads_the_shared_directory(tmp_path, monkeypatch):
+    pytest.importorskip('prometheus_client')
+    monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(tmp_path))
+    monkeypatch.setattr(metrics, 'MULTIPROCESS', True)
+    response = make_app().get('/metrics')
+    assert response.status_code == 200
+    # Nothing written to the directory yet, so none of this process's metrics show
+    assert b'fastping_rate_limit_rejections_total' not in response.data
+
+
+def test_without_prometheus_client(monkeypatch):
+    monkeypatch.setattr(metrics, 'PROMETHEUS_AVAILABLE', False)
+    response = make_app().get('/metrics')
+    assert response.status_code == 503
+    metrics.mark_process_dead(12345)
+
+    noop = metrics._NoopMetric()
+    assert noop.labels('a', plan='b') is noop
+    noop.observe(1.0)
+    noop.inc()
+    noop.set(3)
+
+
+def test_reset_multiprocess_dir(tmp_path, monkeypatch):
+    directory = tmp_path / 'prometheus'
+    monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(directory))
+    metrics.reset_multiprocess_dir()
+    assert directory.is_dir()
+
+    (directory / 'counter_123.db').write_bytes(b'stale')
+    (directory / 'README').write_text('kept')
+    metrics.reset_multiprocess_dir()
+    assert sorted(path.name for path in directory.iterdir()) == ['README']
+
+    monkeypatch.delenv('PROMETHEUS_MULTIPROC_DIR')
+    metrics.reset_multiprocess_dir()
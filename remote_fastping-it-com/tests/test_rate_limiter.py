@@ -0,0 +1,232 @@
+import asyncio
+import calendar
+import os
+import threading
+import time
+
+import pytest
+
+from rate_limiter import (DAY, GCRA, MINUTE, LocalDualWindowLimiter, RateLimitResult, RedisDualWindowLimiter,
+                          RedisRateLimiter, SharedTokenBucket)
+
+MIDNIGHT = calendar.timegm((2026, 3, 1, 0, 0, 0))
+
+
+@pytest.fixture
+def local(tmp_path):
+    limiter = LocalDualWindowLimiter(str(tmp_path / 'buckets.bin'), slots=1024, stripes=16)
+    yield limiter
+    limiter.close()
+
+
+@pytest.fixture
+def fake_redis():
+    fakeredis = pytest.importorskip('fakeredis')
+    pytest.importorskip('lupa')
+    return fakeredis.FakeRedis()
+
+
+def test_minute_denial_spends_no_day_quota_and_reports_it(local):
+    now = MIDNIGHT + 3600
+    assert local.check('k', 2, 10, now).allowed
+    assert local.check('k', 2, 10, now).allowed
+    denied = local.check('k', 2, 10, now)
+    assert (denied.allowed, denied.denied_by) == (False, MINUTE)
+    assert denied.day_remaining == 8
+    assert denied.minute_remaining == 0
+
+
+def test_day_denial_spends_no_minute_quota(local):
+    now = MIDNIGHT + 3600
+    local.check('k', 5, 2, now)
+    local.check('k', 5, 2, now)
+    denied = local.check('k', 5, 2, now)
+    assert (denied.allowed, denied.denied_by, denied.day_remaining) == (False, DAY, 0)
+    assert denied.minute_remaining == 3
+    assert denied.retry_after_seconds == 82800
+    # Only the two allowed calls count against the minute
+    assert local.check('k', 5, 100, now).minute_remaining == 2
+
+
+def test_day_resets_at_utc_midnight(local):
+    late = MIDNIGHT + 86400 - 90
+    assert local.check('k', 10, 1, late).day_reset_seconds == 90
+    assert local.check('k', 10, 1, late).denied_by == DAY
+    after = local.check('k', 10, 1, MIDNIGHT + 86400 + 1)
+    assert after.allowed
+    assert after.day_reset_seconds == 86399
+
+
+def test_previous_minute_decays_linearly(local):
+    start = MIDNIGHT + 600
+    for _ in range(4):
+        assert local.check('k', 4, 100, start + 59).allowed
+    # Half way through the next minute half of the previous count still weighs in
+    result = local.check('k', 4, 100, start + 90)
+    assert result.allowed
+    assert result.minute_remaining == 1
+    assert local.check('k', 4, 100, start + 90).minute_remaining == 0
+    denied = local.check('k', 4, 100, start + 90)
+    assert denied.denied_by == MINUTE
+    # Retry once one request's worth of the previous minute has decayed (60s / 4),
+    # not at the end of the minute
+    assert denied.minute_reset_seconds == 15
+
+
+def test_keys_and_processes_share_the_table(tmp_path):
+    path = str(tmp_path / 'buckets.bin')
+    first = LocalDualWindowLimiter(path, slots=1024, stripes=16)
+    second = LocalDualWindowLimiter(path, slots=1024, stripes=16)
+    now = MIDNIGHT + 3600
+    assert first.check('a', 1, 10, now).allowed
+    assert second.check('a', 1, 10, now).denied_by == MINUTE
+    assert second.check('b', 1, 10, now).allowed
+    first.close()
+    second.close()
+
+
+def wait_for_fresh_minute():
+    # Compared against Redis' own clock; don't straddle a minute boundary
+    if time.time() % 60 > 55:
+        time.sleep(60 - time.time() % 60 + 0.1)
+
+
+@pytest.mark.parametrize('per_minute, per_day, calls', [(3, 10, 6), (10, 4, 7), (5, 5, 8)])
+def test_local_matches_the_redis_script(local, fake_redis, per_minute, per_day, calls):
+    wait_for_fresh_minute()
+    remote = RedisDualWindowLimiter(fake_redis, 'rl:test')
+    for _ in range(calls):
+        expected = remote.check('k', per_minute, per_day)
+        actual = local.check('k', per_minute, per_day)
+        assert (actual.allowed, actual.denied_by, actual.minute_remaining, actual.day_remaining) == (
+            expected.allowed, expected.denied_by, expected.minute_remaining, expected.day_remaining)
+        assert actual.minute_reset_seconds == pytest.approx(expected.minute_reset_seconds, abs=1)
+        assert actual.day_reset_seconds == pytest.approx(expected.day_reset_seconds, abs=1)
+
+
+def test_redis_dual_window_never_counts_a_refused_request(fake_redis):
+    wait_for_fresh_minute()
+    limiter = RedisDualWindowLimiter(fake_redis, 'rl:test')
+    for _ in range(2):
+        limiter.check('k', 2, 10)
+    assert limiter.check('k', 2, 10).denied_by == MINUTE
+    assert fake_redis.hget('rl:test:k', 'dc') == b'2'
+
+
+@pytest.mark.parametrize('plan, mode_key', [('basic', 'sw'), ('enterprise', 'gcra')])
+def test_redis_limiter_allows_up_to_the_limit(fake_redis, plan, mode_key):
+    wait_for_fresh_minute()
+    limiter = RedisRateLimiter(fake_redis, plan_modes={'enterprise': GCRA})
+    results = [limiter.check('ip', 3, plan) for _ in range(4)]
+    assert [r.allowed for r in results] == [True, True, True, False]
+    assert results[0].remaining == 2
+    assert results[-1].reset_seconds > 0
+    assert fake_redis.exists(f'rl:{mode_key}:ip')
+    # Other identifiers have their own window
+    assert limiter.check('other-ip', 3, plan).allowed
+
+
+def test_gcra_spaces_requests_without_burst(fake_redis):
+    limiter = RedisRateLimiter(fake_redis, default_mode=GCRA)
+    assert limiter.check('ip', 60, burst=1).allowed
+    denied = limiter.check('ip', 60, burst=1)
+    assert not denied.allowed
+    # One request per second: retry within a second, not at the end of the minute
+    assert 0 < denied.reset_seconds <= 1
+
+
+def test_sliding_window_is_atomic_under_concurrency(fake_redis):
+    wait_for_fresh_minute()
+    limiter = RedisRateLimiter(fake_redis)
+    allowed = []
+
+    def worker():
+        for _ in range(5):
+            allowed.append(limiter.check('ip', 10).allowed)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert allowed.count(True) == 10
+
+
+def test_result_headers():
+    result = RateLimitResult(True, 100, 42, 0.2)
+    assert result.headers() == {'X-RateLimit-Limit': '100', 'X-RateLimit-Remaining': '42',
+                                'X-RateLimit-Reset': '1'}
+
+
+def test_async_check_uses_the_same_script():
+    fakeredis = pytest.importorskip('fakeredis')
+    pytest.importorskip('lupa')
+    wait_for_fresh_minute()
+    limiter = RedisRateLimiter(fakeredis.FakeAsyncRedis())
+
+    async def run():
+        return [await limiter.acheck('ip', 2) for _ in range(3)]
+
+    assert [r.allowed for r in asyncio.run(run())] == [True, True, False]
+
+
+@pytest.fixture
+def bucket(tmp_path):
+    bucket = SharedTokenBucket(str(tmp_path / 'tb.bin'), slots=256, stripes=16, window_seconds=60)
+    yield bucket
+    bucket.close()
+
+
+def test_token_bucket_allows_up_to_the_limit(bucket):
+    results = [bucket.check('ip', 2) for _ in range(3)]
+    assert [r.allowed for r in results] == [True, True, False]
+    assert results[0].remaining == 1
+    # One token refills in window / limit seconds
+    assert results[-1].reset_seconds == pytest.approx(30, abs=0.1)
+    assert bucket.check('other', 2).allowed
+
+
+def test_token_bucket_refills_over_time(bucket, monkeypatch):
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now)
+    for _ in range(2):
+        bucket.check('ip', 2)
+    assert not bucket.check('ip', 2).allowed
+    monkeypatch.setattr(time, 'time', lambda: now + 31)
+    assert bucket.check('ip', 2).allowed
+    assert not bucket.check('ip', 2).allowed
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_token_buckets_are_shared_between_processes(bucket):
+    bucket.check('ip', 2)
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.write(write, b'1' if bucket.check('ip', 2).allowed else b'0')
+            os.write(write, b'1' if bucket.check('ip', 2).allowed else b'0')
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    assert os.read(read, 2) == b'10'
+    assert not bucket.check('ip', 2).allowed
+
+
+def test_full_stripe_evicts_the_stalest_bucket(tmp_path, monkeypatch):
+    bucket = SharedTokenBucket(str(tmp_path / 'small.bin'), slots=4, stripes=1, window_seconds=60)
+    now = time.time()
+    for offset, key in enumerate(['a', 'b', 'c', 'd']):
+        monkeypatch.setattr(time, 'time', lambda: now + offset)
+        bucket.check(key, 1)
+    monkeypatch.setattr(time, 'time', lambda: now + 10)
+    assert bucket.check('e', 1).allowed
+    assert bucket.evictions == 1
+    # 'a' was the stalest and lost its slot, so it starts over with a full bucket
+    assert bucket.check('a', 1).allowed
+    bucket.close()
+
+
+def test_slots_must_divide_into_stripes(tmp_path):
+    with pytest.raises(ValueError):
+        SharedTokenBucket(str(tmp_path / 'bad.bin'), slots=100, stripes=16)
@@ -0,0 +1,43 @@
+from werkzeug.datastructures import Headers
+
+from request_context import RequestContext, parse_forwarded
+
+
+def context(peer='10.0.0.2', **headers):
+    return RequestContext(Headers([(k.replace('_', '-'), v) for k, v in headers.items()]), peer)
+
+
+def test_whitelist_ip_is_first_x_forwarded_for_hop():
+    ctx = context(X_Forwarded_For='203.0.113.7, 10.0.0.1')
+    assert ctx.whitelist_ip == '203.0.113.7'
+
+
+def test_whitelist_ip_falls_back_to_peer():
+    assert context().whitelist_ip == '10.0.0.2'
+
+
+def test_whitelist_ip_ignores_forwarded_and_x_real_ip():
+    # Client-settable headers outside the baseline trust set can't claim an identity
+    ctx = context(Forwarded='for=93.184.216.34', X_Real_IP='93.184.216.35')
+    assert ctx.whitelist_ip == '10.0.0.2'
+    # They still inform the (non-authoritative) client IP
+    assert ctx.client_ip == '93.184.216.34'
+
+
+def test_client_ip_prefers_first_public_hop():
+    # (documentation ranges like 203.0.113.0/24 count as private to ipaddress)
+    ctx = context(X_Forwarded_For='192.168.1.5, 93.184.216.34')
+    assert ctx.client_ip == '93.184.216.34'
+    assert ctx.whitelist_ip == '192.168.1.5'
+
+
+def test_parse_forwarded_strips_ports_and_brackets():
+    header = 'for=192.0.2.60:8080;proto=http, for="[2001:db8::1]:443", by=203.0.113.43'
+    assert parse_forwarded(header) == ['192.0.2.60', '2001:db8::1']
+
+
+def test_anonymity_levels():
+    assert context(Via='1.1 proxy').anonymity() == 'transparent'
+    assert context(X_Forwarded_For='203.0.113.7').anonymity() == 'transparent'
+    assert context().anonymity('10.0.0.9') == 'anonymous'
+    assert context().anonymity('10.0.0.2') == 'elite'
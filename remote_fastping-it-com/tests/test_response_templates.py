@@ -0,0 +1,35 @@
+import orjson
+import pytest
+
+from response_templates import DENIED_TEMPLATE, PING_TEMPLATES, ResponseTemplate
+
+
+@pytest.mark.parametrize('value', ['203.0.113.7', '2001:db8::1', None, 'quote " and %s %% here', 'ünïcode'])
+def test_ping_templates_match_orjson(value):
+    for level, template in PING_TEMPLATES.items():
+        assert template.render_one(value) == orjson.dumps({
+            "anonymity_level": level,
+            "client_ip_from_headers": value,
+            "message": "Premium proxy test endpoint active",
+            "status": "success"
+        })
+
+
+def test_denied_template_matches_orjson():
+    assert DENIED_TEMPLATE.render_one('198.51.100.1') == orjson.dumps({
+        'error': 'Access denied',
+        'message': 'IP not whitelisted for paid service',
+        'ip': '198.51.100.1',
+        'contact': 'sales@yourservice.com'
+    })
+
+
+def test_multiple_variables_keep_key_order():
+    template = ResponseTemplate({'b': None, 'const': '100%', 'a': None}, ['a', 'b'])
+    assert template.render(a=[1, 2], b={'x': 1.5}) == orjson.dumps(
+        {'b': {'x': 1.5}, 'const': '100%', 'a': [1, 2]})
+
+
+def test_unknown_variable_is_rejected():
+    with pytest.raises(ValueError):
+        ResponseTemplate({'a': 1}, ['missing'])
@@ -0,0 +1,226 @@
+import os
+import threading
+import time
+
+import pytest
+
+from sqlite_pool import PoolTimeout, SQLitePool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = SQLitePool(str(tmp_path / 'pool.db'), max_connections=2, checkout_timeout_ms=200, fork_wait_ms=200)
+    with pool.transaction() as conn:
+        conn.execute('CREATE TABLE t (v INTEGER)')
+    yield pool
+    pool.close_all()
+
+
+def test_thread_per_request_reuses_connections(pool):
+    # One short-lived thread per "request", as a threaded dev server would do
+    def request():
+        with pool.connection() as conn:
+            conn.execute('SELECT COUNT(*) FROM t').fetchone()
+
+    for _ in range(6):
+        worker = threading.Thread(target=request)
+        worker.start()
+        worker.join()
+
+    stats = pool.stats()
+    assert stats['connections_opened'] == 1
+    assert stats['reused_checkouts'] == stats['checkouts'] - 1
+
+
+def test_pool_is_bounded_and_waiters_time_out(pool):
+    with pool.connection(), pool.connection():
+        with pytest.raises(PoolTimeout):
+            with pool.connection():
+                pass
+    stats = pool.stats()
+    assert stats['open_connections'] == 2
+    assert stats['checkout_timeouts'] == 1
+
+
+def test_waiter_gets_returned_connection(pool):
+    got = []
+
+    def waiter():
+        with pool.connection() as conn:
+            got.append(conn)
+
+    with pool.connection() as first, pool.connection():
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        deadline = time.monotonic() + 1
+        while pool.waits == 0 and time.monotonic() < deadline:
+            time.sleep(0.001)
+    # Returning the busy connections hands one to the waiter instead of opening a third
+    thread.join(1)
+    assert got and got[0] in pool._all
+    stats = pool.stats()
+    assert stats['connections_opened'] == 2
+    assert stats['checkout_waits'] == 1
+
+
+def test_transaction_commits_and_rolls_back(pool):
+    with pool.transaction() as conn:
+        conn.execute('INSERT INTO t VALUES (1)')
+    with pytest.raises(RuntimeError):
+        with pool.transaction() as conn:
+            conn.execute('INSERT INTO t VALUES (2)')
+            raise RuntimeError('boom')
+    with pool.connection() as conn:
+        assert conn.execute('SELECT v FROM t').fetchall() == [(1,)]
+
+
+def test_open_transaction_is_rolled_back_on_return(pool):
+    with pool.connection() as conn:
+        conn.execute('INSERT INTO t VALUES (3)')
+        assert conn.in_transaction
+    with pool.connection() as conn:
+        assert not conn.in_transaction
+        assert conn.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 0
+
+
+def test_connections_are_tuned(pool):
+    with pool.connection() as conn:
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_forked_child_opens_its_own_connections(pool):
+    with pool.connection():
+        pass
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            with pool.connection() as conn:
+                conn.execute('SELECT 1')
+            os.write(write, str(pool.stats()['connections_opened']).encode())
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    assert os.read(read, 16) == b'1'
+    assert pool.stats()['connections_opened'] == 1
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_fork_while_another_thread_holds_the_lock(pool):
+    held, release = threading.Event(), threading.Event()
+
+    def holder():
+        with pool._lock:
+            held.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=holder)
+    thread.start()
+    held.wait(1)
+    read, write = os.pipe()
+    # fork() gives up waiting for the lock after fork_wait_ms
+    pid = os.fork()
+    if pid == 0:
+        try:
+            # Would deadlock on the copied, still-held lock without the at-fork reset
+            with pool.connection() as conn:
+                conn.execute('SELECT 1')
+            os.write(write, b'ok')
+        finally:
+            os._exit(0)
+    release.set()
+    thread.join()
+    os.waitpid(pid, 0)
+    assert os.read(read, 2) == b'ok'
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_fork_waits_for_checked_out_connections(pool):
+    checked_out, returned_at = threading.Event(), []
+
+    def query():
+        with pool.connection() as conn:
+            checked_out.set()
+            time.sleep(0.1)
+            conn.execute('SELECT COUNT(*) FROM t').fetchone()
+            returned_at.append(time.monotonic())
+
+    thread = threading.Thread(target=query)
+    thread.start()
+    checked_out.wait(1)
+    assert pool.stats()['checked_out_connections'] == 1
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0)
+    forked_at = time.monotonic()
+    os.waitpid(pid, 0)
+    thread.join()
+    # No thread was inside SQLite when the child was created
+    assert returned_at and returned_at[0] <= forked_at
+    assert pool.stats()['checked_out_connections'] == 0
+
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_checkouts_wait_while_a_fork_drains(pool):
+    first_out, times = threading.Event(), {}
+
+    def first():
+        with pool.connection() as conn:
+            first_out.set()
+            time.sleep(0.15)
+            conn.execute('SELECT 1')
+        times['first_returned'] = time.monotonic()
+
+    def second():
+        # Arrives mid-drain and would hold its connection past fork_wait_ms
+        time.sleep(0.05)
+        with pool.connection() as conn:
+            times['second_out'] = time.monotonic()
+            time.sleep(0.3)
+            conn.execute('SELECT 1')
+
+    threads = [threading.Thread(target=first), threading.Thread(target=second)]
+    threads[0].start()
+    first_out.wait(1)
+    threads[1].start()
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0)
+    os.waitpid(pid, 0)
+    for thread in threads:
+        thread.join()
+    assert times['second_out'] >= times['first_returned']
+    assert pool.stats()['unsafe_forks'] == 0
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_fork_that_cannot_drain_is_reported(pool, capfd):
+    checked_out, release = threading.Event(), threading.Event()
+
+    def holder():
+        with pool.connection():
+            checked_out.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=holder)
+    thread.start()
+    checked_out.wait(1)
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0)
+    release.set()
+    thread.join()
+    os.waitpid(pid, 0)
+    assert pool.stats()['unsafe_forks'] == 1
+    assert 'forking with 1 connection(s) still checked out' in capfd.readouterr().out
+
+def test_checkouts_outstanding_across_close_all_are_counted_back(pool):
+    with pool.connection():
+        pool.close_all()
+    assert pool.stats()['checked_out_connections'] == 0
+    with pool.connection() as conn:
+        conn.execute('SELECT 1')
+    assert pool.stats()['checked_out_connections'] == 0
@@ -0,0 +1,114 @@
+import math
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from timing_wheel import TimingWheel
+from whitelist_snapshot import WhitelistSnapshot
+
+
+def start_of(wheel):
+    return wheel._current_tick * wheel.tick_seconds
+
+
+def test_key_fires_on_its_tick():
+    wheel = TimingWheel(tick_seconds=1.0)
+    start = start_of(wheel)
+    wheel.schedule('a', start + 2.5)
+    assert wheel.advance(start + 2) == []
+    assert wheel.advance(start + 3) == ['a']
+    assert wheel.advance(start + 10) == []
+    assert len(wheel) == 0
+
+
+def test_past_deadline_fires_on_next_advance():
+    wheel = TimingWheel()
+    start = start_of(wheel)
+    wheel.schedule('late', start - 5)
+    assert wheel.advance(start) == ['late']
+
+
+def test_reschedule_and_cancel():
+    wheel = TimingWheel()
+    start = start_of(wheel)
+    wheel.schedule('a', start + 2)
+    wheel.schedule('a', start + 5)
+    wheel.schedule('b', start + 2)
+    assert wheel.cancel('b')
+    assert not wheel.cancel('missing')
+    assert wheel.advance(start + 4) == []
+    assert wheel.advance(start + 5) == ['a']
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_a_sorted_reference_across_levels_and_overflow(seed):
+    rng = random.Random(seed)
+    # Small wheels so deadlines cascade through every level and the overflow set
+    wheel = TimingWheel(tick_seconds=0.5, wheel_size=4, levels=2)
+    start = start_of(wheel)
+    deadlines = {f'k{i}': start + rng.uniform(-1, 60) for i in range(300)}
+    wheel.schedule_many(deadlines.items())
+    assert len(wheel) == 300
+
+    fired = {}
+    for step in range(0, 130):
+        now = start + step * 0.5
+        for key in wheel.advance(now):
+            fired[key] = now
+    assert len(fired) == 300
+    for key, deadline in deadlines.items():
+        due = max(start, math.ceil(deadline / 0.5) * 0.5)
+        assert fired[key] == pytest.approx(due), key
+
+
+def test_clear():
+    wheel = TimingWheel()
+    start = start_of(wheel)
+    wheel.schedule_many([('a', start + 1), ('b', start + 10 ** 6)])
+    wheel.clear()
+    assert len(wheel) == 0
+    assert wheel.advance(start + 2) == []
+
+
+
+def whitelist_rows(hours_by_host):
+    now = datetime.now()
+    return [(f'198.51.100.{host}', 'c1', 'basic', 100, (now + timedelta(hours=hours)).isoformat())
+            for host, hours in hours_by_host.items()]
+
+
+def test_whitelist_reload_reschedules_only_changed_entries(proxy_app, monkeypatch):
+    manager = proxy_app.whitelist_manager
+    wheel = TimingWheel()
+    monkeypatch.setattr(manager, 'expiry_wheel', wheel)
+    monkeypatch.setattr(manager, '_scheduled_expiries', {})
+    first = whitelist_rows({1: 1, 2: 2, 3: 3})
+    manager._schedule_expirations(WhitelistSnapshot(first))
+    assert len(wheel) == 3
+
+    scheduled = []
+    schedule_many = wheel.schedule_many
+
+    def recording_schedule_many(items):
+        items = list(items)
+        scheduled.extend(items)
+        schedule_many(items)
+
+    monkeypatch.setattr(wheel, 'schedule_many', recording_schedule_many)
+    monkeypatch.setattr(wheel, 'clear', lambda: pytest.fail('the wheel was cleared'))
+    # .1 keeps its expiry, .2 moves, .3 is gone, .4 is new
+    second = [first[0]] + whitelist_rows({2: 5, 4: 4})
+    manager._schedule_expirations(WhitelistSnapshot(second))
+
+    assert [entry for entry, _ in scheduled] == ['198.51.100.2', '198.51.100.4']
+    assert len(wheel) == 3
+    assert not wheel.cancel('198.51.100.3')
+
+
+def test_expired_entries_leave_redis_without_a_snapshot_rebuild(proxy_app, monkeypatch):
+    manager = proxy_app.whitelist_manager
+    monkeypatch.setattr(manager, 'reload_snapshot', lambda: pytest.fail('snapshot rebuilt'))
+    proxy_app.redis_client.set('whitelist:198.51.100.9', '{}')
+    manager.evict_expired(['198.51.100.9'])
+    assert not proxy_app.redis_client.exists('whitelist:198.51.100.9')
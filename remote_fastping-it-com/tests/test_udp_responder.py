@@ -0,0 +1,106 @@
+import asyncio
+import socket
+
+import orjson
+import pytest
+
+from rate_limiter import RateLimitResult
+
+
+class FakeTransport:
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, data, addr):
+        self.sent.append((data, addr))
+
+
+class Limiter:
+    def __init__(self, allowed=True):
+        self.allowed = allowed
+        self.calls = []
+
+    def check(self, identifier, limit, plan_type):
+        self.calls.append((identifier, limit, plan_type))
+        return RateLimitResult(self.allowed, limit, limit - 1, 60)
+
+
+CLIENT = {'customer_id': 'c1', 'plan_type': 'premium', 'rate_limit': 50}
+
+
+@pytest.fixture
+def udp(proxy_app, monkeypatch):
+    import udp_responder
+    manager = udp_responder.whitelist_manager
+    allowed = {'127.0.0.1', '93.184.216.34'}
+    monkeypatch.setattr(manager, 'is_ip_allowed',
+                        lambda ip: (True, CLIENT) if ip in allowed else (False, None))
+    monkeypatch.setattr(manager, 'local_rate_limiter', Limiter())
+    submitted = []
+    monkeypatch.setattr(manager.usage_writer, 'submit_many', lambda rows: submitted.extend(rows))
+    udp_responder.submitted = submitted
+    return udp_responder
+
+
+def protocol_for(udp):
+    protocol = udp.UDPPingProtocol()
+    protocol.connection_made(FakeTransport())
+    return protocol
+
+
+def test_whitelisted_sender_gets_an_echo(udp):
+    protocol = protocol_for(udp)
+    addr = ('93.184.216.34', 40000)
+    protocol.datagram_received(b'probe-1', addr)
+
+    (reply, to), = protocol.transport.sent
+    assert to == addr
+    body = orjson.loads(reply)
+    assert (body['type'], body['echo']) == ('PONG', 'probe-1')
+    assert udp.whitelist_manager.local_rate_limiter.calls == [('udp:93.184.216.34', 50, 'premium')]
+    assert protocol.stats['replied'] == 1
+
+    protocol.flush_usage()
+    (ip, customer, endpoint, timestamp, response_ms, success), = udp.submitted
+    assert (ip, customer, endpoint, success) == ('93.184.216.34', 'c1', 'udp_ping', True)
+    assert len(timestamp) == 19 and response_ms >= 0
+    assert protocol.pending_usage == []
+
+
+def test_denied_oversized_and_limited_senders_get_no_reply(udp):
+    protocol = protocol_for(udp)
+    protocol.datagram_received(b'x', ('198.51.100.9', 1))
+    protocol.datagram_received(b'x' * (udp.MAX_DATAGRAM_BYTES + 1), ('93.184.216.34', 1))
+    udp.whitelist_manager.local_rate_limiter.allowed = False
+    protocol.datagram_received(b'x', ('93.184.216.34', 1))
+
+    assert protocol.transport.sent == []
+    assert protocol.stats == {'received': 3, 'replied': 0, 'denied': 1,
+                              'rate_limited': 1, 'oversized': 1}
+    # Rate-limited probes are still logged, as failures
+    protocol.flush_usage()
+    assert [row[-1] for row in udp.submitted] == [False]
+
+
+def test_flush_usage_without_rows_submits_nothing(udp):
+    protocol_for(udp).flush_usage()
+    assert udp.submitted == []
+
+
+def test_responder_over_a_real_socket(udp):
+    async def probe():
+        transport, protocol, flush_task = await udp.start_udp_responder('127.0.0.1', 0)
+        port = transport.get_extra_info('sockname')[1]
+        loop = asyncio.get_running_loop()
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.setblocking(False)
+            sock.connect(('127.0.0.1', port))
+            sock.send(b'hello')
+            reply = await asyncio.wait_for(loop.sock_recv(sock, 2048), 2)
+        flush_task.cancel()
+        transport.close()
+        return orjson.loads(reply), protocol
+
+    body, protocol = asyncio.run(probe())
+    assert body['echo'] == 'hello'
+    assert protocol.stats['replied'] == 1
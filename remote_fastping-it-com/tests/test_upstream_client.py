@@ -0,0 +1,118 @@
+import os
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from upstream_client import UpstreamClient
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'ok'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Set-Cookie', 'session=secret; Path=/')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def port():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client():
+    client = UpstreamClient(pool_maxsize=2, connect_timeout=1, read_timeout=2)
+    yield client
+    client.close()
+
+
+def test_connections_are_reused(client, port):
+    for _ in range(5):
+        assert client.get(f'http://127.0.0.1:{port}/x').text == 'ok'
+    stats = client.stats()
+    assert stats['requests'] == 5
+    assert (stats['connections_opened'], stats['connections_reused']) == (1, 4)
+    assert stats['reuse_rate'] == pytest.approx(0.8)
+    assert stats['hosts'] == {f'http://127.0.0.1:{port}': {'requests': 5, 'connections_opened': 1}}
+
+
+def test_cookies_are_not_kept(client, port):
+    client.get(f'http://127.0.0.1:{port}/')
+    session = client._session_for(f'http://127.0.0.1:{port}/')
+    assert len(session.cookies) == 0
+
+
+def test_default_timeout_and_override(client, port, monkeypatch):
+    seen = []
+    original = requests.Session.request
+
+    def spy(self, method, url, **kwargs):
+        seen.append(kwargs['timeout'])
+        return original(self, method, url, **kwargs)
+
+    monkeypatch.setattr(requests.Session, 'request', spy)
+    client.get(f'http://127.0.0.1:{port}/')
+    client.get(f'http://127.0.0.1:{port}/', timeout=9)
+    assert seen == [(1, 2), 9]
+
+
+def test_origins_are_case_insensitive_and_lru_bounded(port):
+    client = UpstreamClient(max_hosts=1)
+    client.get(f'http://127.0.0.1:{port}/')
+    client.get(f'HTTP://127.0.0.1:{port}/')
+    assert client.stats()['open_hosts'] == 1
+    client.get(f'http://localhost:{port}/')
+    stats = client.stats()
+    assert list(stats['hosts']) == [f'http://localhost:{port}']
+    assert stats['evicted'] == 1
+    # Closed pools still count towards the totals
+    assert (stats['requests'], stats['connections_opened']) == (3, 2)
+    client.close()
+
+
+def test_reap_idle(client, port):
+    client.get(f'http://127.0.0.1:{port}/')
+    assert client.reap_idle() == 0
+    client.idle_seconds = 0
+    assert client.reap_idle() == 1
+    stats = client.stats()
+    assert (stats['open_hosts'], stats['reaped'], stats['connections_opened']) == (0, 1, 1)
+
+
+def test_errors_are_counted(client):
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        closed_port = sock.getsockname()[1]
+    with pytest.raises(requests.ConnectionError):
+        client.get(f'http://127.0.0.1:{closed_port}/')
+    assert client.stats()['errors'] == 1
+
+
+def test_forked_child_starts_without_pools(client, port):
+    client.get(f'http://127.0.0.1:{port}/')
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            if client.reap_idle() == 0 and client.get(f'http://127.0.0.1:{port}/').text == 'ok':
+                code = 0 if client.stats()['open_hosts'] == 1 else 2
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert client.stats()['connections_opened'] == 1
@@ -0,0 +1,125 @@
+import os
+import sqlite3
+
+import pytest
+
+from usage_counters import WriteBehindCounters
+
+UPDATE_SQL = '''
+    UPDATE api_keys SET total_requests = total_requests + ?,
+    last_used_at = MAX(COALESCE(last_used_at, ''), ?)
+    WHERE api_key = ?
+'''
+
+
+def create_table(db_path, keys=('k1', 'k2')):
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE api_keys (api_key TEXT PRIMARY KEY, '
+                 'total_requests INTEGER DEFAULT 0, last_used_at TIMESTAMP)')
+    conn.executemany('INSERT INTO api_keys (api_key) VALUES (?)', [(k,) for k in keys])
+    conn.commit()
+    conn.close()
+
+
+def rows(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return {key: (total, last) for key, total, last in
+                conn.execute('SELECT api_key, total_requests, last_used_at FROM api_keys')}
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'keys.db')
+    create_table(path)
+    return path
+
+
+@pytest.fixture
+def counters(db_path):
+    counters = WriteBehindCounters(db_path, UPDATE_SQL, flush_interval_ms=60000)
+    yield counters
+    counters.close()
+
+
+def test_deltas_are_aggregated_and_added(counters, db_path):
+    counters.add('k1', last_used='2026-01-01 00:00:02')
+    counters.add('k1', last_used='2026-01-01 00:00:01')
+    counters.add('k2', count=5, last_used='2026-01-01 00:00:03')
+    assert counters.pending_keys == 2
+    assert rows(db_path)['k1'] == (0, None)
+
+    assert counters.flush()
+    assert rows(db_path) == {'k1': (2, '2026-01-01 00:00:02'), 'k2': (5, '2026-01-01 00:00:03')}
+
+    # A later flush adds on top and never moves last-used backwards
+    counters.add('k1', last_used='2025-12-31 23:59:59')
+    counters.flush()
+    assert rows(db_path)['k1'] == (3, '2026-01-01 00:00:02')
+    stats = counters.stats()
+    assert (stats['added'], stats['flushed'], stats['flushes'], stats['pending_keys']) == (8, 8, 2, 0)
+
+
+def test_default_last_used_is_utc_timestamp(counters, db_path):
+    counters.add('k1')
+    counters.flush()
+    total, last_used = rows(db_path)['k1']
+    assert total == 1
+    assert len(last_used) == 19 and last_used[10] == ' '
+
+
+def test_failed_flush_keeps_deltas(tmp_path):
+    db_path = str(tmp_path / 'late.db')
+    counters = WriteBehindCounters(db_path, UPDATE_SQL, flush_interval_ms=60000)
+    counters.add('k1', last_used='2026-01-01 00:00:01')
+    assert not counters.flush()
+    counters.add('k1', last_used='2026-01-01 00:00:05')
+    assert counters.stats()['failed_flushes'] == 1
+
+    create_table(db_path)
+    assert counters.flush()
+    assert rows(db_path)['k1'] == (2, '2026-01-01 00:00:05')
+    counters.close()
+
+
+def test_two_writers_share_rows(db_path):
+    first = WriteBehindCounters(db_path, UPDATE_SQL, flush_interval_ms=60000)
+    second = WriteBehindCounters(db_path, UPDATE_SQL, flush_interval_ms=60000)
+    first.add('k1', count=3, last_used='2026-01-01 00:00:01')
+    second.add('k1', count=4, last_used='2026-01-01 00:00:09')
+    first.close()
+    second.close()
+    assert rows(db_path)['k1'] == (7, '2026-01-01 00:00:09')
+
+
+def test_background_thread_flushes(db_path):
+    counters = WriteBehindCounters(db_path, UPDATE_SQL, flush_interval_ms=20)
+    counters.add('k2', count=2)
+    for _ in range(100):
+        if rows(db_path)['k2'][0] == 2:
+            break
+        counters._stop.wait(0.02)
+    assert rows(db_path)['k2'][0] == 2
+    counters.close()
+
+
+def test_forked_child_starts_empty(counters, db_path):
+    counters.add('k1', count=2, last_used='2026-01-01 00:00:01')
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            if counters.pending_keys == 0 and counters.flush():
+                counters.add('k2', last_used='2026-01-01 00:00:02')
+                counters.close()
+                code = 0
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+
+    counters.flush()
+    # The parent's deltas are written once, by the parent
+    assert rows(db_path) == {'k1': (2, '2026-01-01 00:00:01'), 'k2': (1, '2026-01-01 00:00:02')}
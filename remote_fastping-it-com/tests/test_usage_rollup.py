@@ -0,0 +1,171 @@
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from sqlite_pool import SQLitePool
+from usage_rollup import (UsageCompactor, ensure_rollup_schema, get_watermark, purge_raw, roll_up,
+                          usage_daily, usage_summary)
+
+USAGE_LOGS = '''
+    CREATE TABLE usage_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ip_address TEXT NOT NULL,
+        customer_id TEXT NOT NULL,
+        endpoint TEXT NOT NULL,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        response_time_ms REAL,
+        success BOOLEAN DEFAULT 1
+    )
+'''
+
+
+def ago(seconds):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(time.time() - seconds))
+
+
+def log(conn, customer_id, when, response_time_ms=10.0, success=1, endpoint='/ping'):
+    with conn:
+        conn.execute('INSERT INTO usage_logs (ip_address, customer_id, endpoint, timestamp, response_time_ms, success) '
+                     'VALUES (?, ?, ?, ?, ?, ?)', ('10.0.0.1', customer_id, endpoint, when, response_time_ms, success))
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'usage.db'))
+    conn.execute(USAGE_LOGS)
+    ensure_rollup_schema(conn)
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def fill(conn):
+    log(conn, 'c1', ago(86400 * 2), 3000.0, endpoint='/proxy')
+    log(conn, 'c1', ago(3600), 1.0)
+    log(conn, 'c1', ago(3600), 40.0, success=0)
+    log(conn, 'c1', ago(60), None)
+    log(conn, 'c2', ago(60), 5.0)
+
+
+def comparable(summary):
+    return {k: v for k, v in summary.items() if k != 'avg_latency_ms'}, summary['avg_latency_ms']
+
+
+def test_summary_is_the_same_before_and_after_roll_up(conn):
+    fill(conn)
+    before = usage_summary(conn, 'c1')
+    assert before['requests'] == 4
+    assert before['errors'] == 1
+    assert before['latency_count'] == 3
+    assert (before['latency_min_ms'], before['latency_max_ms']) == (1.0, 3000.0)
+    daily_before = usage_daily(conn, 'c1')
+
+    assert roll_up(conn) == 5
+    assert get_watermark(conn) == 5
+    after = usage_summary(conn, 'c1')
+    assert comparable(after)[0] == comparable(before)[0]
+    assert after['avg_latency_ms'] == pytest.approx(before['avg_latency_ms'])
+    assert usage_daily(conn, 'c1') == daily_before
+
+
+def test_rows_are_counted_once_including_late_ones(conn):
+    fill(conn)
+    roll_up(conn)
+    assert roll_up(conn) == 0
+    # Arrives after its minute was already rolled up
+    log(conn, 'c1', ago(3600), 2.0)
+    assert usage_summary(conn, 'c1')['requests'] == 5
+    assert roll_up(conn) == 1
+    assert usage_summary(conn, 'c1')['requests'] == 5
+
+
+def test_range_filters_match_raw_counts(conn):
+    fill(conn)
+    since = datetime.utcnow() - timedelta(hours=24)
+    raw = usage_summary(conn, 'c1', since)['requests']
+    roll_up(conn)
+    assert raw == usage_summary(conn, 'c1', since)['requests'] == 3
+    assert sum(day['requests'] for day in usage_daily(conn, 'c1', since)) == 3
+
+
+def test_purge_keeps_reports_exact(conn):
+    fill(conn)
+    roll_up(conn)
+    before = usage_summary(conn, 'c1')
+    assert purge_raw(conn, retention_seconds=86400) == 1
+    assert conn.execute('SELECT COUNT(*) FROM usage_logs').fetchone()[0] == 4
+    assert usage_summary(conn, 'c1')['requests'] == before['requests']
+
+
+def test_purge_never_deletes_rows_not_rolled_up(conn):
+    fill(conn)
+    assert purge_raw(conn, retention_seconds=0) == 0
+
+
+def test_reports_fall_back_to_raw_rows_without_rollup_tables(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'plain.db'))
+    conn.execute(USAGE_LOGS)
+    fill(conn)
+    assert usage_summary(conn, 'c1')['requests'] == 4
+    assert sum(day['requests'] for day in usage_daily(conn, 'c1')) == 4
+    # Reports never create tables
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert 'usage_rollups' not in tables and 'usage_rollup_state' not in tables
+    assert not conn.in_transaction
+
+
+def test_compactor_creates_schema_and_rolls_up(tmp_path):
+    path = str(tmp_path / 'compacted.db')
+    conn = sqlite3.connect(path)
+    conn.execute(USAGE_LOGS)
+    fill(conn)
+
+    compactor = UsageCompactor(SQLitePool(path, max_connections=1))
+    assert compactor.run_once() == {'rolled_up': 5, 'raw_deleted': 0, 'rollups_deleted': 0}
+    assert compactor.stats()['watermark'] == 5
+    assert usage_summary(conn, 'c2')['requests'] == 1
+
+
+
+def test_compactor_checks_out_a_connection_per_batch(tmp_path, monkeypatch):
+    import usage_rollup
+    path = str(tmp_path / 'batched.db')
+    conn = sqlite3.connect(path)
+    conn.execute(USAGE_LOGS)
+    for _ in range(5):
+        log(conn, 'c1', ago(10 * 86400))
+    monkeypatch.setattr(usage_rollup, 'ROLLUP_BATCH_ROWS', 2)
+    monkeypatch.setattr(usage_rollup, 'PURGE_BATCH_ROWS', 2)
+    pool = SQLitePool(path, max_connections=1)
+    compactor = UsageCompactor(pool)
+    before = pool.stats()['checkouts']
+
+    assert compactor.run_once() == {'rolled_up': 5, 'raw_deleted': 5, 'rollups_deleted': 0}
+    # 3 roll-up batches and the empty one, the purge limit, 3 purge batches, rollup retention
+    assert pool.stats()['checkouts'] - before == 9
+    assert usage_summary(conn, 'c1')['requests'] == 5
+
+def test_billing_database_gets_schema_and_compactor_at_startup(tmp_path, monkeypatch):
+    auto_ip_assign = pytest.importorskip('auto_ip_assign')
+    started = []
+    monkeypatch.setattr(UsageCompactor, 'start', lambda self: started.append(self))
+
+    manager = auto_ip_assign.CustomerResourceManager(str(tmp_path / 'customer_resources.db'))
+    assert started == [manager.usage_compactor]
+    conn = sqlite3.connect(manager.db_path)
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {'usage_logs', 'usage_rollups', 'usage_rollup_state'} <= tables
+
+    with conn:
+        conn.execute("INSERT INTO customers (customer_id, email, plan_type, monthly_quota) "
+                     "VALUES ('c1', 'c1@example.com', 'basic', 2)")
+    fill(conn)
+    start, end = datetime.utcnow() - timedelta(days=3), datetime.utcnow() + timedelta(minutes=1)
+    raw = manager.aggregate_usage_for_billing('c1', start, end)
+    manager.usage_compactor.run_once()
+    assert get_watermark(conn) == 5
+    rolled = manager.aggregate_usage_for_billing('c1', start, end)
+    assert raw.total_requests == rolled.total_requests == 4
+    assert rolled.overage_requests == 2
@@ -0,0 +1,107 @@
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from sqlite_pool import SQLitePool
+from usage_writer import BatchWriter
+
+INSERT_SQL = 'INSERT INTO usage_logs (customer_id, endpoint) VALUES (?, ?)'
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'usage.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE usage_logs (id INTEGER PRIMARY KEY, customer_id TEXT NOT NULL, endpoint TEXT)')
+    conn.commit()
+    conn.close()
+    return path
+
+
+def count(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM usage_logs').fetchone()[0]
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize('pooled', [False, True])
+def test_rows_are_written_in_batches(db_path, pooled):
+    pool = SQLitePool(db_path, max_connections=1) if pooled else None
+    writer = BatchWriter(db_path, INSERT_SQL, pool=pool, batch_size=100, flush_interval_ms=10000)
+    assert writer.submit_many(('c1', f'/e{i}') for i in range(250)) == 250
+    assert writer.flush()
+    assert count(db_path) == 250
+    stats = writer.stats()
+    assert (stats['written'], stats['dropped'], stats['failed']) == (250, 0, 0)
+    assert stats['batches'] >= 3
+    writer.close()
+
+
+def test_interval_flushes_a_partial_batch(db_path):
+    writer = BatchWriter(db_path, INSERT_SQL, batch_size=1000, flush_interval_ms=20)
+    writer.submit(('c1', '/ping'))
+    deadline = time.monotonic() + 2
+    while count(db_path) == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert count(db_path) == 1
+    writer.close()
+
+
+def test_full_queue_drops_instead_of_blocking(db_path, monkeypatch):
+    # Hold the writer thread so the queue stays full
+    release = threading.Event()
+    run = BatchWriter._run
+    monkeypatch.setattr(BatchWriter, '_run', lambda self: (release.wait(), run(self)))
+
+    writer = BatchWriter(db_path, INSERT_SQL, max_queue=5, batch_size=1000, flush_interval_ms=10000)
+    assert writer.submit_many(('c1', '/ping') for _ in range(50)) == 5
+    assert writer.stats()['dropped'] == 45
+    release.set()
+    writer.close()
+    assert count(db_path) == 5
+
+
+def test_failed_batch_is_counted_and_writer_keeps_going(db_path):
+    writer = BatchWriter(db_path, INSERT_SQL, batch_size=1, flush_interval_ms=10)
+    writer.submit((None, '/bad'))
+    writer.submit(('c1', '/good'))
+    assert writer.flush()
+    assert writer.stats()['failed'] == 1
+    assert count(db_path) == 1
+    writer.close()
+
+
+def test_close_writes_everything_queued(db_path):
+    writer = BatchWriter(db_path, INSERT_SQL, batch_size=1000, flush_interval_ms=10000)
+    writer.submit_many(('c1', '/ping') for _ in range(10))
+    writer.close()
+    assert count(db_path) == 10
+    assert writer.queue_depth == 0
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork()')
+def test_forked_child_gets_its_own_queue_and_thread(db_path):
+    writer = BatchWriter(db_path, INSERT_SQL, batch_size=1000, flush_interval_ms=10000)
+    writer.submit(('parent', '/ping'))
+    # Fork with the parent's writer idle: a thread inside sqlite3.connect() at fork
+    # time leaves SQLite's mutex held in the child
+    assert writer.flush()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            writer.submit(('child', '/ping'))
+            writer.close()
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    writer.close()
+
+    conn = sqlite3.connect(db_path)
+    rows = sorted(r[0] for r in conn.execute('SELECT customer_id FROM usage_logs'))
+    conn.close()
+    assert rows == ['child', 'parent']
@@ -0,0 +1,72 @@
+import pytest
+
+
+@pytest.fixture
+def manager(proxy_app, monkeypatch):
+    manager = proxy_app.whitelist_manager
+    manager.warm_up()
+    monkeypatch.setattr(manager, 'warmup', manager._new_warmup_state())
+    return manager
+
+
+def test_ready_once_snapshot_loads(proxy_app, manager):
+    assert not manager.is_ready
+    assert proxy_app.app.test_client().get('/ready').status_code == 503
+
+    assert manager.warm_up()
+    assert manager.is_ready
+    assert manager.warmup['state'] == 'ready'
+    assert manager.warmup['redis_fill']['state'] == 'filled'
+    assert proxy_app.app.test_client().get('/ready').status_code == 200
+
+
+def test_redis_outage_does_not_hold_readiness(proxy_app, manager, monkeypatch):
+    def redis_down(rows):
+        raise ConnectionError('Connection refused')
+    monkeypatch.setattr(manager, '_cache_rows', redis_down)
+
+    assert not manager.warm_up()
+    assert manager.is_ready
+    fill = manager.warmup['redis_fill']
+    assert (fill['state'], fill['error'], fill['attempts']) == ('failed', 'Connection refused', 1)
+
+    response = proxy_app.app.test_client().get('/ready')
+    assert response.status_code == 200
+    assert response.get_json()['redis_fill']['state'] == 'failed'
+
+    # The retry fills Redis once it is back, without flapping readiness
+    monkeypatch.setattr(manager, '_cache_rows', type(manager)._cache_rows.__get__(manager))
+    assert manager.warm_up()
+    assert manager.warmup['redis_fill']['state'] == 'filled'
+    assert manager.warmup['redis_fill']['attempts'] == 2
+
+
+def test_no_snapshot_is_not_ready(proxy_app, manager, monkeypatch):
+    monkeypatch.setattr(manager, 'snapshot', None)
+    monkeypatch.setattr(manager, 'reload_snapshot', lambda: False)
+
+    assert not manager.warm_up()
+    assert not manager.is_ready
+    assert manager.warmup['state'] == 'failed'
+    assert manager.warmup['redis_fill']['state'] == 'pending'
+    assert proxy_app.app.test_client().get('/ready').status_code == 503
+
+
+def test_fill_skipped_without_redis(proxy_app, manager, monkeypatch):
+    monkeypatch.setattr(proxy_app, 'REDIS_AVAILABLE', False)
+    assert manager.warm_up()
+    assert manager.is_ready
+    assert manager.warmup['redis_fill']['state'] == 'skipped'
+
+
+@pytest.mark.parametrize('method, path', [('post', '/admin/warm_up'), ('get', '/admin/stats')])
+def test_operator_endpoints_are_local_only(proxy_app, manager, monkeypatch, method, path):
+    warm_ups = []
+    monkeypatch.setattr(manager, 'warm_up', lambda: warm_ups.append(True) or True)
+    client = proxy_app.app.test_client()
+    remote = getattr(client, method)(path, environ_base={'REMOTE_ADDR': '93.184.216.34'})
+    relayed = getattr(client, method)(path, headers={'X-Forwarded-For': '93.184.216.34'})
+    assert (remote.status_code, relayed.status_code) == (404, 404)
+    assert warm_ups == []
+
+    assert getattr(client, method)(path).status_code == 200
@@ -0,0 +1,170 @@
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from whitelist_snapshot import NEVER_EXPIRES, WhitelistSnapshot, expiry_to_epoch, normalize_whitelist_entry
+
+FUTURE = (datetime.now() + timedelta(days=1)).isoformat()
+PAST = (datetime.now() - timedelta(days=1)).isoformat()
+
+
+def row(ip, customer='c1', expires_at=FUTURE, plan='basic', rate_limit=100):
+    return (ip, customer, plan, rate_limit, expires_at)
+
+
+def test_exact_lookup():
+    snapshot = WhitelistSnapshot([row('198.51.100.1'), row('198.51.100.2', 'c2', plan='premium')])
+    assert snapshot.lookup('198.51.100.1')['customer_id'] == 'c1'
+    assert snapshot.lookup('198.51.100.2') == {
+        'customer_id': 'c2', 'plan_type': 'premium', 'rate_limit': 100, 'expires_at': FUTURE}
+    assert snapshot.lookup('198.51.100.3') is None
+    assert '198.51.100.1' in snapshot
+    assert len(snapshot) == 2
+
+
+def test_expired_and_malformed_rows_are_skipped():
+    snapshot = WhitelistSnapshot([
+        row('198.51.100.1', expires_at=PAST),
+        row('198.51.100.2', expires_at='not a date'),
+        row('not an ip'),
+        row('198.51.100.4', expires_at=None),
+    ])
+    assert snapshot.lookup('198.51.100.1') is None
+    assert snapshot.lookup('198.51.100.2') is None
+    assert snapshot.lookup('198.51.100.4')['customer_id'] == 'c1'
+    assert len(snapshot) == 1
+
+
+def test_entries_stop_matching_once_expired(monkeypatch):
+    soon = datetime.now() + timedelta(seconds=30)
+    snapshot = WhitelistSnapshot([row('198.51.100.1', expires_at=soon.isoformat())])
+    assert snapshot.lookup('198.51.100.1') is not None
+    later = time.time() + 60
+    monkeypatch.setattr(time, 'time', lambda: later)
+    assert snapshot.lookup('198.51.100.1') is None
+
+
+def test_expirations_list_only_finite_expiries():
+    snapshot = WhitelistSnapshot([row('198.51.100.1'), row('198.51.100.2', expires_at='')])
+    assert snapshot.expirations() == (('198.51.100.1', expiry_to_epoch(FUTURE)),)
+
+
+@pytest.mark.parametrize('value, expected', [
+    (None, NEVER_EXPIRES),
+    ('', NEVER_EXPIRES),
+    (datetime(2030, 1, 1), int(datetime(2030, 1, 1).timestamp())),
+    ('2030-01-01T00:00:00', int(datetime(2030, 1, 1).timestamp())),
+])
+def test_expiry_to_epoch(value, expected):
+    assert expiry_to_epoch(value) == expected
+
+
+def test_snapshot_is_read_only():
+    snapshot = WhitelistSnapshot([row('198.51.100.1')])
+    with pytest.raises(TypeError):
+        snapshot._entries['198.51.100.9'] = None
+    with pytest.raises(AttributeError):
+        snapshot.extra = 1
+
+
+def test_from_connection_reads_active_rows_only(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'whitelist.db'))
+    conn.execute('''CREATE TABLE ip_whitelist (ip_address TEXT PRIMARY KEY, customer_id TEXT,
+                    plan_type TEXT, rate_limit INTEGER, expires_at TIMESTAMP, is_active BOOLEAN)''')
+    conn.executemany('INSERT INTO ip_whitelist VALUES (?, ?, ?, ?, ?, ?)', [
+        ('198.51.100.1', 'c1', 'basic', 100, FUTURE, 1),
+        ('198.51.100.2', 'c1', 'basic', 100, FUTURE, 0),
+    ])
+    snapshot = WhitelistSnapshot.from_connection(conn)
+    assert '198.51.100.1' in snapshot
+    assert '198.51.100.2' not in snapshot
+
+
+def test_cidr_entries_use_longest_prefix():
+    snapshot = WhitelistSnapshot([
+        row('10.1.0.0/16', 'wide'),
+        row('10.1.2.0/24', 'narrow', plan='premium'),
+        row('10.1.2.3', 'host'),
+    ])
+    assert snapshot.lookup('10.1.9.9')['customer_id'] == 'wide'
+    assert snapshot.lookup('10.1.2.9')['customer_id'] == 'narrow'
+    assert snapshot.lookup('10.1.2.3')['customer_id'] == 'host'
+    assert snapshot.lookup('10.2.0.1') is None
+    assert snapshot.network_count == 2
+    assert len(snapshot) == 3
+
+
+def test_expired_narrow_prefix_falls_back_to_wider_one(monkeypatch):
+    soon = (datetime.now() + timedelta(seconds=30)).isoformat()
+    snapshot = WhitelistSnapshot([row('10.1.0.0/16', 'wide'), row('10.1.2.0/24', 'narrow', expires_at=soon)])
+    assert snapshot.lookup('10.1.2.1')['customer_id'] == 'narrow'
+    later = time.time() + 60
+    monkeypatch.setattr(time, 'time', lambda: later)
+    assert snapshot.lookup('10.1.2.1')['customer_id'] == 'wide'
+
+
+def test_ipv6_networks_and_mapped_addresses():
+    snapshot = WhitelistSnapshot([row('2001:db8::/32', 'v6'), row('192.0.2.0/24', 'v4'), row('2001:db8::1', 'host')])
+    assert snapshot.lookup('2001:db8:ffff::1')['customer_id'] == 'v6'
+    assert snapshot.lookup('2001:0db8:0000::0001')['customer_id'] == 'host'
+    assert snapshot.lookup('::ffff:192.0.2.7')['customer_id'] == 'v4'
+    assert snapshot.lookup('2001:db9::1') is None
+    assert snapshot.lookup('garbage') is None
+
+
+def test_stored_rows_that_would_widen_are_skipped():
+    snapshot = WhitelistSnapshot([
+        row('0.0.0.0/0', 'everyone'),
+        row('10.0.0.0/8', 'too wide'),
+        row('203.0.113.7/24', 'host bits'),
+        row('2001:db8::/31', 'too wide v6'),
+    ])
+    assert len(snapshot) == 0
+    assert snapshot.lookup('203.0.113.200') is None
+    assert snapshot.lookup('10.1.1.1') is None
+
+
+def test_exact_entries_match_any_spelling_without_networks():
+    snapshot = WhitelistSnapshot([row('2001:db8::1'), row('192.0.2.1'), row('::ffff:192.0.2.2')])
+    assert snapshot.network_count == 0
+    assert snapshot.lookup('2001:DB8::1')['customer_id'] == 'c1'
+    assert snapshot.lookup('2001:db8:0::0001')['customer_id'] == 'c1'
+    assert snapshot.lookup('::ffff:192.0.2.1')['customer_id'] == 'c1'
+    assert snapshot.lookup('192.0.2.2')['customer_id'] == 'c1'
+    assert snapshot.lookup(None) is None
+
+
+@pytest.mark.parametrize('value, expected', [
+    (' 192.0.2.1 ', '192.0.2.1'),
+    ('192.0.2.1/32', '192.0.2.1'),
+    ('192.0.2.0/24', '192.0.2.0/24'),
+    ('10.1.0.0/16', '10.1.0.0/16'),
+    ('2001:0DB8::/32', '2001:db8::/32'),
+    ('::FFFF:192.0.2.1', '192.0.2.1'),
+])
+def test_normalize_whitelist_entry(value, expected):
+    assert normalize_whitelist_entry(value) == expected
+
+
+@pytest.mark.parametrize('value, message', [
+    ('192.0.2.77/24', 'has host bits set'),
+    ('203.0.113.7/8', 'has host bits set'),
+    ('0.0.0.0/0', 'wider than /16'),
+    ('10.0.0.0/8', 'wider than /16'),
+    ('::/0', 'wider than /32'),
+    ('2001:db8::/31', 'wider than /32'),
+    ('not an ip', 'does not appear to be'),
+])
+def test_normalize_whitelist_entry_rejects(value, message):
+    with pytest.raises(ValueError, match=message):
+        normalize_whitelist_entry(value)
+
+
+def test_admin_add_ip_names_the_bad_entry(proxy_app):
+    client = proxy_app.app.test_client()
+    response = client.post('/admin/add_ip', data={'ip_address': '203.0.113.7/8', 'customer_id': 'c1'})
+    assert response.status_code == 400
+    assert '203.0.113.7/8 has host bits set' in response.get_json()['message']
+    assert not proxy_app.whitelist_manager.is_ip_allowed('203.0.113.200')[0]
@@ -0,0 +1,128 @@
+"""
+Hierarchical Timing Wheel
+=========================
+
+O(1) schedule / cancel for large numbers of deadlines, driven by one periodic tick
+- Deadlines in time.monotonic() seconds, rounded up to whole ticks
+- Level 0 holds the next wheel_size ticks; each level above covers wheel_size times more
+- Coarse slots cascade down as their window comes up; beyond the top level an overflow set waits
+- Rescheduling a key replaces its previous deadline
+"""
+
+import math
+import threading
+import time
+from typing import Dict, Hashable, Iterable, List, Tuple
+
+class TimingWheel:
+    def __init__(self, tick_seconds: float = 1.0, wheel_size: int = 64, levels: int = 4):
+        self.tick_seconds = tick_seconds
+        self.wheel_size = wheel_size
+        self.levels = levels
+
+        self._spans = [wheel_size ** level for level in range(levels + 1)]
+        self._wheels = [[set() for _ in range(wheel_size)] for _ in range(levels)]
+        self._overflow = set()
+        self._due = set()
+        # key -> (deadline tick, level, slot); level -1 is overflow, -2 is due
+        self._locations: Dict[Hashable, Tuple[int, int, int]] = {}
+        self._current_tick = self._to_tick(time.monotonic())
+        self._lock = threading.Lock()
+
+    def _to_tick(self, monotonic_seconds: float) -> int:
+        return int(monotonic_seconds // self.tick_seconds)
+
+    def _place(self, key, tick: int):
+        delta = tick - self._current_tick
+        if delta <= 0:
+            self._due.add(key)
+            self._locations[key] = (tick, -2, 0)
+            return
+
+        for level in range(self.levels):
+            if delta < self._spans[level + 1]:
+                slot = (tick // self._spans[level]) % self.wheel_size
+                self._wheels[level][slot].add(key)
+                self._locations[key] = (tick, level, slot)
+                return
+
+        self._overflow.add(key)
+        self._locations[key] = (tick, -1, 0)
+
+    def _remove(self, key) -> bool:
+        location = self._locations.pop(key, None)
+        if location is None:
+            return False
+        _, level, slot = location
+        if level == -2:
+            self._due.discard(key)
+        elif level == -1:
+            self._overflow.discard(key)
+        else:
+            self._wheels[level][slot].discard(key)
+        return True
+
+    def schedule(self, key, deadline: float):
+        """Fire `key` at monotonic time `deadline`, replacing any earlier schedule"""
+        with self._lock:
+            self._remove(key)
+            self._place(key, math.ceil(deadline / self.tick_seconds))
+
+    def schedule_many(self, items: Iterable[Tuple[Hashable, float]]):
+        with self._lock:
+            for key, deadline in items:
+                self._remove(key)
+                self._place(key, math.ceil(deadline / self.tick_seconds))
+
+    def cancel(self, key) -> bool:
+        with self._lock:
+            return self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            for wheel in self._wheels:
+                for slot in wheel:
+                    slot.clear()
+            self._overflow.clear()
+            self._due.clear()
+            self._locations.clear()
+
+    def _cascade(self, keys: set):
+        for key in keys:
+            self._place(key, self._locations[key][0])
+
+    def advance(self, now: float = None) -> List[Hashable]:
+        """Move the wheel up to monotonic time `now`; returns the keys whose deadline passed"""
+        target = self._to_tick(time.monotonic() if now is None else now)
+        expired = []
+        with self._lock:
+            while True:
+                if self._due:
+                    expired.extend(self._due)
+                    for key in self._due:
+                        del self._locations[key]
+                    self._due = set()
+
+                if self._current_tick >= target:
+                    break
+                self._current_tick += 1
+                tick = self._current_tick
+
+                if tick % self._spans[self.levels] == 0 and self._overflow:
+                    overflow, self._overflow = self._overflow, set()
+                    self._cascade(overflow)
+                for level in range(self.levels - 1, 0, -1):
+                    if tick % self._spans[level] == 0:
+                        slot = (tick // self._spans[level]) % self.wheel_size
+                        keys, self._wheels[level][slot] = self._wheels[level][slot], set()
+                        self._cascade(keys)
+
+                slot = tick % self.wheel_size
+                keys, self._wheels[0][slot] = self._wheels[0][slot], set()
+                for key in keys:
+                    del self._locations[key]
+                expired.extend(keys)
+        return expired
+
+    def __len__(self) -> int:
+        return len(self._locations)
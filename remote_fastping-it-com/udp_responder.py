@@ -0,0 +1,118 @@
+"""
+UDP Ping Responder
+==================
+
+Sub-millisecond RTT probes for the C++ beacons, no HTTP in the way
+- Senders authorized through the same IPWhitelistManager snapshot
+- Same per-plan request limits, enforced with the host-wide shared-memory buckets
+  (a Redis round trip would cost more than the probe itself)
+- Every accepted datagram gets a timestamped echo
+- Usage rows collected per tick and handed to the write-behind logger in one batch
+- Non-whitelisted or rate-limited senders get no reply (no amplification for spoofed sources)
+
+Run:  python udp_responder.py            (listens on UDP_PORT)
+"""
+
+import asyncio
+import importlib
+import time
+
+import orjson
+
+# proxy-test-app.py isn't a valid module name for a plain import
+proxy_app = importlib.import_module('proxy-test-app')
+whitelist_manager = proxy_app.whitelist_manager
+
+UDP_HOST = '0.0.0.0'
+UDP_PORT = 9999  # Same port the C++ beacons and fastping_receiver use
+MAX_DATAGRAM_BYTES = 1400  # Larger probes are ignored rather than echoed
+USAGE_FLUSH_SECONDS = 1.0
+USAGE_ENDPOINT = 'udp_ping'
+
+class UDPPingProtocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.transport = None
+        self.pending_usage = []
+        self.stats = {
+            'received': 0,
+            'replied': 0,
+            'denied': 0,
+            'rate_limited': 0,
+            'oversized': 0
+        }
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr):
+        received_at = time.time()
+        self.stats['received'] += 1
+
+        if len(data) > MAX_DATAGRAM_BYTES:
+            self.stats['oversized'] += 1
+            return
+
+        client_ip = addr[0]
+        is_allowed, client_data = whitelist_manager.is_ip_allowed(client_ip)
+        if not is_allowed:
+            self.stats['denied'] += 1
+            return
+
+        rate_status = whitelist_manager.local_rate_limiter.check(
+            f"udp:{client_ip}", client_data['rate_limit'], client_data['plan_type']
+        )
+        if not rate_status.allowed:
+            self.stats['rate_limited'] += 1
+            self.pending_usage.append((client_ip, client_data['customer_id'], received_at, 0.0, False))
+            return
+
+        # Mostly variable, so plain orjson beats a pre-encoded template here
+        reply = orjson.dumps({'type': 'PONG', 'server_time': received_at,
+                              'echo': data.decode('utf-8', 'replace')})
+        self.transport.sendto(reply, addr)
+        self.stats['replied'] += 1
+        self.pending_usage.append((client_ip, client_data['customer_id'], received_at,
+                                   (time.time() - received_at) * 1000, True))
+
+    def flush_usage(self):
+        """Hand the tick's usage rows to the write-behind logger in one go"""
+        if not self.pending_usage:
+            return
+        rows, self.pending_usage = self.pending_usage, []
+        whitelist_manager.usage_writer.submit_many(
+            (client_ip, customer_id, USAGE_ENDPOINT,
+             time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(received_at)),
+             response_time_ms, success)
+            for client_ip, customer_id, received_at, response_time_ms, success in rows
+        )
+
+async def _flush_loop(protocol: UDPPingProtocol):
+    while True:
+        await asyncio.sleep(USAGE_FLUSH_SECONDS)
+        protocol.flush_usage()
+
+async def start_udp_responder(host: str = UDP_HOST, port: int = UDP_PORT):
+    """Bind the responder on the running loop; returns (transport, protocol, flush task)"""
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+        UDPPingProtocol, local_addr=(host, port)
+    )
+    flush_task = asyncio.create_task(_flush_loop(protocol))
+    return transport, protocol, flush_task
+
+async def main():
+    transport, protocol, flush_task = await start_udp_responder()
+    print(f"📡 UDP ping responder on {UDP_HOST}:{UDP_PORT}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        flush_task.cancel()
+        protocol.flush_usage()
+        transport.close()
+        print(f"📊 UDP responder stats: {protocol.stats}")
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,182 @@
+"""
+Pooled Upstream HTTP Client
+===========================
+
+Keep-alive connections for proxied calls, one requests.Session per upstream origin
+- Each origin (scheme://host:port) gets its own HTTPAdapter pool of pool_maxsize
+  connections, so repeat calls to the same origin skip the TCP/TLS handshake
+- Separate connect and read timeouts by default; callers can still pass their own
+- Origins idle longer than idle_seconds have their pools closed by a reaper thread;
+  at most max_hosts origins are kept, least recently used closed first
+- Sessions never store cookies, so nothing set by an upstream leaks between customers
+- Connection reuse per origin (requests served vs sockets opened) in stats()
+- Pools are per process; a forked worker starts with none
+"""
+
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from http.cookiejar import DefaultCookiePolicy
+from typing import Any, Dict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+class UpstreamClient:
+    def __init__(self, pool_maxsize: int = 20, connect_timeout: float = 5.0,
+                 read_timeout: float = 30.0, idle_seconds: float = 60.0,
+                 max_hosts: int = 256, pool_block: bool = False, name: str = 'upstream'):
+        self.pool_maxsize = pool_maxsize
+        self.timeout = (connect_timeout, read_timeout)
+        self.idle_seconds = idle_seconds
+        self.max_hosts = max_hosts
+        self.pool_block = pool_block
+        self.name = name
+
+        self._lock = threading.Lock()
+        # origin -> [session, last used monotonic]
+        self._sessions: 'OrderedDict[str, list]' = OrderedDict()
+        self._pid = None
+
+        self.requests = 0
+        self.errors = 0
+        self.reaped = 0
+        self.evicted = 0
+        # Pool counters of sessions already closed, so totals survive reaping
+        self._closed_requests = 0
+        self._closed_connections = 0
+
+        # The lock may be held by another thread at fork time
+        ref = weakref.ref(self)
+        os.register_at_fork(after_in_child=lambda: ref() is not None and ref()._after_fork())
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Inherited sockets belong to the parent; drop them without closing
+            self._sessions = OrderedDict()
+            self._pid = os.getpid()
+            reaper = threading.Thread(target=self._reap_loop, name=f'{self.name}-reaper', daemon=True)
+            reaper.start()
+
+    def _new_session(self) -> requests.Session:
+        session = requests.Session()
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        # A few pools per session so a cross-origin redirect doesn't evict the main one
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_maxsize,
+                              pool_block=self.pool_block, max_retries=0)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _session_for(self, url: str) -> requests.Session:
+        if self._pid != os.getpid():
+            self._ensure_started()
+        parts = urlsplit(url)
+        origin = f"{parts.scheme.lower()}://{parts.netloc.lower()}"
+
+        with self._lock:
+            entry = self._sessions.get(origin)
+            if entry is None:
+                entry = [self._new_session(), 0.0]
+                self._sessions[origin] = entry
+                while len(self._sessions) > self.max_hosts:
+                    _, (old_session, _) = self._sessions.popitem(last=False)
+                    self._close_session(old_session)
+                    self.evicted += 1
+            else:
+                self._sessions.move_to_end(origin)
+            entry[1] = time.monotonic()
+            return entry[0]
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Same arguments as requests.request; timeout defaults to (connect, read)"""
+        kwargs.setdefault('timeout', self.timeout)
+        session = self._session_for(url)
+        self.requests += 1
+        try:
+            return session.request(method, url, **kwargs)
+        except Exception:
+            self.errors += 1
+            raise
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    @staticmethod
+    def _pool_counts(session: requests.Session):
+        """(requests served, connections opened) across a session's urllib3 pools"""
+        served = opened = 0
+        for adapter in set(session.adapters.values()):
+            for key in list(adapter.poolmanager.pools.keys()):
+                pool = adapter.poolmanager.pools.get(key)
+                if pool is not None:
+                    served += pool.num_requests
+                    opened += pool.num_connections
+        return served, opened
+
+    def _close_session(self, session: requests.Session):
+        served, opened = self._pool_counts(session)
+        self._closed_requests += served
+        self._closed_connections += opened
+        # Connections still checked out (streamed bodies) are closed when released
+        session.close()
+
+    def reap_idle(self) -> int:
+        """Close the pools of origins unused for idle_seconds"""
+        if self._pid != os.getpid():
+            return 0
+        cutoff = time.monotonic() - self.idle_seconds
+        closed = 0
+        with self._lock:
+            for origin in [o for o, (_, last_used) in self._sessions.items() if last_used < cutoff]:
+                session, _ = self._sessions.pop(origin)
+                self._close_session(session)
+                closed += 1
+            self.reaped += closed
+        return closed
+
+    def _reap_loop(self):
+        interval = max(1.0, self.idle_seconds / 2)
+        while True:
+            time.sleep(interval)
+            try:
+                self.reap_idle()
+            except Exception as e:
+                print(f"Error reaping idle upstream pools: {e}")
+
+    def close(self):
+        with self._lock:
+            while self._sessions:
+                _, (session, _) = self._sessions.popitem()
+                self._close_session(session)
+
+    def stats(self, top_hosts: int = 10) -> Dict[str, Any]:
+        with self._lock:
+            hosts = {origin: self._pool_counts(session)
+                     for origin, (session, _) in self._sessions.items()}
+            served = self._closed_requests + sum(s for s, _ in hosts.values())
+            opened = self._closed_connections + sum(o for _, o in hosts.values())
+        busiest = sorted(hosts.items(), key=lambda item: item[1][0], reverse=True)[:top_hosts]
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'connections_opened': opened,
+            'connections_reused': max(0, served - opened),
+            'reuse_rate': (served - opened) / served if served else 0.0,
+            'open_hosts': len(hosts),
+            'max_hosts': self.max_hosts,
+            'pool_maxsize': self.pool_maxsize,
+            'timeout': {'connect': self.timeout[0], 'read': self.timeout[1]},
+            'idle_seconds': self.idle_seconds,
+            'reaped': self.reaped,
+            'evicted': self.evicted,
+            'hosts': {origin: {'requests': s, 'connections_opened': o} for origin, (s, o) in busiest}
+        }
@@ -0,0 +1,144 @@
+"""
+Write-Behind Usage Counters
+===========================
+
+Per-key request counts and last-used times, aggregated in memory
+- add() is a dict update under a lock; nothing touches the database on the request path
+- One background thread per process flushes every key's delta in a single
+  executemany transaction
+- Deltas are added to the stored value and last-used keeps the later time, so
+  any number of processes can flush into the same rows
+- A failed flush keeps its deltas for the next attempt; close() (also run at exit)
+  flushes what's left
+"""
+
+import atexit
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from typing import Any, Dict, Optional
+
+class WriteBehindCounters:
+    def __init__(self, db_path: str, update_sql: str, flush_interval_ms: int = 1000,
+                 name: str = 'counter-writer'):
+        """`update_sql` takes (count delta, last-used timestamp, key) per row"""
+        self.db_path = db_path
+        self.update_sql = update_sql
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: Dict[str, list] = {}
+        self._pid = None
+        self._stop: Optional[threading.Event] = None
+        self._thread: Optional[threading.Thread] = None
+
+        self.added = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.last_flush_ms = 0.0
+
+        atexit.register(self.close)
+        # Locks held by another thread at fork time would stay held in the child
+        ref = weakref.ref(self)
+        os.register_at_fork(after_in_child=lambda: ref() is not None and ref()._after_fork())
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def _ensure_started(self):
+        # A forked child inherits the parent's unflushed deltas; the parent flushes
+        # those, so the child starts empty with its own thread
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pending = {}
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def add(self, key: str, count: int = 1, last_used: Optional[str] = None):
+        """Count `count` uses of `key`; last_used defaults to now (UTC, CURRENT_TIMESTAMP format)"""
+        if self._pid != os.getpid():
+            self._ensure_started()
+        if last_used is None:
+            last_used = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                self._pending[key] = [count, last_used]
+            else:
+                entry[0] += count
+                if last_used > entry[1]:
+                    entry[1] = last_used
+            self.added += count
+
+    def flush(self) -> bool:
+        """Write every pending delta in one transaction; on failure they stay pending"""
+        if self._pid != os.getpid():
+            return True
+
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return True
+
+            start = time.perf_counter()
+            rows = [(count, last_used, key) for key, (count, last_used) in pending.items()]
+            try:
+                conn = sqlite3.connect(self.db_path, timeout=30)
+                try:
+                    with conn:
+                        conn.executemany(self.update_sql, rows)
+                finally:
+                    conn.close()
+            except Exception as e:
+                self.failed_flushes += 1
+                print(f"Error flushing {len(rows)} counters in {self.name}: {e}")
+                with self._lock:
+                    for key, (count, last_used) in pending.items():
+                        entry = self._pending.setdefault(key, [0, last_used])
+                        entry[0] += count
+                        if last_used > entry[1]:
+                            entry[1] = last_used
+                return False
+
+            self.flushed += sum(row[0] for row in rows)
+            self.flushes += 1
+            self.last_flush_ms = (time.perf_counter() - start) * 1000
+            return True
+
+    def _run(self):
+        stop = self._stop
+        while not stop.wait(self.flush_interval):
+            self.flush()
+
+    def close(self, timeout: float = 5.0):
+        """Stop the flusher and write whatever is still pending"""
+        if self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self.flush()
+
+    @property
+    def pending_keys(self) -> int:
+        return len(self._pending) if self._pid == os.getpid() else 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'pending_keys': self.pending_keys,
+            'added': self.added,
+            'flushed': self.flushed,
+            'flushes': self.flushes,
+            'failed_flushes': self.failed_flushes,
+            'last_flush_ms': round(self.last_flush_ms, 3)
+        }
@@ -0,0 +1,378 @@
+"""
+Usage Roll-ups and Retention
+============================
+
+Keeps usage_logs from growing forever while reports stay exact
+- Raw rows are rolled into per-customer, per-endpoint, per-minute aggregates:
+  request count, errors, latency count/sum/min/max and a latency histogram
+- Roll-up is incremental by row id (a watermark), so each raw row is counted exactly
+  once, late-arriving rows included
+- Raw rows older than the retention window are deleted once rolled up; aggregates
+  have their own, longer retention
+- Reports read the aggregates plus the raw rows past the watermark. That tail stays
+  small only while a UsageCompactor runs against the same database; without one,
+  every row is past the watermark and reports cost a raw scan, as before
+- The schema is created at start-up (ensure_rollup_schema, run by UsageCompactor);
+  reports never create tables, and read raw rows only if it is missing
+- Time ranges are epoch seconds (or datetimes, naive ones taken as UTC) and are
+  answered at minute granularity
+"""
+
+import calendar
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Union
+
+RAW_RETENTION_SECONDS = 7 * 24 * 3600  # Raw usage rows kept this long after roll-up
+ROLLUP_RETENTION_DAYS = 400  # Minute aggregates kept this long (covers yearly billing)
+ROLLUP_INTERVAL_SECONDS = 60
+ROLLUP_BATCH_ROWS = 50000  # Raw rows aggregated per write transaction
+PURGE_BATCH_ROWS = 10000  # Raw rows deleted per write transaction
+# Upper bounds (ms) of the latency histogram buckets; one more bucket catches the rest
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+WATERMARK_KEY = 'usage_logs.rolled_through_id'
+
+_BUCKET_COLUMNS = [f'h{i}' for i in range(len(LATENCY_BUCKETS_MS) + 1)]
+_MINUTE_EXPR = "COALESCE(CAST(strftime('%s', timestamp) AS INTEGER) / 60, 0)"
+
+def _bucket_expressions() -> List[str]:
+    expressions = []
+    lower = None
+    for upper in LATENCY_BUCKETS_MS:
+        if lower is None:
+            condition = f'response_time_ms <= {upper}'
+        else:
+            condition = f'response_time_ms > {lower} AND response_time_ms <= {upper}'
+        expressions.append(f'COUNT(CASE WHEN {condition} THEN 1 END)')
+        lower = upper
+    expressions.append(f'COUNT(CASE WHEN response_time_ms > {lower} THEN 1 END)')
+    return expressions
+
+# Same aggregate shape whether it reads raw rows or merges minute rows
+_RAW_AGGREGATES = ', '.join([
+    'COUNT(*)', 'COUNT(CASE WHEN success = 0 THEN 1 END)', 'COUNT(response_time_ms)', 'TOTAL(response_time_ms)',
+    'MIN(response_time_ms)', 'MAX(response_time_ms)'] + _bucket_expressions())
+_ROLLUP_AGGREGATES = ', '.join([
+    'SUM(requests)', 'SUM(errors)', 'SUM(latency_count)', 'TOTAL(latency_sum_ms)',
+    'MIN(latency_min_ms)', 'MAX(latency_max_ms)'] + [f'SUM({c})' for c in _BUCKET_COLUMNS])
+
+_ROLLUP_SQL = f'''
+    INSERT INTO usage_rollups (customer_id, endpoint, minute, requests, errors, latency_count,
+                               latency_sum_ms, latency_min_ms, latency_max_ms, {', '.join(_BUCKET_COLUMNS)})
+    SELECT customer_id, endpoint, {_MINUTE_EXPR}, {_RAW_AGGREGATES}
+    FROM usage_logs
+    WHERE id > ? AND id <= ?
+    GROUP BY 1, 2, 3
+    ON CONFLICT (customer_id, minute, endpoint) DO UPDATE SET
+        requests = requests + excluded.requests,
+        errors = errors + excluded.errors,
+        latency_count = latency_count + excluded.latency_count,
+        latency_sum_ms = latency_sum_ms + excluded.latency_sum_ms,
+        latency_min_ms = min(COALESCE(latency_min_ms, excluded.latency_min_ms),
+                             COALESCE(excluded.latency_min_ms, latency_min_ms)),
+        latency_max_ms = max(COALESCE(latency_max_ms, excluded.latency_max_ms),
+                             COALESCE(excluded.latency_max_ms, latency_max_ms)),
+        {', '.join(f'{c} = {c} + excluded.{c}' for c in _BUCKET_COLUMNS)}
+'''
+
+def ensure_rollup_schema(conn):
+    """Create the aggregate and watermark tables if this database doesn't have them yet"""
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS usage_rollups (
+            customer_id TEXT NOT NULL,
+            minute INTEGER NOT NULL,
+            endpoint TEXT NOT NULL,
+            requests INTEGER NOT NULL DEFAULT 0,
+            errors INTEGER NOT NULL DEFAULT 0,
+            latency_count INTEGER NOT NULL DEFAULT 0,
+            latency_sum_ms REAL NOT NULL DEFAULT 0,
+            latency_min_ms REAL,
+            latency_max_ms REAL,
+            {', '.join(f'{c} INTEGER NOT NULL DEFAULT 0' for c in _BUCKET_COLUMNS)},
+            PRIMARY KEY (customer_id, minute, endpoint)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_usage_rollups_minute ON usage_rollups (minute)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS usage_rollup_state (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    ''')
+
+def get_watermark(conn) -> int:
+    """Highest usage_logs id already counted in the aggregates"""
+    row = conn.execute('SELECT value FROM usage_rollup_state WHERE key = ?', (WATERMARK_KEY,)).fetchone()
+    return row[0] if row else 0
+
+@contextmanager
+def _consistent_read(conn):
+    """One read transaction, so a compactor run can't move rows between the two halves of a report"""
+    if conn.in_transaction:
+        yield
+        return
+    conn.execute('BEGIN')
+    try:
+        yield
+    finally:
+        conn.rollback()
+
+def _report_watermark(conn) -> Optional[int]:
+    """Watermark for a report, or None if this database has no roll-up tables"""
+    try:
+        return get_watermark(conn)
+    except sqlite3.OperationalError:
+        return None
+
+def _to_epoch(value: Union[None, int, float, datetime]) -> Optional[float]:
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if value.tzinfo is None:
+        return calendar.timegm(value.timetuple())
+    return value.timestamp()
+
+def _empty_totals() -> Dict[str, Any]:
+    return {'requests': 0, 'errors': 0, 'latency_count': 0, 'latency_sum_ms': 0.0,
+            'latency_min_ms': None, 'latency_max_ms': None,
+            'histogram': [0] * len(_BUCKET_COLUMNS)}
+
+def _merge(totals: Dict[str, Any], row) -> Dict[str, Any]:
+    requests, errors, latency_count, latency_sum, latency_min, latency_max, *buckets = row
+    if not requests:
+        return totals
+    totals['requests'] += requests
+    totals['errors'] += errors or 0
+    totals['latency_count'] += latency_count or 0
+    totals['latency_sum_ms'] += latency_sum or 0.0
+    if latency_min is not None:
+        current = totals['latency_min_ms']
+        totals['latency_min_ms'] = latency_min if current is None else min(current, latency_min)
+    if latency_max is not None:
+        current = totals['latency_max_ms']
+        totals['latency_max_ms'] = latency_max if current is None else max(current, latency_max)
+    totals['histogram'] = [a + (b or 0) for a, b in zip(totals['histogram'], buckets)]
+    return totals
+
+def _finish(totals: Dict[str, Any]) -> Dict[str, Any]:
+    requests = totals['requests']
+    totals['successful'] = requests - totals['errors']
+    totals['avg_latency_ms'] = (totals['latency_sum_ms'] / totals['latency_count']
+                                if totals['latency_count'] else None)
+    totals['histogram'] = [
+        {'le': upper, 'count': count}
+        for upper, count in zip(list(LATENCY_BUCKETS_MS) + ['+Inf'], totals['histogram'])
+    ]
+    return totals
+
+def _range_filters(since, until):
+    """Minute-range SQL for the aggregate and raw-tail queries, and their shared params"""
+    rollup_sql, raw_sql, params = '', '', []
+    since, until = _to_epoch(since), _to_epoch(until)
+    if since is not None:
+        rollup_sql += ' AND minute >= ?'
+        raw_sql += f' AND {_MINUTE_EXPR} >= ?'
+        params.append(int(since // 60))
+    if until is not None:
+        rollup_sql += ' AND minute < ?'
+        raw_sql += f' AND {_MINUTE_EXPR} < ?'
+        params.append(int(-(-until // 60)))
+    return rollup_sql, raw_sql, params
+
+def usage_summary(conn, customer_id: str, since=None, until=None) -> Dict[str, Any]:
+    """Totals for one customer over [since, until): aggregates plus the un-rolled tail"""
+    rollup_sql, raw_sql, params = _range_filters(since, until)
+
+    totals = _empty_totals()
+    with _consistent_read(conn):
+        watermark = _report_watermark(conn)
+        if watermark is not None:
+            _merge(totals, conn.execute(
+                f'SELECT {_ROLLUP_AGGREGATES} FROM usage_rollups WHERE customer_id = ?{rollup_sql}',
+                [customer_id] + params).fetchone())
+        _merge(totals, conn.execute(
+            f'SELECT {_RAW_AGGREGATES} FROM usage_logs WHERE id > ? AND customer_id = ?{raw_sql}',
+            [watermark or 0, customer_id] + params).fetchone())
+    return _finish(totals)
+
+def usage_daily(conn, customer_id: str, since=None, until=None) -> List[Dict[str, Any]]:
+    """Per-UTC-day requests and average latency, newest day first"""
+    rollup_sql, raw_sql, params = _range_filters(since, until)
+
+    days = {}
+    with _consistent_read(conn):
+        watermark = _report_watermark(conn)
+        queries = [
+            (f'''SELECT date(timestamp), COUNT(*), COUNT(response_time_ms), TOTAL(response_time_ms)
+                 FROM usage_logs WHERE id > ? AND customer_id = ?{raw_sql} GROUP BY 1''',
+             [watermark or 0, customer_id] + params),
+        ]
+        if watermark is not None:
+            queries.append(
+                (f'''SELECT date(minute * 60, 'unixepoch'), SUM(requests), SUM(latency_count), TOTAL(latency_sum_ms)
+                     FROM usage_rollups WHERE customer_id = ?{rollup_sql} GROUP BY 1''',
+                 [customer_id] + params))
+        for sql, params in queries:
+            for day, requests, latency_count, latency_sum in conn.execute(sql, params):
+                entry = days.setdefault(day, [0, 0, 0.0])
+                entry[0] += requests
+                entry[1] += latency_count
+                entry[2] += latency_sum
+
+    return [
+        {'date': day, 'requests': requests,
+         'avg_latency_ms': latency_sum / latency_count if latency_count else None}
+        for day, (requests, latency_count, latency_sum) in sorted(days.items(), reverse=True)
+    ]
+
+def _roll_up_batch(conn, batch_rows: int) -> Optional[int]:
+    """Roll up one batch past the watermark; rows rolled up, or None when there were none"""
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        watermark = get_watermark(conn)
+        upper = conn.execute(
+            'SELECT MAX(id) FROM (SELECT id FROM usage_logs WHERE id > ? ORDER BY id LIMIT ?)',
+            (watermark, batch_rows)).fetchone()[0]
+        if upper is None:
+            return None
+        conn.execute(_ROLLUP_SQL, (watermark, upper))
+        conn.execute('INSERT OR REPLACE INTO usage_rollup_state (key, value) VALUES (?, ?)',
+                     (WATERMARK_KEY, upper))
+        return conn.execute('SELECT COUNT(*) FROM usage_logs WHERE id > ? AND id <= ?',
+                            (watermark, upper)).fetchone()[0]
+
+def roll_up(conn, batch_rows: int = ROLLUP_BATCH_ROWS) -> int:
+    """Fold raw rows past the watermark into the aggregates; returns rows rolled up
+
+    Each batch is one IMMEDIATE transaction that reads and advances the watermark,
+    so concurrent compactors (one per worker) never count a row twice.
+    """
+    rolled = 0
+    while True:
+        count = _roll_up_batch(conn, batch_rows)
+        if count is None:
+            return rolled
+        rolled += count
+
+def _purge_limit(conn, retention_seconds: float) -> int:
+    """Highest raw row id that is both rolled up and older than the retention window
+
+    Ids grow with time, so everything below the first row still inside the window
+    goes; finding that row only walks the rows about to be deleted.
+    """
+    cutoff = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(time.time() - retention_seconds))
+    watermark = get_watermark(conn)
+    first_kept = conn.execute(
+        'SELECT id FROM usage_logs WHERE id <= ? AND timestamp >= ? ORDER BY id LIMIT 1',
+        (watermark, cutoff)).fetchone()
+    return first_kept[0] - 1 if first_kept else watermark
+
+def _purge_batch(conn, limit: int, batch_rows: int) -> int:
+    with conn:
+        return conn.execute(
+            'DELETE FROM usage_logs WHERE id IN (SELECT id FROM usage_logs WHERE id <= ? ORDER BY id LIMIT ?)',
+            (limit, batch_rows)).rowcount
+
+def purge_raw(conn, retention_seconds: float = RAW_RETENTION_SECONDS,
+              batch_rows: int = PURGE_BATCH_ROWS) -> int:
+    """Delete rolled-up raw rows older than the retention window; returns rows deleted"""
+    limit = _purge_limit(conn, retention_seconds)
+    deleted = 0
+    while True:
+        count = _purge_batch(conn, limit, batch_rows)
+        deleted += count
+        if count < batch_rows:
+            return deleted
+
+def purge_rollups(conn, retention_days: float = ROLLUP_RETENTION_DAYS) -> int:
+    oldest_minute = int((time.time() - retention_days * 86400) // 60)
+    with conn:
+        return conn.execute('DELETE FROM usage_rollups WHERE minute < ?', (oldest_minute,)).rowcount
+
+class UsageCompactor:
+    """Background roll-up and retention for the usage_logs table behind `pool`"""
+
+    def __init__(self, pool, interval_seconds: float = ROLLUP_INTERVAL_SECONDS,
+                 raw_retention_seconds: float = RAW_RETENTION_SECONDS,
+                 rollup_retention_days: float = ROLLUP_RETENTION_DAYS):
+        self.pool = pool
+        self.interval = interval_seconds
+        self.raw_retention_seconds = raw_retention_seconds
+        self.rollup_retention_days = rollup_retention_days
+
+        self.runs = 0
+        self.rows_rolled_up = 0
+        self.raw_rows_deleted = 0
+        self.rollup_rows_deleted = 0
+        self.last_run_at = None
+        self.last_duration_seconds = None
+        self.last_error = None
+
+        with pool.transaction() as conn:
+            ensure_rollup_schema(conn)
+
+    def run_once(self) -> Dict[str, int]:
+        # A connection per batch rather than per run: a fork in this process waits
+        # for checked-out connections, and should only ever wait out one batch
+        started = time.time()
+        rolled = 0
+        while True:
+            with self.pool.connection() as conn:
+                count = _roll_up_batch(conn, ROLLUP_BATCH_ROWS)
+            if count is None:
+                break
+            rolled += count
+
+        with self.pool.connection() as conn:
+            limit = _purge_limit(conn, self.raw_retention_seconds)
+        raw_deleted = 0
+        while True:
+            with self.pool.connection() as conn:
+                count = _purge_batch(conn, limit, PURGE_BATCH_ROWS)
+            raw_deleted += count
+            if count < PURGE_BATCH_ROWS:
+                break
+
+        with self.pool.connection() as conn:
+            rollups_deleted = purge_rollups(conn, self.rollup_retention_days)
+
+        self.runs += 1
+        self.rows_rolled_up += rolled
+        self.raw_rows_deleted += raw_deleted
+        self.rollup_rows_deleted += rollups_deleted
+        self.last_run_at = started
+        self.last_duration_seconds = round(time.time() - started, 3)
+        return {'rolled_up': rolled, 'raw_deleted': raw_deleted, 'rollups_deleted': rollups_deleted}
+
+    def start(self):
+        thread = threading.Thread(target=self._run, name='usage-compactor', daemon=True)
+        thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.run_once()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Usage roll-up error: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self.pool.connection() as conn:
+            watermark = get_watermark(conn)
+        return {
+            'runs': self.runs,
+            'rows_rolled_up': self.rows_rolled_up,
+            'raw_rows_deleted': self.raw_rows_deleted,
+            'rollup_rows_deleted': self.rollup_rows_deleted,
+            'watermark': watermark,
+            'last_run_at': self.last_run_at,
+            'last_duration_seconds': self.last_duration_seconds,
+            'last_error': self.last_error,
+            'raw_retention_seconds': self.raw_retention_seconds,
+            'rollup_retention_days': self.rollup_retention_days
+        }
@@ -0,0 +1,200 @@
+"""
+Write-Behind Batch Writer
+=========================
+
+Takes SQLite inserts off the request path
+- Bounded in-memory queue, drained by one background thread per process
+- Rows written with executemany in a single transaction
+- Flushes every N rows or M milliseconds, whichever comes first
+- Drop counters when the queue is full, flush on shutdown
+"""
+
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+import weakref
+from typing import Dict, Any, Iterable, Optional, Tuple
+
+_STOP = object()
+
+class _FlushRequest:
+    __slots__ = ('done',)
+
+    def __init__(self):
+        self.done = threading.Event()
+
+class BatchWriter:
+    def __init__(self, db_path: str, insert_sql: str, pool=None, max_queue: int = 50000,
+                 batch_size: int = 500, flush_interval_ms: int = 250,
+                 put_timeout_ms: int = 0, name: str = 'batch-writer'):
+        self.db_path = db_path
+        self.insert_sql = insert_sql
+        self.pool = pool
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.put_timeout = put_timeout_ms / 1000.0
+        self.name = name
+
+        self._start_lock = threading.Lock()
+        self._pid = None
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_batch_ms = 0.0
+
+        atexit.register(self.close)
+        # A thread holding the start lock at fork time would leave it held in the child
+        ref = weakref.ref(self)
+        os.register_at_fork(after_in_child=lambda: ref() is not None and ref()._after_fork())
+
+    def _after_fork(self):
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        # Threads and queues don't survive fork(); each process gets its own
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def submit(self, row: Tuple) -> bool:
+        """Queue one row for writing; returns False if it was dropped"""
+        if self._pid != os.getpid():
+            self._ensure_started()
+
+        try:
+            if self.put_timeout > 0:
+                self._queue.put(row, timeout=self.put_timeout)
+            else:
+                self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+        self.enqueued += 1
+        return True
+
+    def submit_many(self, rows: Iterable[Tuple]) -> int:
+        """Queue several rows; returns how many were accepted"""
+        return sum(1 for row in rows if self.submit(row))
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Block until everything queued so far has been written"""
+        if self._pid != os.getpid():
+            return True
+        request = _FlushRequest()
+        try:
+            self._queue.put(request, timeout=timeout)
+        except queue.Full:
+            return False
+        return request.done.wait(timeout)
+
+    def close(self, timeout: float = 5.0):
+        """Flush remaining rows and stop the writer thread"""
+        if self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            print(f"⚠️ {self.name}: queue full at shutdown, {self._queue.qsize()} rows may be lost")
+            return
+        self._thread.join(timeout)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._pid == os.getpid() else 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'queue_depth': self.queue_depth,
+            'queue_capacity': self.max_queue,
+            'enqueued': self.enqueued,
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'batches': self.batches,
+            'last_batch_ms': round(self.last_batch_ms, 3)
+        }
+
+    def _write(self, conn: Optional[sqlite3.Connection], batch: list):
+        start = time.perf_counter()
+        try:
+            if conn is None:
+                # Pooled: check a connection out for this batch only
+                with self.pool.transaction() as pooled:
+                    pooled.executemany(self.insert_sql, batch)
+            else:
+                with conn:
+                    conn.executemany(self.insert_sql, batch)
+            self.written += len(batch)
+            self.batches += 1
+        except Exception as e:
+            self.failed += len(batch)
+            print(f"Error writing {len(batch)} rows in {self.name}: {e}")
+        self.last_batch_ms = (time.perf_counter() - start) * 1000
+
+    def _run(self):
+        work_queue = self._queue
+        conn = sqlite3.connect(self.db_path, timeout=30) if self.pool is None else None
+        batch = []
+        waiters = []
+        stopping = False
+
+        while not stopping:
+            deadline = None
+            while len(batch) < self.batch_size:
+                timeout = None
+                if deadline is not None:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+
+                try:
+                    item = work_queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+
+                if item is _STOP:
+                    stopping = True
+                    break
+                if isinstance(item, _FlushRequest):
+                    waiters.append(item)
+                    break
+
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            if batch:
+                self._write(conn, batch)
+                batch = []
+            for waiter in waiters:
+                waiter.done.set()
+            waiters = []
+
+        # Drain anything still queued behind the stop marker
+        while True:
+            try:
+                item = work_queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, _FlushRequest):
+                item.done.set()
+            elif item is not _STOP:
+                batch.append(item)
+        if batch:
+            self._write(conn, batch)
+        if conn is not None:
+            conn.close()
@@ -0,0 +1,236 @@
+"""
+In-Process Whitelist Snapshot
+=============================
+
+Immutable view of every active ip_whitelist row, held in process memory
+- Built from SQLite in one pass, swapped atomically on change
+- Expiry stored as epoch integers (no datetime parsing on lookup)
+- Finite expiries listed per entry, for scheduling proactive eviction
+- Exact addresses are a single dict probe
+- CIDR entries (IPv4 and IPv6) answered by longest-prefix match on a radix trie
+- Networks must be exact (no host bits) and no wider than MIN_PREFIXLEN
+"""
+
+import ipaddress
+import time
+from array import array
+from datetime import datetime
+from types import MappingProxyType
+from typing import Optional, Dict, Any, Iterable, Tuple
+
+# Rows without an expiry never expire
+NEVER_EXPIRES = 2 ** 63 - 1
+
+SNAPSHOT_QUERY = '''
+    SELECT ip_address, customer_id, plan_type, rate_limit, expires_at
+    FROM ip_whitelist
+    WHERE is_active = 1
+'''
+
+# Shortest prefix a whitelist network may have; anything wider is almost certainly a typo
+MIN_PREFIXLEN = {4: 16, 6: 32}
+
+def parse_whitelist_entry(value: str):
+    """Network for an address or CIDR entry; a bare address is a single-host network
+
+    Raises ValueError for malformed entries, networks with host bits set (widening
+    203.0.113.7/8 to 203.0.0.0/8 would whitelist far more than was asked for) and
+    prefixes shorter than MIN_PREFIXLEN.
+    """
+    value = value.strip()
+    network = ipaddress.ip_network(value)
+    if network.prefixlen == network.max_prefixlen and network.version == 6:
+        mapped = network.network_address.ipv4_mapped
+        if mapped is not None:
+            # Lookups unwrap mapped addresses, so store them as plain IPv4
+            network = ipaddress.ip_network(mapped)
+    min_prefixlen = MIN_PREFIXLEN[network.version]
+    if network.prefixlen < min_prefixlen:
+        raise ValueError(f"{value} is wider than /{min_prefixlen}")
+    return network
+
+def normalize_whitelist_entry(value: str) -> str:
+    """Canonical form of an address or network: hosts as bare addresses, networks as CIDR"""
+    network = parse_whitelist_entry(value)
+    if network.prefixlen == network.max_prefixlen:
+        return str(network.network_address)
+    return str(network)
+
+def expiry_to_epoch(expires_at) -> int:
+    """Convert a stored expires_at value (ISO string or datetime) to epoch seconds"""
+    if expires_at is None or expires_at == '':
+        return NEVER_EXPIRES
+    if isinstance(expires_at, datetime):
+        return int(expires_at.timestamp())
+    return int(datetime.fromisoformat(str(expires_at)).timestamp())
+
+class PrefixTrie:
+    """Binary radix trie over integer addresses, stored as flat arrays of child indexes
+
+    Lookup walks at most `depth` bits, where depth is the longest prefix
+    inserted, so cost is O(prefix length) regardless of entry count.
+    """
+
+    __slots__ = ('bits', 'depth', '_zero', '_one', '_values')
+
+    def __init__(self, bits: int):
+        self.bits = bits
+        self.depth = 0
+        # Node 0 is the root; a child index of 0 means "no child"
+        self._zero = [0]
+        self._one = [0]
+        self._values = [None]
+
+    def insert(self, network_int: int, prefixlen: int, value):
+        node = 0
+        for shift in range(self.bits - 1, self.bits - 1 - prefixlen, -1):
+            children = self._one if (network_int >> shift) & 1 else self._zero
+            child = children[node]
+            if not child:
+                child = len(self._values)
+                self._zero.append(0)
+                self._one.append(0)
+                self._values.append(None)
+                children[node] = child
+            node = child
+
+        self._values[node] = value
+        self.depth = max(self.depth, prefixlen)
+
+    def freeze(self):
+        """Pack child links into typed arrays once building is done"""
+        self._zero = array('I', self._zero)
+        self._one = array('I', self._one)
+
+    def longest_match(self, address_int: int, now: float):
+        """Deepest unexpired (expires_ts, data) value on the address's path"""
+        zero, one, values = self._zero, self._one, self._values
+        node = 0
+        best = None
+
+        value = values[0]
+        if value is not None and value[0] > now:
+            best = value
+
+        for shift in range(self.bits - 1, self.bits - 1 - self.depth, -1):
+            node = one[node] if (address_int >> shift) & 1 else zero[node]
+            if not node:
+                break
+            value = values[node]
+            if value is not None and value[0] > now:
+                best = value
+
+        return best
+
+    def __len__(self) -> int:
+        return sum(1 for value in self._values if value is not None)
+
+class WhitelistSnapshot:
+    """Read-only ip -> client data mapping, never mutated after construction"""
+
+    __slots__ = ('_entries', '_v4', '_v6', '_network_count', '_expirations', 'built_at')
+
+    def __init__(self, rows: Iterable[Tuple]):
+        now = int(time.time())
+        entries = {}
+        v4 = PrefixTrie(32)
+        v6 = PrefixTrie(128)
+        network_count = 0
+        expirations = []
+
+        for ip_address, customer_id, plan_type, rate_limit, expires_at in rows:
+            try:
+                expires_ts = expiry_to_epoch(expires_at)
+            except (TypeError, ValueError):
+                continue
+
+            if expires_ts <= now:
+                continue
+
+            try:
+                network = parse_whitelist_entry(ip_address)
+            except (AttributeError, ValueError):
+                continue
+
+            value = (expires_ts, {
+                'customer_id': customer_id,
+                'plan_type': plan_type,
+                'rate_limit': rate_limit,
+                'expires_at': expires_at if isinstance(expires_at, str) else str(expires_at)
+            })
+
+            if network.prefixlen == network.max_prefixlen:
+                key = str(network.network_address)
+                entries[key] = value
+            else:
+                key = str(network)
+                trie = v4 if network.version == 4 else v6
+                trie.insert(int(network.network_address), network.prefixlen, value)
+                network_count += 1
+
+            if expires_ts != NEVER_EXPIRES:
+                expirations.append((key, expires_ts))
+
+        v4.freeze()
+        v6.freeze()
+        self._entries = MappingProxyType(entries)
+        self._v4 = v4
+        self._v6 = v6
+        self._network_count = network_count
+        self._expirations = tuple(expirations)
+        self.built_at = time.time()
+
+    @classmethod
+    def from_connection(cls, conn) -> 'WhitelistSnapshot':
+        cursor = conn.cursor()
+        cursor.execute(SNAPSHOT_QUERY)
+        return cls(cursor.fetchall())
+
+    def lookup(self, ip_address: str) -> Optional[Dict[str, Any]]:
+        """Return client data for an active, unexpired IP, else None"""
+        now = time.time()
+        entry = self._entries.get(ip_address)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        # Any other spelling of the address (case, zero padding, IPv4-mapped) is
+        # retried in canonical form whether or not there are networks to match
+        entry = self._match_network(ip_address, now)
+        if entry is not None:
+            return entry[1]
+        return None
+
+    def _match_network(self, ip_address: str, now: float):
+        try:
+            address = ipaddress.ip_address(ip_address)
+        except ValueError:
+            return None
+
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+
+        # Exact entries are keyed canonically; retry if the caller's spelling differs
+        canonical = str(address)
+        if canonical != ip_address:
+            entry = self._entries.get(canonical)
+            if entry is not None and entry[0] > now:
+                return entry
+
+        if not self._network_count:
+            return None
+        trie = self._v4 if address.version == 4 else self._v6
+        return trie.longest_match(int(address), now)
+
+    def expirations(self) -> Tuple[Tuple[str, int], ...]:
+        """(entry, expires epoch) for every entry that expires"""
+        return self._expirations
+
+    @property
+    def network_count(self) -> int:
+        return self._network_count
+
+    def __len__(self) -> int:
+        return len(self._entries) + self._network_count
+
+    def __contains__(self, ip_address: str) -> bool:
+        return self.lookup(ip_address) is not None